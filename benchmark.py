@@ -0,0 +1,384 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from modules.await_graph import Graph
+from modules.lock_manager import LockManager
+from modules.operation import OperationType
+from modules.profiling import PhaseProfiler
+from modules.retry import RetryPolicy
+from modules.transaction import Transaction
+from modules.workload import WorkloadGenerator
+
+
+SCENARIOS = {
+    "uniform": {
+        "transactions": 500,
+        "operations_per_transaction": 4,
+        "zipf_skew": 0.0,
+        "depth": 4,
+        "fan_out": 6,
+    },
+    "hot_keys": {
+        "transactions": 500,
+        "operations_per_transaction": 4,
+        "zipf_skew": 1.2,
+        "depth": 4,
+        "fan_out": 6,
+    },
+    "write_heavy": {
+        "transactions": 500,
+        "operations_per_transaction": 4,
+        "operation_mix": {
+            OperationType.READ: 0.2,
+            OperationType.UPDATE: 0.2,
+            OperationType.WRITE: 0.6,
+        },
+        "zipf_skew": 0.8,
+        "depth": 4,
+        "fan_out": 6,
+    },
+    "mixed_granularity": {
+        "transactions": 500,
+        "operations_per_transaction": 3,
+        "zipf_skew": 0.8,
+        "depth": 4,
+        "fan_out": 6,
+        "level_mix": {2: 0.1, 3: 0.3, 4: 0.6},
+    },
+    "deep_hierarchy": {
+        "transactions": 300,
+        "operations_per_transaction": 4,
+        "zipf_skew": 0.5,
+        "depth": 7,
+        "fan_out": 3,
+    },
+}
+
+METRICS_TO_COMPARE = [
+    "operations_per_second",
+    "commit_rate",
+    "abort_rate",
+    "deadlocks",
+    "wait_time_p50",
+    "wait_time_p99",
+    "peak_memory_bytes",
+    "peak_lock_manager_bytes",
+    "peak_await_graph_bytes",
+    "peak_granularity_graph_bytes",
+]
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of the values (0 if there are none).
+    """
+
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def granularity_graph_size(granularity_graph):
+    """
+    Approximates the bytes used by the hierarchy nodes and their lock tables.
+    """
+
+    total = 0
+    stack = [granularity_graph.root]
+
+    while stack:
+        node = stack.pop()
+        total += sys.getsizeof(node) + sys.getsizeof(node.__dict__)
+        total += sys.getsizeof(node.locks) + sys.getsizeof(node.children)
+        total += sum(sys.getsizeof(holders) for holders in node.locks.values())
+        stack.extend(node.children)
+
+    return total
+
+
+def await_graph_size(await_graph):
+    """
+    Approximates the bytes used by the wait-for graph (excluding the transactions).
+    """
+
+    total = sys.getsizeof(await_graph.vertices)
+    for data in await_graph.vertices.values():
+        total += sys.getsizeof(data) + sys.getsizeof(data["edges"])
+
+    return total
+
+
+def lock_manager_size(lock_manager):
+    """
+    Approximates the bytes used by the lock manager's own state (the schedule it builds).
+    """
+
+    total = sys.getsizeof(lock_manager.operations_order)
+    for entry in lock_manager.operations_order:
+        total += sys.getsizeof(entry)
+        operation = entry[1]
+        if not isinstance(operation, str):
+            total += sys.getsizeof(operation) + sys.getsizeof(operation.__dict__)
+
+    return total
+
+
+def run_schedule(generator, schedule, on_operation=None, profiler=None, max_retries=None):
+    """
+    Feeds the schedule to a fresh lock manager. Returns the lock manager and the transactions.
+    With max_retries, aborted transactions are restarted (without backoff, the schedule
+    itself is the clock) and the remaining restarts are run once the schedule ends.
+    """
+
+    await_graph = Graph()
+    retry_policy = None
+    if max_retries is not None:
+        retry_policy = RetryPolicy(max_retries=max_retries, base_delay=0, seed=0)
+    lock_manager = LockManager(
+        generator.granularity_graph, await_graph, retry_policy=retry_policy
+    )
+    transactions = {}
+
+    if profiler is not None:
+        profiler.enable(lock_manager)
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for position, (transaction_index, node, operation_type) in enumerate(schedule):
+            transaction = transactions.get(transaction_index)
+            if transaction is None:
+                transaction = Transaction(lock_manager, await_graph)
+                transactions[transaction_index] = transaction
+
+            transaction.create_operation(node, operation_type)
+
+            if on_operation is not None:
+                on_operation(position, lock_manager)
+
+        while lock_manager.restart_timers:
+            lock_manager.run_restarts(math.inf)
+
+    if profiler is not None:
+        profiler.disable()
+
+    return lock_manager, transactions
+
+
+def run_scenario(parameters, sample_every=100, profile=False, max_retries=None):
+    """
+    Runs a scenario twice: once for timing and once under tracemalloc for memory
+    (plus a third, profiled run if requested).
+    """
+
+    # Timing run (each run gets a fresh hierarchy, locks live on the nodes)
+    generator = WorkloadGenerator(**parameters)
+    schedule = generator.generate()
+
+    start = time.perf_counter()
+    lock_manager, transactions = run_schedule(generator, schedule, max_retries=max_retries)
+    elapsed = time.perf_counter() - start
+
+    executed_operations = sum(
+        1 for _, operation in lock_manager.operations_order if not isinstance(operation, str)
+    )
+    commits = sum(1 for transaction in transactions.values() if transaction.state == "committed")
+    aborts = sum(1 for transaction in transactions.values() if transaction.state == "aborted")
+    wait_times = [
+        wait_time
+        for transaction in transactions.values()
+        for wait_time in transaction.wait_times
+    ]
+
+    # Memory run
+    generator = WorkloadGenerator(**parameters)
+    schedule = generator.generate()
+    peaks = {"lock_manager": 0, "await_graph": 0, "granularity_graph": 0, "await_graph_vertices": 0}
+
+    def sample(position, lock_manager):
+        if position % sample_every:
+            return
+        peaks["lock_manager"] = max(peaks["lock_manager"], lock_manager_size(lock_manager))
+        peaks["await_graph"] = max(peaks["await_graph"], await_graph_size(lock_manager.await_graph))
+        peaks["granularity_graph"] = max(
+            peaks["granularity_graph"], granularity_graph_size(lock_manager.granularity_graph)
+        )
+        peaks["await_graph_vertices"] = max(
+            peaks["await_graph_vertices"], len(lock_manager.await_graph.vertices)
+        )
+
+    tracemalloc.start()
+    run_schedule(generator, schedule, sample, max_retries=max_retries)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    metrics = {
+        "transactions": len(transactions),
+        "scheduled_operations": len(schedule),
+        "executed_operations": executed_operations,
+        "elapsed_seconds": elapsed,
+        "operations_per_second": executed_operations / elapsed if elapsed else 0.0,
+        "commits": commits,
+        "aborts": aborts,
+        "stuck": len(transactions) - commits - aborts,
+        "commit_rate": commits / len(transactions) if transactions else 0.0,
+        "abort_rate": aborts / len(transactions) if transactions else 0.0,
+        "deadlocks": lock_manager.metrics.deadlocks,
+        "restarts": lock_manager.metrics.restarts,
+        "waits": len(wait_times),
+        "wait_time_p50": percentile(wait_times, 0.50),
+        "wait_time_p99": percentile(wait_times, 0.99),
+        "peak_memory_bytes": peak_memory,
+        "peak_lock_manager_bytes": peaks["lock_manager"],
+        "peak_await_graph_bytes": peaks["await_graph"],
+        "peak_await_graph_vertices": peaks["await_graph_vertices"],
+        "peak_granularity_graph_bytes": peaks["granularity_graph"],
+        "peak_await_graph_edges": lock_manager.metrics.peak_await_graph_edges,
+        "hot_nodes": lock_manager.metrics.top_hot_nodes(5),
+    }
+
+    # Profiled run, kept apart so the phase timers do not skew the throughput numbers
+    if profile:
+        generator = WorkloadGenerator(**parameters)
+        profiler = PhaseProfiler()
+        run_schedule(
+            generator, generator.generate(), profiler=profiler, max_retries=max_retries
+        )
+        metrics["phases"] = profiler.to_dict()
+
+    return metrics
+
+
+def serializable_parameters(parameters):
+    """
+    Converts the scenario parameters to plain JSON values.
+    """
+
+    result = dict(parameters)
+    if "operation_mix" in result:
+        result["operation_mix"] = {
+            operation_type.name: weight
+            for operation_type, weight in result["operation_mix"].items()
+        }
+    if "level_mix" in result:
+        result["level_mix"] = {str(level): weight for level, weight in result["level_mix"].items()}
+    return result
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare_results(previous, current):
+    """
+    Prints the relative change of each metric against a previous results file.
+    """
+
+    print(f"\nComparison against {previous.get('commit', 'unknown')}:")
+
+    for name, scenario in current["scenarios"].items():
+        previous_scenario = previous.get("scenarios", {}).get(name)
+        if previous_scenario is None:
+            print(f"- {name}: no previous results")
+            continue
+
+        print(f"- {name}:")
+        for metric in METRICS_TO_COMPARE:
+            old_value = previous_scenario["metrics"].get(metric)
+            new_value = scenario["metrics"].get(metric)
+            if old_value is None or new_value is None:
+                continue
+
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            print(f"    {metric}: {old_value:.6g} -> {new_value:.6g} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lock manager benchmark suite.")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Scenario to run (repeatable, default: all).",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplier applied to the number of transactions.",
+    )
+    parser.add_argument("--output", help="Results file (default: benchmark_results/<commit>.json).")
+    parser.add_argument("--compare", help="Previous results file to compare against.")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Also record per-phase timing histograms of the lock requests.",
+    )
+    parser.add_argument(
+        "--retry",
+        type=int,
+        metavar="N",
+        help="Restart aborted transactions up to N times.",
+    )
+    args = parser.parse_args()
+
+    # Wake-ups re-enter execute_operations recursively, long waiting chains need a deeper stack
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+
+    commit = current_commit()
+    results = {
+        "commit": commit,
+        "date": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "scenarios": {},
+    }
+
+    for name in args.scenario or list(SCENARIOS):
+        parameters = dict(SCENARIOS[name])
+        parameters["transactions"] = max(1, int(parameters["transactions"] * args.scale))
+
+        metrics = run_scenario(parameters, profile=args.profile, max_retries=args.retry)
+        results["scenarios"][name] = {
+            "parameters": serializable_parameters(parameters),
+            "metrics": metrics,
+        }
+
+        print(
+            f"{name}: {metrics['operations_per_second']:.0f} ops/s, "
+            f"commits {metrics['commit_rate']:.1%}, aborts {metrics['abort_rate']:.1%}, "
+            f"deadlocks {metrics['deadlocks']}, "
+            f"wait p50/p99 {metrics['wait_time_p50'] * 1e6:.0f}/{metrics['wait_time_p99'] * 1e6:.0f} us, "
+            f"peak memory {metrics['peak_memory_bytes'] / 1024:.0f} KiB"
+        )
+
+    output = args.output or os.path.join("benchmark_results", f"{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare_results(json.load(file), results)
+
+
+if __name__ == "__main__":
+    main()
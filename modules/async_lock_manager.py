@@ -0,0 +1,280 @@
+import asyncio
+
+from modules.lock import Lock, LockType
+from modules.lock_manager import LockManager, deadline_order
+from modules.transaction import Transaction
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.await_graph import Graph
+from modules.operation import Operation, OperationType
+from modules.errors import DeadlockVictimError, LockTimeoutError
+
+
+class AsyncLockManager(LockManager):
+    PROFILED_PHASES = {
+        **LockManager.PROFILED_PHASES,
+        "deadlock_detection": ("await_graph.has_path",),
+    }
+
+    def __init__(
+        self,
+        granularity_graph: GranularityGraph,
+        await_graph: Graph,
+        lock_timeout=None,
+        timeout_action="abort",
+        wal=None,
+        verbose=True,
+    ):
+        """
+        Lock manager for asyncio services.
+
+        A conflicting `acquire` suspends the calling task on a future until the blocking
+        transaction commits or aborts, instead of returning False. All calls must come from
+        the same event loop; `Transaction.create_operation` must not be mixed in. A request
+        that times out raises LockTimeoutError and, as in LockManager, aborts its transaction;
+        with `timeout_action="fail"` the transaction keeps its locks and can go on.
+        """
+
+        super().__init__(
+            granularity_graph,
+            await_graph,
+            lock_timeout=lock_timeout,
+            timeout_action=timeout_action,
+            wal=wal,
+            verbose=verbose,
+        )
+        self.waiters = {}  # blocking transaction_id -> set of waiting transactions
+
+    def begin(self):
+        """
+        Starts a new transaction.
+        """
+
+        transaction = Transaction(self, self.await_graph)
+        self.prepare_transaction(transaction)
+        return transaction
+
+    def prepare_transaction(self, transaction):
+        """
+        Gives the transaction its wait and commit state.
+        """
+
+        transaction.waiter = None
+        transaction.waiting_on = None
+        transaction.committing = False  # Its commit is logged, waiting for the disk
+
+    async def acquire(
+        self,
+        transaction: Transaction,
+        node: GranularityGraphNode,
+        operation_type: OperationType,
+        timeout=None,
+    ):
+        """
+        Acquires (or promotes to) the lock needed by the operation, waiting until it is granted.
+        Raises DeadlockVictimError if the transaction is aborted to break a deadlock and
+        LockTimeoutError if the timeout (in seconds) expires. Cancelling the task withdraws
+        the request; the transaction keeps the locks it already holds.
+        """
+
+        lock_type = Lock.get_lock_type_based_on_operation(operation_type)
+        await self._acquire(
+            transaction, node, lock_type, timeout, Operation(operation_type, node)
+        )
+        return True
+
+    async def _acquire(self, transaction, node, lock_type, timeout=None, operation=None):
+        loop = asyncio.get_running_loop()
+        if timeout is None:
+            timeout = self._lock_timeout_for(transaction, operation)
+        deadline = None if timeout is None else loop.time() + timeout
+
+        while True:
+            if transaction.state == "aborted":
+                raise DeadlockVictimError(transaction)
+
+            blocking_transaction = self.try_lock(transaction, node, lock_type)
+            if blocking_transaction is True:
+                if operation is not None:
+                    self.operations_order.append((transaction, operation))
+                return
+
+            self.metrics.record_block(node, lock_type)
+            self._add_wait_edge(transaction, blocking_transaction)
+            transaction.block_transaction(node, lock_type)
+            transaction.wait_deadline = deadline
+
+            victim = self._resolve_deadlock(transaction, blocking_transaction)
+            if victim is transaction:
+                raise DeadlockVictimError(transaction)
+            if transaction.waiting_on is None:
+                # The blocker was the victim and its locks are already released
+                transaction.unblock_transaction()
+                continue
+
+            future = loop.create_future()
+            transaction.waiter = future
+
+            try:
+                if deadline is None:
+                    await future
+                else:
+                    await asyncio.wait_for(future, max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                self.metrics.record_timeout(node, lock_type)
+                if self.timeout_action == "abort":
+                    self.abort(transaction)
+                raise LockTimeoutError(transaction, node) from None
+            finally:
+                transaction.waiter = None
+                self._remove_wait_edge(transaction)
+                if transaction.state == "blocked":
+                    transaction.unblock_transaction()
+
+    def _add_wait_edge(self, transaction, blocking_transaction):
+        self.await_graph.add_edge(
+            transaction.transaction_id, blocking_transaction.transaction_id
+        )
+        transaction.waiting_on = blocking_transaction.transaction_id
+        self.waiters.setdefault(blocking_transaction.transaction_id, set()).add(
+            transaction
+        )
+        self.metrics.observe_await_graph(self.await_graph)
+
+    def _remove_wait_edge(self, transaction):
+        blocking_id = transaction.waiting_on
+        if blocking_id is None:
+            return
+
+        waiting = self.waiters.get(blocking_id)
+        if waiting is not None:
+            waiting.discard(transaction)
+            if not waiting:
+                del self.waiters[blocking_id]
+
+        vertex = self.await_graph.vertices.get(transaction.transaction_id)
+        if vertex is not None and blocking_id in vertex["edges"]:
+            self.await_graph.remove_edge(transaction.transaction_id, blocking_id)
+
+        transaction.waiting_on = None
+
+    def _resolve_deadlock(self, transaction, blocking_transaction):
+        """
+        Checks if the new edge closed a cycle and aborts a victim if so.
+        Only the blocker's reachable part of the graph is searched.
+        """
+
+        if not self.await_graph.has_path(
+            blocking_transaction.transaction_id, transaction.transaction_id
+        ):
+            return None
+
+        victim, reason = self._choose_victim(transaction, blocking_transaction)
+        self.metrics.record_deadlock(reason)
+        self.abort(victim)
+        return victim
+
+    async def commit(self, transaction: Transaction, timeout=None):
+        """
+        Certifies the transaction's writes (waiting for readers to finish, as in 2V2PL),
+        then releases all of its locks.
+        """
+
+        for node, lock_type in list(transaction.locks_held.items()):
+            if lock_type == LockType.WL:
+                await self._acquire(transaction, node, LockType.CL, timeout)
+
+        if self.wal is not None:
+            self.wal.log_certify(transaction)
+            lsn = self.wal.append_commit(transaction)
+            transaction.committing = True
+            # The fsync runs in a worker thread: the loop keeps serving, and commits logged
+            # meanwhile share it (group commit)
+            flush = asyncio.get_running_loop().run_in_executor(None, self.wal.flush, lsn)
+            try:
+                await asyncio.shield(flush)
+            finally:
+                if flush.done():
+                    self._finish(transaction, "committed", "Commited")
+                else:
+                    # Cancelled mid-flush: the commit is already logged and abort() refuses
+                    # it, so the locks are released as soon as the flush lands
+                    flush.add_done_callback(
+                        lambda _: self._finish(transaction, "committed", "Commited")
+                    )
+        else:
+            self._finish(transaction, "committed", "Commited")
+
+    def abort(self, transaction: Transaction):
+        """
+        Aborts the transaction. If it is waiting for a lock, its `acquire` raises
+        DeadlockVictimError.
+        """
+
+        if transaction.state in ("committed", "aborted") or transaction.committing:
+            return  # A logged commit cannot be taken back
+
+        waiter = transaction.waiter
+        self._remove_wait_edge(transaction)
+        if self.wal is not None:
+            self.wal.log_abort(transaction)
+        self._finish(transaction, "aborted", "Aborted")
+
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(DeadlockVictimError(transaction))
+
+    def _finish(self, transaction, state, label):
+        """
+        Releases every lock of the transaction and wakes the transactions waiting for it.
+        """
+
+        self.release_all_locks(transaction)
+        transaction.state = state
+        self.operations_order.append((transaction, label))
+
+        waiting_transactions = sorted(
+            self.waiters.pop(transaction.transaction_id, ()), key=deadline_order
+        )
+        for waiting_transaction in waiting_transactions:
+            self.await_graph.remove_edge(
+                waiting_transaction.transaction_id, transaction.transaction_id
+            )
+            waiting_transaction.waiting_on = None
+            if waiting_transaction.waiter is not None and not waiting_transaction.waiter.done():
+                waiting_transaction.waiter.set_result(None)
+
+        self.await_graph.remove_vertex(transaction.transaction_id)
+        self.metrics.observe_await_graph(self.await_graph)
+
+
+if __name__ == "__main__":
+    import io
+    from contextlib import redirect_stdout
+
+    granularity_graph = GranularityGraph()
+    table_node = GranularityGraphNode("Table1")
+    tuple_node1 = GranularityGraphNode("Tuple1")
+    tuple_node2 = GranularityGraphNode("Tuple2")
+    granularity_graph.add_node(granularity_graph.root, table_node)
+    granularity_graph.add_node(table_node, tuple_node1)
+    granularity_graph.add_node(table_node, tuple_node2)
+
+    lock_manager = AsyncLockManager(granularity_graph, Graph())
+
+    async def client(first, second):
+        transaction = lock_manager.begin()
+        try:
+            await lock_manager.acquire(transaction, first, OperationType.WRITE)
+            await asyncio.sleep(0)
+            await lock_manager.acquire(transaction, second, OperationType.WRITE, timeout=1)
+            await lock_manager.commit(transaction)
+        except DeadlockVictimError as error:
+            print(error)
+
+    async def main():
+        # Both clients write the two tuples in opposite order: one of them becomes a deadlock victim
+        await asyncio.gather(client(tuple_node1, tuple_node2), client(tuple_node2, tuple_node1))
+
+    with redirect_stdout(io.StringIO()):
+        asyncio.run(main())
+
+    lock_manager.print_schedule_order()
@@ -4,6 +4,7 @@ from queue import SimpleQueue
 class Graph:
     def __init__(self):
         self.vertices = {}
+        self.edge_count = 0
 
     def add_vertex(self, transaction):
         """
@@ -24,6 +25,7 @@ class Graph:
             return False
 
         self.vertices[source]["edges"].append(destination)
+        self.edge_count += 1
         return True
 
     def remove_edge(self, source, destination):
@@ -32,6 +34,15 @@ class Graph:
         """
 
         self.vertices[source]["edges"].remove(destination)
+        self.edge_count -= 1
+
+    def remove_vertex(self, transaction_id):
+        """
+        Removes a vertex and its outgoing edges from the graph.
+        """
+
+        data = self.vertices.pop(transaction_id)
+        self.edge_count -= len(data["edges"])
 
     def display_graph(self):
         """
@@ -87,6 +98,31 @@ class Graph:
 
         return False
 
+    def has_path(self, source, destination):
+        """
+        Checks if destination can be reached from source. Used to test whether a new edge
+        destination -> source closes a cycle without scanning the whole graph.
+        """
+
+        visited = {source}
+        stack = [source]
+
+        while stack:
+            vertex = stack.pop()
+            if vertex == destination:
+                return True
+
+            data = self.vertices.get(vertex)
+            if data is None:
+                continue
+
+            for neighbor in data["edges"]:
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    stack.append(neighbor)
+
+        return False
+
     def get_waiting_transactions(self, transaction_id):
         """
         Returns a list of transactions that are waiting for the given transaction_id.
@@ -0,0 +1,474 @@
+import threading
+import time
+
+from modules.lock import Lock, LockType
+from modules.lock_manager import (
+    INTENTION_CONFLICTS,
+    INTENTION_LOCKS,
+    LockManager,
+    deadline_order,
+)
+from modules.transaction import Transaction
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.await_graph import Graph
+from modules.operation import Operation, OperationType
+from modules.errors import DeadlockVictimError, LockTimeoutError
+
+
+class ThreadSafeLockManager(LockManager):
+    PROFILED_PHASES = {
+        **LockManager.PROFILED_PHASES,
+        "intention_backpropagation": ("_add_intention",),
+        "front_propagation": (),  # Descendants get no copy of the lock
+        "deadlock_detection": ("await_graph.has_path",),
+        "release": ("_finish",),
+    }
+
+    def __init__(
+        self,
+        granularity_graph: GranularityGraph,
+        await_graph: Graph,
+        stripes=64,
+        lock_timeout=None,
+        timeout_action="abort",
+        wal=None,
+        verbose=True,
+    ):
+        """
+        Lock manager that can be driven by many client threads at once.
+
+        Node lock tables are guarded by latches striped by node hash, and a thread never
+        holds more than one stripe latch, so threads cannot deadlock on latches. A request
+        walks from the root down to its node, taking its intention lock on each ancestor
+        under that ancestor's latch, and is then checked and granted under the latch of its
+        node alone. Locks are not copied onto descendants: the intention locks of a
+        transaction on a node (counted per lock below it) stand for its locks in the subtree.
+        The wait-for graph has its own latch and is never held together with stripes.
+        Blocked requests wait on a per-transaction event instead of returning False.
+
+        Transactions must be created with `begin` and driven with `acquire`, `commit` and
+        `abort`; `Transaction.create_operation` is not synchronized. A request that times out
+        raises LockTimeoutError and, as in LockManager, aborts its transaction; with
+        `timeout_action="fail"` the transaction keeps its locks and can go on.
+        Key-range locks are not supported.
+        """
+
+        super().__init__(
+            granularity_graph,
+            await_graph,
+            lock_timeout=lock_timeout,
+            timeout_action=timeout_action,
+            wal=wal,
+            verbose=verbose,
+        )
+        self.latches = [threading.Lock() for _ in range(stripes)]
+        self.waiters = [set() for _ in range(stripes)]  # Guarded by the stripe latch
+        self.await_graph_latch = threading.Lock()
+
+    def _stripe(self, node: GranularityGraphNode):
+        return hash(node) % len(self.latches)
+
+    def _latch(self, stripes):
+        for stripe in stripes:
+            self.latches[stripe].acquire()
+
+    def _unlatch(self, stripes):
+        for stripe in reversed(stripes):
+            self.latches[stripe].release()
+
+    def call_with_running_transactions(self, action):
+        """
+        Calls action with the running transactions while every stripe is latched, so that no
+        lock table changes during the call.
+        """
+
+        stripes = list(range(len(self.latches)))
+        self._latch(stripes)
+        try:
+            with self.await_graph_latch:
+                transactions = [data["transaction"] for data in self.await_graph.vertices.values()]
+            return action(transactions)
+        finally:
+            self._unlatch(stripes)
+
+    def begin(self):
+        """
+        Starts a new transaction.
+        """
+
+        with self.await_graph_latch:
+            transaction = Transaction(self, self.await_graph)
+
+        self.prepare_transaction(transaction)
+        return transaction
+
+    def prepare_transaction(self, transaction):
+        """
+        Gives the transaction its wake-up event and intention lock counts.
+        """
+
+        transaction.wakeup = threading.Event()
+        transaction.abort_requested = False
+        transaction.intention_counts = {}  # (node, intention lock type) -> its locks below
+
+    def acquire(
+        self,
+        transaction: Transaction,
+        node: GranularityGraphNode,
+        operation_type: OperationType,
+        timeout=None,
+    ):
+        """
+        Acquires (or promotes to) the lock needed by the operation, blocking the calling thread
+        until it is granted. Raises DeadlockVictimError if the transaction is aborted to break a
+        deadlock and LockTimeoutError if the timeout (in seconds) expires.
+        """
+
+        lock_type = Lock.get_lock_type_based_on_operation(operation_type)
+        self._acquire(transaction, node, lock_type, timeout, Operation(operation_type, node))
+        return True
+
+    def _acquire(self, transaction, node, lock_type, timeout=None, operation=None):
+        if timeout is None:
+            timeout = self._lock_timeout_for(transaction, operation)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        taken = []  # Ancestors holding the intention lock of this request, from the root down
+        granted = False
+
+        try:
+            while True:
+                # Cleared before the checks so a wake-up racing with them is not lost
+                transaction.wakeup.clear()
+                if transaction.state != "active" or transaction.abort_requested:
+                    self._abort_victim(transaction)
+
+                blocked = self._lock_down(transaction, node, lock_type, taken, operation)
+                if blocked is None:
+                    granted = True
+                    return
+                stripe, blocking_transaction = blocked
+
+                transaction.block_transaction(node, lock_type)
+                transaction.wait_deadline = deadline
+                victim = self._add_wait_edge(transaction, blocking_transaction)
+
+                if victim is not None and victim is not transaction:
+                    victim.wakeup.set()
+
+                if victim is transaction:
+                    signaled = True
+                else:
+                    remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                    signaled = transaction.wakeup.wait(remaining)
+
+                with self.latches[stripe]:
+                    self.waiters[stripe].discard(transaction)
+                self._remove_wait_edge(transaction)
+                transaction.unblock_transaction()
+
+                if transaction.abort_requested:
+                    self._abort_victim(transaction)
+
+                if not signaled:
+                    self.metrics.record_timeout(node, lock_type)
+                    if self.timeout_action == "abort":
+                        self.abort(transaction)
+                    raise LockTimeoutError(transaction, node)
+        finally:
+            if not granted:
+                self._wake(self._release_intentions(transaction, taken, INTENTION_LOCKS[lock_type]))
+
+    def _lock_down(self, transaction, node, lock_type, taken, operation=None):
+        """
+        Takes the intention lock of the request on the ancestors of the node from the root
+        down (those in taken already hold it, new ones are appended), then grants or promotes
+        the lock on the node. Every lock table is checked under its own stripe latch only:
+        an intention lock is in place before the request looks below it, so a conflicting
+        lock granted meanwhile on an ancestor sees it.
+        Returns None once granted, otherwise (stripe, blocking transaction) with the
+        transaction registered as a waiter on the stripe of the node it conflicts on.
+        """
+
+        ancestors = _ancestors(node)
+        current_lock_type = transaction.locks_held.get(node)
+        if current_lock_type == lock_type or any(
+            transaction.locks_held.get(ancestor) == lock_type for ancestor in ancestors
+        ):
+            with self.latches[self._stripe(node)]:
+                self.metrics.record_request(node, lock_type)
+                self.metrics.record_grant(node, lock_type)
+                if operation is not None:
+                    self.operations_order.append((transaction, operation))
+            return None
+
+        intention_lock = INTENTION_LOCKS[lock_type]
+        for ancestor in ancestors[len(taken):]:
+            stripe = self._stripe(ancestor)
+            with self.latches[stripe]:
+                blocking_transaction = _intention_blocker(transaction, ancestor, intention_lock)
+                if blocking_transaction is not None:
+                    self.waiters[stripe].add(transaction)
+                    self.metrics.record_request(node, lock_type)
+                    self.metrics.record_block(node, lock_type)
+                    return stripe, blocking_transaction
+                self._add_intention(transaction, ancestor, intention_lock)
+            taken.append(ancestor)
+
+        stripe = self._stripe(node)
+        with self.latches[stripe]:
+            blocking_transaction = self.try_lock(transaction, node, lock_type)
+            if blocking_transaction is not True:
+                self.waiters[stripe].add(transaction)
+                self.metrics.record_block(node, lock_type)
+                return stripe, blocking_transaction
+
+            # Recorded under the latch so the schedule follows the grant order
+            if operation is not None:
+                self.operations_order.append((transaction, operation))
+
+        if current_lock_type is not None:
+            self._wake(
+                self._release_intentions(
+                    transaction, ancestors, INTENTION_LOCKS[current_lock_type]
+                )
+            )
+        return None
+
+    def _propagate_lock(self, transaction, node, lock_type, previous_lock_type=None):
+        """
+        Leaves the hierarchy alone: `_lock_down` takes the intention locks before the grant
+        and drops those of previous_lock_type after it, and descendants get no copy.
+        """
+
+    def restore_lock(self, transaction, node: GranularityGraphNode, lock_type):
+        """
+        Grants a recovered lock together with its intention locks on the ancestors.
+        """
+
+        for ancestor in _ancestors(node):
+            with self.latches[self._stripe(ancestor)]:
+                self._add_intention(transaction, ancestor, INTENTION_LOCKS[lock_type])
+
+        with self.latches[self._stripe(node)]:
+            self._grant_lock(transaction, node, lock_type)
+
+    @staticmethod
+    def _add_intention(transaction, node, intention_lock):
+        """
+        Counts one more lock of the transaction below the node; the first one puts the
+        intention lock in the node's table. Called under the node's stripe latch.
+        """
+
+        key = (node, intention_lock)
+        count = transaction.intention_counts.get(key, 0)
+        if count == 0:
+            node.locks[intention_lock].add(transaction)
+        transaction.intention_counts[key] = count + 1
+
+    def _release_intentions(self, transaction, nodes, intention_lock):
+        """
+        Counts one lock of the transaction less below each node; the last one takes the
+        intention lock out of the node's table, under its stripe latch.
+        Returns the waiters of the stripes it changed.
+        """
+
+        woken = set()
+        for node in nodes:
+            key = (node, intention_lock)
+            count = transaction.intention_counts.get(key)
+            if count is None:
+                continue  # Already dropped by an abort
+            if count > 1:
+                transaction.intention_counts[key] = count - 1
+                continue
+
+            stripe = self._stripe(node)
+            with self.latches[stripe]:
+                node.locks[intention_lock].discard(transaction)
+                woken.update(self.waiters[stripe])
+            del transaction.intention_counts[key]
+
+        return woken
+
+    @staticmethod
+    def _wake(waiters):
+        for waiter in sorted(waiters, key=deadline_order):
+            waiter.wakeup.set()
+
+    def _add_wait_edge(self, transaction, blocking_transaction):
+        """
+        Adds the wait-for edge and checks for a deadlock.
+        Returns the transaction chosen as victim, or None.
+        """
+
+        with self.await_graph_latch:
+            # The blocker may have finished after we released the stripes
+            if not self.await_graph.find_vertex(blocking_transaction.transaction_id):
+                transaction.wakeup.set()
+                return None
+
+            self.await_graph.add_edge(
+                transaction.transaction_id, blocking_transaction.transaction_id
+            )
+            transaction.waiting_on = blocking_transaction.transaction_id
+            self.metrics.observe_await_graph(self.await_graph)
+
+            # Only a cycle closed by the new edge is this request's to break
+            if not self.await_graph.has_path(
+                blocking_transaction.transaction_id, transaction.transaction_id
+            ):
+                return None
+
+            # A victim chosen on this cycle but not aborted yet already breaks it
+            for member in (transaction, blocking_transaction):
+                if member.abort_requested:
+                    return member
+
+            victim, reason = self._choose_victim(transaction, blocking_transaction)
+            self.metrics.record_deadlock(reason)
+            victim.abort_requested = True
+            return victim
+
+    def _remove_wait_edge(self, transaction):
+        with self.await_graph_latch:
+            blocking_id = getattr(transaction, "waiting_on", None)
+            vertex = self.await_graph.vertices.get(transaction.transaction_id)
+            if vertex is not None and blocking_id in vertex["edges"]:
+                self.await_graph.remove_edge(transaction.transaction_id, blocking_id)
+            transaction.waiting_on = None
+
+    def _abort_victim(self, transaction):
+        if transaction.state == "active":
+            self.abort(transaction)
+        raise DeadlockVictimError(transaction)
+
+    def commit(self, transaction: Transaction, timeout=None):
+        """
+        Certifies the transaction's writes (waiting for readers to finish, as in 2V2PL),
+        then releases all of its locks.
+        """
+
+        if transaction.abort_requested:
+            self._abort_victim(transaction)
+
+        for node, lock_type in list(transaction.locks_held.items()):
+            if lock_type == LockType.WL:
+                self._acquire(transaction, node, LockType.CL, timeout)
+
+        if self.wal is not None:
+            self.wal.log_certify(transaction)
+            self.wal.log_commit(transaction)
+        self._finish(transaction, "committed", "Commited")
+
+    def abort(self, transaction: Transaction):
+        """
+        Aborts the transaction and releases all of its locks.
+        """
+
+        if transaction.state in ("committed", "aborted"):
+            return  # E.g. already aborted by its lock timeout
+
+        if self.wal is not None:
+            self.wal.log_abort(transaction)
+        self._finish(transaction, "aborted", "Aborted")
+
+    def _finish(self, transaction, state, label):
+        """
+        Releases every lock of the transaction, then its intention locks, one stripe latch at
+        a time, and wakes the threads waiting on those stripes.
+        """
+
+        # Recorded before the release so the schedule follows the grant order
+        transaction.state = state
+        self.operations_order.append((transaction, label))
+        woken = set()
+
+        for node, lock_type in list(transaction.locks_held.items()):
+            stripe = self._stripe(node)
+            with self.latches[stripe]:
+                node.locks[lock_type].discard(transaction)
+                woken.update(self.waiters[stripe])
+            del transaction.locks_held[node]
+
+        for node, intention_lock in list(transaction.intention_counts):
+            stripe = self._stripe(node)
+            with self.latches[stripe]:
+                node.locks[intention_lock].discard(transaction)
+                woken.update(self.waiters[stripe])
+        transaction.intention_counts.clear()
+
+        with self.await_graph_latch:
+            for vertex, _ in self.await_graph.get_waiting_transactions(
+                transaction.transaction_id
+            ):
+                self.await_graph.remove_edge(vertex, transaction.transaction_id)
+            self.await_graph.remove_vertex(transaction.transaction_id)
+            self.metrics.observe_await_graph(self.await_graph)
+
+        self._wake(woken)
+
+
+def _ancestors(node: GranularityGraphNode):
+    """
+    Returns the ancestors of the node from the root down.
+    """
+
+    ancestors = []
+    ancestor = node.parent
+    while ancestor is not None:
+        ancestors.append(ancestor)
+        ancestor = ancestor.parent
+    ancestors.reverse()
+    return ancestors
+
+
+def _intention_blocker(transaction, node: GranularityGraphNode, intention_lock):
+    """
+    Returns another transaction whose lock on the node the intention lock conflicts with,
+    or None.
+    """
+
+    for lock_type in INTENTION_CONFLICTS[intention_lock]:
+        for holder in node.locks[lock_type]:
+            if holder is not transaction:
+                return holder
+    return None
+
+
+if __name__ == "__main__":
+    import io
+    from contextlib import redirect_stdout
+
+    granularity_graph = GranularityGraph()
+    table_node = GranularityGraphNode("Table1")
+    tuple_node1 = GranularityGraphNode("Tuple1")
+    tuple_node2 = GranularityGraphNode("Tuple2")
+    granularity_graph.add_node(granularity_graph.root, table_node)
+    granularity_graph.add_node(table_node, tuple_node1)
+    granularity_graph.add_node(table_node, tuple_node2)
+
+    lock_manager = ThreadSafeLockManager(granularity_graph, Graph())
+    barrier = threading.Barrier(2)
+
+    def client(first, second):
+        transaction = lock_manager.begin()
+        try:
+            lock_manager.acquire(transaction, first, OperationType.WRITE)
+            barrier.wait()
+            lock_manager.acquire(transaction, second, OperationType.WRITE, timeout=5)
+            lock_manager.commit(transaction)
+        except DeadlockVictimError as error:
+            print(error)
+
+    # Both clients write the two tuples in opposite order: one of them becomes a deadlock victim
+    with redirect_stdout(io.StringIO()):
+        threads = [
+            threading.Thread(target=client, args=(tuple_node1, tuple_node2)),
+            threading.Thread(target=client, args=(tuple_node2, tuple_node1)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    lock_manager.print_schedule_order()
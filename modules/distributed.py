@@ -0,0 +1,701 @@
+import multiprocessing
+
+from modules.lock import Lock, LockType
+from modules.lock_manager import INTENTION_CONFLICTS, INTENTION_LOCKS, LockManager
+from modules.transaction import Transaction
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.await_graph import Graph
+from modules.operation import Operation, OperationType
+
+
+class _CoordinatorLockManager(LockManager):
+    def promote_lock(self, transaction, node, new_lock_type):
+        """
+        Promotes a lock on an upper node. Changing a lock drops the transaction's intention
+        locks on the ancestors, so the ones its partition operations need are put back.
+        """
+
+        if not super().promote_lock(transaction, node, new_lock_type):
+            return False
+
+        for copy, intention_lock in transaction.intentions:
+            copy.locks[intention_lock].add(transaction)
+        return True
+
+    def release_all_locks(self, transaction):
+        """
+        Also releases the intention locks taken for the transaction's partition operations,
+        so they go as soon as it commits or is aborted, even by a coordinator deadlock.
+        """
+
+        super().release_all_locks(transaction)
+
+        for copy, intention_lock in transaction.intentions:
+            copy.locks[intention_lock].discard(transaction)
+        transaction.intentions.clear()
+
+
+class DistributedLockManager:
+    def __init__(
+        self, granularity_graph: GranularityGraph, workers=2, partition_level=1, quiet=True
+    ):
+        """
+        Lock manager split across local worker processes.
+
+        The subtrees rooted at depth `partition_level` (1 = areas, 2 = tables, ...) are dealt
+        round-robin to `workers` processes, each owning a LockManager for its subtrees and
+        talking to the coordinator over a Pipe with plain tuples. The coordinator keeps the
+        nodes above the partitions: it locks them directly and grants the intention locks a
+        partition operation needs on them before forwarding it. Commits are two-phase: the
+        transaction takes ICL above the partition nodes it wrote and certifies in every
+        partition it touched, then commits in all of them.
+
+        Every partition breaks its own deadlocks. Deadlocks spanning partitions are found by
+        merging the local wait-for graphs whenever a request blocks or progress stops; the
+        transaction aborted the fewest times (the youngest on a tie) is the victim.
+
+        Node names must be unique, since they identify nodes across processes. With `quiet`
+        neither the coordinator nor the workers print their lock messages.
+        """
+
+        if partition_level < 1:
+            raise ValueError("The partition level must be at least 1.")
+
+        self.granularity_graph = granularity_graph
+        self.partition_level = partition_level
+        self.nodes_by_name = {}
+        self.upper_nodes = {}  # original node -> coordinator copy
+        self.partition_of = {}  # node -> worker index
+        self.operations_order = []
+        self.transactions = {}  # transaction_id -> Transaction
+        self.active = {}  # transaction_id -> Transaction, in creation order
+
+        # The coordinator's lock manager only holds the nodes above the partitions
+        upper_graph = GranularityGraph()
+        self.lock_manager = _CoordinatorLockManager(upper_graph, Graph(), verbose=not quiet)
+        self.metrics = self.lock_manager.metrics
+
+        partitions = self._split(granularity_graph.root, upper_graph.root, 0)
+        workers = max(1, min(workers, len(partitions)))
+
+        worker_nodes = [[] for _ in range(workers)]
+        for index, partition_root in enumerate(partitions):
+            worker = index % workers
+            self._assign(partition_root, None, worker, worker_nodes[worker])
+
+        self.connections = []
+        self.processes = []
+        for nodes in worker_nodes:
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker_main, args=(worker_connection, nodes, quiet), daemon=True
+            )
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def _register_name(self, node):
+        if node.name in self.nodes_by_name:
+            raise ValueError(f"Duplicate node name {node.name}.")
+        self.nodes_by_name[node.name] = node
+
+    def _split(self, node, copy, depth):
+        """
+        Copies the nodes above the partition level into the coordinator's graph and returns
+        the partition roots.
+        """
+
+        self._register_name(node)
+        self.upper_nodes[node] = copy
+
+        partitions = []
+        for child in node.children:
+            if depth + 1 == self.partition_level:
+                partitions.append(child)
+            else:
+                child_copy = GranularityGraphNode(child.name)
+                self.lock_manager.granularity_graph.add_node(copy, child_copy)
+                partitions += self._split(child, child_copy, depth + 1)
+
+        return partitions
+
+    def _assign(self, node, parent_name, worker, nodes):
+        """
+        Assigns a subtree to a worker, listing it as (name, parent name) in top-down order.
+        """
+
+        stack = [(node, parent_name)]
+        while stack:
+            node, parent_name = stack.pop()
+            self._register_name(node)
+            self.partition_of[node] = worker
+            nodes.append((node.name, parent_name))
+            for child in reversed(node.children):
+                stack.append((child, node.name))
+
+    def begin(self):
+        """
+        Starts a new transaction.
+        """
+
+        transaction = Transaction(self.lock_manager, self.lock_manager.await_graph)
+        transaction.queue = []  # (node, operation type) not sent yet
+        transaction.waiting_in = set()  # Workers the transaction is waiting in
+        transaction.workers = set()
+        transaction.certified = set()
+        transaction.intentions = set()  # (coordinator node, intention lock type)
+        transaction.written = set()  # Partition nodes written, certified at commit
+
+        self.transactions[transaction.transaction_id] = transaction
+        self.active[transaction.transaction_id] = transaction
+        return transaction
+
+    def request(self, transaction, node: GranularityGraphNode, operation_type: OperationType):
+        """
+        Submits an operation and runs everything that can make progress.
+        Returns the state of the transaction afterwards.
+        """
+
+        self.submit(transaction, node, operation_type)
+        self.pump()
+        return self._state_of(transaction)
+
+    def commit(self, transaction):
+        return self.request(transaction, None, OperationType.COMMIT)
+
+    def abort(self, transaction):
+        self._abort_transactions([transaction])
+        self.pump()
+
+    def submit(self, transaction, node, operation_type: OperationType):
+        """
+        Queues an operation without running it.
+        """
+
+        if node is not None and node not in self.upper_nodes and node not in self.partition_of:
+            raise ValueError(f"{node} is not part of the granularity graph.")
+
+        if transaction.transaction_id in self.active:
+            transaction.queue.append((node, operation_type))
+
+    def run(self, operations):
+        """
+        Runs a schedule of (transaction key, node, operation type) tuples, node being None for
+        COMMIT. All its transactions run concurrently, each one's operations in order.
+        Returns the global operations order.
+        """
+
+        transactions = {}
+        for transaction_key, node, operation_type in operations:
+            transaction = transactions.get(transaction_key)
+            if transaction is None:
+                transaction = self.begin()
+                transactions[transaction_key] = transaction
+            self.submit(transaction, node, operation_type)
+
+        self.pump()
+        return self.operations_order
+
+    def _state_of(self, transaction):
+        if transaction.waiting_in:
+            return "blocked"
+        return transaction.state
+
+    def pump(self):
+        """
+        Sends, in rounds, the next operation of every transaction that is not waiting (at most
+        one message per worker per round, so the workers run in parallel) until nothing moves.
+        """
+
+        while True:
+            batch = {}  # worker -> (transaction, message)
+            progress = False
+            blocked = False
+
+            for transaction in list(self.active.values()):
+                if (
+                    not transaction.queue
+                    or transaction.waiting_in
+                    or transaction.state != "active"
+                ):
+                    continue
+
+                node, operation_type = transaction.queue[0]
+                if operation_type == OperationType.COMMIT:
+                    moved = self._dispatch_commit(transaction, batch)
+                elif node in self.upper_nodes:
+                    moved = self._run_upper_operation(transaction, node, operation_type)
+                else:
+                    moved = self._dispatch_operation(transaction, node, operation_type, batch)
+
+                progress = progress or moved
+                blocked = blocked or transaction.state == "blocked"
+
+            if batch:
+                blocked = self._send_batch(batch) or blocked
+
+            aborted = [
+                transaction
+                for transaction in self.active.values()
+                if transaction.state == "aborted"
+            ]
+            self._abort_transactions(aborted)
+
+            if blocked:
+                self.detect_global_deadlocks()
+
+            if not batch and not progress and not aborted:
+                # A woken transaction can block again inside a worker without telling the
+                # coordinator, so look for cycles once more before giving up
+                if not any(transaction.waiting_in for transaction in self.active.values()):
+                    break
+                if not self.detect_global_deadlocks():
+                    break
+
+    def _upper_path(self, node):
+        """
+        Returns the coordinator copies of the nodes above a partition node.
+        """
+
+        path = []
+        ancestor = node.parent
+        while ancestor is not None:
+            if ancestor in self.upper_nodes:
+                path.append(self.upper_nodes[ancestor])
+            ancestor = ancestor.parent
+        return path
+
+    def _run_upper_operation(self, transaction, node, operation_type):
+        """
+        Locks a node above the partitions in the coordinator's own lock manager.
+        """
+
+        copy = self.upper_nodes[node]
+        lock_type = Lock.get_lock_type_based_on_operation(operation_type)
+
+        blocking_transaction = self.lock_manager.try_lock(transaction, copy, lock_type)
+        if blocking_transaction is not True:
+            self.lock_manager.block_on(transaction, copy, lock_type, blocking_transaction)
+            return True
+
+        transaction.queue.pop(0)
+        self.operations_order.append((transaction, Operation(operation_type, node)))
+        return True
+
+    def _dispatch_operation(self, transaction, node, operation_type, batch):
+        """
+        Takes the intention locks above the partition and adds the operation to the batch.
+        Returns True if something changed.
+        """
+
+        worker = self.partition_of[node]
+        if worker in batch:
+            return False
+
+        lock_type = Lock.get_lock_type_based_on_operation(operation_type)
+        intention_lock = INTENTION_LOCKS[lock_type]
+        if not self._take_intentions(transaction, self._upper_path(node), intention_lock):
+            return True
+
+        transaction.queue.pop(0)
+        if lock_type == LockType.WL:
+            transaction.written.add(node)
+        transaction.workers.add(worker)
+        batch[worker] = (
+            transaction,
+            (
+                "operation",
+                transaction.transaction_id,
+                transaction.timestamp,
+                node.name,
+                operation_type.value,
+            ),
+        )
+        return True
+
+    def _take_intentions(self, transaction, path, intention_lock):
+        """
+        Grants the intention lock on the coordinator copies in path, or blocks the transaction
+        behind a conflicting lock. Returns True if all of them were granted.
+        """
+
+        missing = [copy for copy in path if (copy, intention_lock) not in transaction.intentions]
+
+        for copy in missing:
+            for lock_type in INTENTION_CONFLICTS[intention_lock]:
+                blocking_transaction = next(
+                    (holder for holder in copy.locks[lock_type] if holder is not transaction),
+                    None,
+                )
+                if blocking_transaction is not None:
+                    self.lock_manager.block_on(
+                        transaction, copy, intention_lock, blocking_transaction
+                    )
+                    return False
+
+        for copy in missing:
+            copy.locks[intention_lock].add(transaction)
+            transaction.intentions.add((copy, intention_lock))
+
+        return True
+
+    def _dispatch_commit(self, transaction, batch):
+        """
+        Certifies the transaction above the partitions, then in every partition it touched,
+        then commits it everywhere. Returns True if something changed.
+        """
+
+        if not transaction.convert_write_locks_to_cl():
+            return True  # Waiting at the coordinator for readers of an upper node
+
+        # Readers of an upper node see the partition writes too: certifying them waits for them
+        for node in transaction.written:
+            if not self._take_intentions(transaction, self._upper_path(node), LockType.ICL):
+                return True
+
+        uncertified = transaction.workers - transaction.certified
+        targets = uncertified or transaction.workers
+
+        if not targets:
+            self._finish_commit(transaction)
+            return True
+
+        if any(worker in batch for worker in targets):
+            return False
+
+        command = "certify" if uncertified else "commit"
+        for worker in targets:
+            batch[worker] = (transaction, (command, transaction.transaction_id))
+        return True
+
+    def _send_batch(self, batch):
+        """
+        Sends one message to each worker of the batch, then handles all the replies.
+        Returns True if a request blocked.
+        """
+
+        for worker, (_, message) in batch.items():
+            self.connections[worker].send(message)
+
+        blocked = False
+        to_abort = []
+
+        for worker, (transaction, message) in sorted(batch.items()):
+            status, events = self.connections[worker].recv()
+
+            # The commit goes into the order before the operations it woke up
+            if message[0] == "commit" and transaction.transaction_id in self.active:
+                self._finish_commit(transaction)
+
+            to_abort += self._handle_events(worker, events)
+
+            if status == "aborted":
+                to_abort.append(transaction)
+            elif status == "blocked":
+                transaction.waiting_in.add(worker)
+                blocked = True
+            elif message[0] == "certify":
+                transaction.certified.add(worker)
+
+        self._abort_transactions(to_abort)
+        return blocked
+
+    def _handle_events(self, worker, events):
+        """
+        Applies what happened in a worker while handling a message: operations executed
+        (including woken transactions), transactions unblocked and local deadlock victims.
+        Returns the transactions to abort.
+        """
+
+        to_abort = []
+
+        for event in events:
+            transaction = self.transactions[event[1]]
+
+            if event[0] == "executed":
+                _, _, operation_value, node_name = event
+                self.operations_order.append(
+                    (
+                        transaction,
+                        Operation(OperationType(operation_value), self.nodes_by_name[node_name]),
+                    )
+                )
+            elif event[0] == "unblocked":
+                transaction.waiting_in.discard(worker)
+            elif event[0] == "aborted":
+                to_abort.append(transaction)
+
+        return to_abort
+
+    def _finish_commit(self, transaction):
+        transaction.queue.clear()
+        transaction.commit_transaction()
+        del self.active[transaction.transaction_id]
+        self.operations_order.append((transaction, "Commited"))
+
+    def _abort_transactions(self, transactions):
+        """
+        Aborts transactions in the coordinator and in every partition they touched.
+        Aborting can wake transactions that then become local deadlock victims, so this
+        runs until no abort is left.
+        """
+
+        pending = list(transactions)
+
+        while pending:
+            transaction = pending.pop()
+            if transaction.transaction_id not in self.active:
+                continue
+
+            del self.active[transaction.transaction_id]
+            transaction.queue.clear()
+            transaction.waiting_in.clear()
+            if transaction.state != "aborted":
+                transaction.abort_transaction()
+
+            for worker in sorted(transaction.workers):
+                self.connections[worker].send(("abort", transaction.transaction_id))
+                _, events = self.connections[worker].recv()
+                pending += self._handle_events(worker, events)
+
+            self.operations_order.append((transaction, "Aborted"))
+
+    def _wait_for_edges(self):
+        """
+        Merges the wait-for graphs of the coordinator and of every worker.
+        """
+
+        edges = {
+            transaction_id: list(data["edges"])
+            for transaction_id, data in self.lock_manager.await_graph.vertices.items()
+            if data["edges"]
+        }
+
+        for connection in self.connections:
+            connection.send(("graph",))
+        for connection in self.connections:
+            for source, destination in connection.recv():
+                edges.setdefault(source, []).append(destination)
+
+        return edges
+
+    def detect_global_deadlocks(self):
+        """
+        Breaks every cycle of the merged wait-for graph. Returns the aborted transactions.
+        """
+
+        victims = []
+
+        while True:
+            cycle = _find_cycle(self._wait_for_edges())
+            if cycle is None:
+                return victims
+
+            candidates = [
+                self.transactions[transaction_id]
+                for transaction_id in cycle
+                if transaction_id in self.active
+            ]
+            victim = max(
+                candidates,
+                key=lambda transaction: (-transaction.abort_count, transaction.timestamp),
+            )
+            self.metrics.record_deadlock("global")
+            victims.append(victim)
+            self._abort_transactions([victim])
+
+    def print_schedule_order(self):
+        for transaction, operation in self.operations_order:
+            if isinstance(operation, str):
+                print(f"Transaction {transaction.transaction_id} - {operation}")
+            else:
+                print(
+                    f"Transaction {transaction.transaction_id} - {operation.operation_type.value} - {operation.node.name}"
+                )
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+
+        for connection in self.connections:
+            try:
+                connection.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+
+        for process in self.processes:
+            process.join()
+
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _find_cycle(edges):
+    """
+    Returns the transaction ids of a cycle in the wait-for edges, or None.
+    """
+
+    WHITE, GRAY, BLACK = 0, 1, 2
+    color = {}
+
+    for start in edges:
+        if color.get(start, WHITE) != WHITE:
+            continue
+
+        color[start] = GRAY
+        path = [start]
+        stack = [iter(edges.get(start, ()))]
+
+        while stack:
+            advanced = False
+            for neighbor in stack[-1]:
+                state = color.get(neighbor, WHITE)
+                if state == GRAY:
+                    return path[path.index(neighbor):]
+                if state == WHITE:
+                    color[neighbor] = GRAY
+                    path.append(neighbor)
+                    stack.append(iter(edges.get(neighbor, ())))
+                    advanced = True
+                    break
+
+            if not advanced:
+                color[path.pop()] = BLACK
+                stack.pop()
+
+    return None
+
+
+def _worker_main(connection, nodes, quiet=True):
+    """
+    Worker process loop: owns the lock tables of some subtrees and answers every message
+    with (status of the transaction, events).
+    """
+
+    granularity_graph = GranularityGraph()
+    nodes_by_name = {}
+    for name, parent_name in nodes:
+        node = GranularityGraphNode(name)
+        parent = granularity_graph.root if parent_name is None else nodes_by_name[parent_name]
+        granularity_graph.add_node(parent, node)
+        nodes_by_name[name] = node
+
+    await_graph = Graph()
+    lock_manager = LockManager(granularity_graph, await_graph, verbose=not quiet)
+    transactions = {}
+    blocked = set()
+
+    while True:
+        message = connection.recv()
+        command = message[0]
+
+        if command == "stop":
+            break
+
+        if command == "graph":
+            connection.send(
+                [
+                    (transaction_id, blocking_id)
+                    for transaction_id, data in await_graph.vertices.items()
+                    for blocking_id in data["edges"]
+                ]
+            )
+            continue
+
+        transaction_id = message[1]
+        transaction = transactions.get(transaction_id)
+
+        if command == "operation":
+            _, _, timestamp, node_name, operation_value = message
+            if transaction is None:
+                transaction = Transaction(
+                    lock_manager, await_graph, transaction_id=transaction_id, timestamp=timestamp
+                )
+                transactions[transaction_id] = transaction
+            transaction.create_operation(
+                nodes_by_name[node_name], OperationType(operation_value)
+            )
+        elif command == "certify":
+            certified = transaction.convert_write_locks_to_cl()
+            # Breaking a deadlock may wake the transaction before it returns, then it retries
+            while not certified and transaction.state == "active":
+                certified = transaction.convert_write_locks_to_cl()
+        elif command == "commit":
+            transaction.commit_transaction()
+        elif command == "abort":
+            if transaction is not None and transaction.state not in ("committed", "aborted"):
+                transaction.abort_transaction()
+
+        status = "aborted" if transaction is None else transaction.state
+
+        events = []
+        for entry_transaction, operation in lock_manager.operations_order:
+            if operation == "Aborted":
+                events.append(("aborted", entry_transaction.transaction_id))
+            elif not isinstance(operation, str):
+                events.append(
+                    (
+                        "executed",
+                        entry_transaction.transaction_id,
+                        operation.operation_type.value,
+                        operation.node.name,
+                    )
+                )
+
+            if isinstance(operation, str):
+                transactions.pop(entry_transaction.transaction_id, None)
+                blocked.discard(entry_transaction.transaction_id)
+        lock_manager.operations_order.clear()
+
+        watched = blocked | {transaction_id}
+        blocked = set()
+        for watched_id in watched:
+            watched_transaction = transactions.get(watched_id)
+            if watched_transaction is None:
+                continue
+            if watched_transaction.state == "blocked":
+                blocked.add(watched_id)
+            elif watched_id != transaction_id:
+                events.append(("unblocked", watched_id))
+
+        connection.send((status, events))
+
+
+if __name__ == "__main__":
+    from modules.serializability import verify_schedule
+
+    granularity_graph = GranularityGraph()
+    area_node1 = GranularityGraphNode("Area1")
+    area_node2 = GranularityGraphNode("Area2")
+    tuple_node1 = GranularityGraphNode("Tuple1")
+    tuple_node2 = GranularityGraphNode("Tuple2")
+    granularity_graph.add_node(granularity_graph.root, area_node1)
+    granularity_graph.add_node(granularity_graph.root, area_node2)
+    granularity_graph.add_node(area_node1, tuple_node1)
+    granularity_graph.add_node(area_node2, tuple_node2)
+
+    # Each transaction writes one tuple per area in opposite order: a deadlock across both
+    # worker processes that neither of them can see alone
+    schedule = [
+        (1, tuple_node1, OperationType.WRITE),
+        (2, tuple_node2, OperationType.WRITE),
+        (1, tuple_node2, OperationType.WRITE),
+        (2, tuple_node1, OperationType.WRITE),
+        (1, None, OperationType.COMMIT),
+        (2, None, OperationType.COMMIT),
+    ]
+
+    with DistributedLockManager(granularity_graph, workers=2) as lock_manager:
+        lock_manager.run(schedule)
+        lock_manager.print_schedule_order()
+        print(f"Global deadlocks: {lock_manager.metrics.deadlocks}")
+        print(f"Serializable: {verify_schedule(lock_manager.operations_order) is None}")
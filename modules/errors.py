@@ -0,0 +1,23 @@
+class DeadlockVictimError(Exception):
+    """
+    Raised when a transaction waiting for a lock is aborted to break a deadlock.
+    """
+
+    def __init__(self, transaction):
+        super().__init__(
+            f"Transaction {transaction.transaction_id} was aborted to resolve a deadlock."
+        )
+        self.transaction = transaction
+
+
+class LockTimeoutError(TimeoutError):
+    """
+    Raised when a lock request is not granted before its deadline.
+    """
+
+    def __init__(self, transaction, node):
+        super().__init__(
+            f"Transaction {transaction.transaction_id} timed out waiting for a lock on {node}."
+        )
+        self.transaction = transaction
+        self.node = node
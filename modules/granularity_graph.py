@@ -2,12 +2,14 @@ from modules.lock import Lock, LockType
 
 
 class GranularityGraphNode:
-    def __init__(self, name, is_root=False):
+    def __init__(self, name, is_root=False, key=None):
         self.name = name
+        self.key = key  # Optional key ordering the node for key-range locks (e.g. a tuple)
         self.locks = {lock_type: set() for lock_type in LockType}  # Initialize locks
         self.children = []
         self.parent = None
         self.is_root = is_root
+        self.range_indexes = []  # RangeIndex kept on this node by lock managers
 
     def add_lock(self, transaction, lock_type):
         """
@@ -122,6 +124,13 @@ class GranularityGraph:
         parent.children.append(node)
         node.parent = parent
 
+        # Key-range indexes above the node now cover its keys too
+        ancestor = parent
+        while ancestor is not None:
+            for index in ancestor.range_indexes:
+                index.add_subtree(node)
+            ancestor = ancestor.parent
+
     def print_graph(self, node=None, level=0):
         """
         Prints the graph hierarchy starting from the given node.
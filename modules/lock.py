@@ -72,11 +72,15 @@ class Lock:
 
     @staticmethod
     def check_conflicting_locks(
-        current_locks, current_lock_type: LockType, new_lock_type: LockType
+        current_locks,
+        current_lock_type: LockType,
+        new_lock_type: LockType,
+        transaction=None,
     ):
         """
         Ensures that there are no conflicting locks that would prevent the promotion.
         Write, Update, and Certify Locks require exclusivity.
+        Certify Locks also wait for other transactions reading or certifying below the node.
         """
 
         if new_lock_type in [
@@ -90,6 +94,12 @@ class Lock:
                 if lock_type != current_lock_type
             ):
                 return False  # Conflicting locks exist
+
+        if new_lock_type == LockType.CL:
+            for lock_type in [LockType.IRL, LockType.IUL, LockType.ICL]:
+                if any(holder is not transaction for holder in current_locks[lock_type]):
+                    return False  # Readers or certifiers below the node
+
         return True
 
     def __repr__(self):
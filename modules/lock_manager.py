@@ -1,18 +1,117 @@
+import heapq
+import itertools
+import math
+import time
+
 from modules.lock import LockType, Lock
+from modules.operation import OperationType
 from modules.transaction import Transaction
 from modules.granularity_graph import GranularityGraph, GranularityGraphNode
 from modules.await_graph import Graph
+from modules.metrics import LockMetrics
+from modules.range_locks import RANGE_CONFLICTS, RangeIndex, RangeLock
+
+# Lock types a transaction can predeclare, from weakest to strongest
+DECLARED_LOCK_STRENGTH = {LockType.RL: 0, LockType.UL: 1, LockType.WL: 2}
+
+# Locks of other predeclared transactions a declared lock cannot be granted next to,
+# because one of the two would have to wait for the other to certify
+CERTIFY_CONFLICTS = {
+    LockType.RL: (LockType.WL, LockType.IWL),
+    LockType.WL: (LockType.RL, LockType.IRL),
+}
+
+# Intention lock a lock takes on the ancestors of its node
+INTENTION_LOCKS = {
+    LockType.RL: LockType.IRL,
+    LockType.UL: LockType.IUL,
+    LockType.WL: LockType.IWL,
+    LockType.CL: LockType.ICL,
+}
+
+# Locks of other transactions an intention lock has to wait for (as in _can_grant_lock)
+INTENTION_CONFLICTS = {
+    LockType.IRL: [LockType.CL, LockType.UL],
+    LockType.IUL: [LockType.CL, LockType.UL, LockType.WL],
+    LockType.IWL: [LockType.CL, LockType.UL, LockType.WL],
+    LockType.ICL: [LockType.CL, LockType.UL, LockType.WL, LockType.RL],
+}
 
 
 class LockManager:
-    def __init__(self, granularity_graph: GranularityGraph, await_graph: Graph):
+    # Methods (of the manager, or of its await_graph) that PhaseProfiler times in each phase
+    PROFILED_PHASES = {
+        "compatibility_check": ("_get_blocking_transaction", "_can_promote"),
+        "intention_backpropagation": ("_add_intentions",),
+        "front_propagation": ("_add_to_descendants",),
+        "wait_graph_edge": ("await_graph.add_edge",),
+        "deadlock_detection": ("await_graph.detect_deadlock",),
+        "release": ("release_lock",),
+    }
+
+    def __init__(
+        self,
+        granularity_graph: GranularityGraph,
+        await_graph: Graph,
+        lock_timeout=None,
+        timeout_action="abort",
+        clock=time.monotonic,
+        retry_policy=None,
+        upgrade_priority_after=0.05,
+        wal=None,
+        trace=None,
+        verbose=True,
+    ):
         """
         Initializes the lock manager to track locks on resources with multiple levels of granularity.
+
+        `lock_timeout` is the default number of seconds a lock request may wait (None waits
+        until woken). When it expires the transaction is aborted (`timeout_action="abort"`)
+        or only the waiting operation is dropped (`timeout_action="fail"`). Deadlines are
+        checked whenever an operation is submitted; the lock manager has no timer of its own,
+        so a caller whose transactions can sit idle must call `expire_lock_timeouts` itself,
+        at `next_lock_deadline()`.
+
+        With a `retry_policy` (a RetryPolicy) aborted transactions are restarted from their
+        operation log after a backoff, keeping their original timestamp. Restarts are checked
+        when an operation is submitted and whenever a transaction commits or aborts.
+
+        A transaction waiting to upgrade or certify a lock for longer than
+        `upgrade_priority_after` seconds gets priority over new readers of the same subtree
+        (None disables it), so a stream of readers cannot starve it.
+
+        With a `wal` (a WriteAheadLog) certify, commit and abort decisions are logged, and
+        commits are on disk before their locks are released.
+
+        With a `trace` (a TraceRecorder) the run is recorded for a deterministic replay.
+
+        With `verbose=False` the lock manager and its transactions print nothing, and the
+        messages are not even formatted.
         """
 
+        if timeout_action not in ("abort", "fail"):
+            raise ValueError("Invalid timeout action. Must be 'abort' or 'fail'.")
+
         self.granularity_graph = granularity_graph
         self.await_graph = await_graph
+        self.verbose = verbose
         self.operations_order = []
+        self.metrics = LockMetrics()
+        self.lock_timeout = lock_timeout
+        self.timeout_action = timeout_action
+        self.clock = clock
+        self.lock_timers = []  # Heap of (deadline, sequence, transaction, wait_sequence)
+        self._timer_sequence = itertools.count()
+        self.lock_set_waiters = []  # Predeclared transactions waiting for their lock set, FIFO
+        self.retry_policy = retry_policy
+        self.restart_timers = []  # Heap of (restart time, sequence, transaction)
+        self.upgrade_priority_after = upgrade_priority_after
+        self.waiting_upgrades = {}  # node -> {transaction: wait start} for blocked promotions
+        self.wal = wal
+        self.range_indexes = {}  # node -> RangeIndex of its key-range and point locks
+        self.trace = None
+        if trace is not None:
+            trace.attach(self)  # Wraps the clock and the retry policy
 
     def _initialize_resource(self, resource: str):
         """
@@ -44,76 +143,809 @@ class LockManager:
             return False
 
         lock_type = Lock.get_lock_type_based_on_operation(operation)
-        print(
-            f"Transaction {transaction.transaction_id} requests {lock_type} on {node}."
-        )
-        current_locks = node.locks
+        if self.verbose:
+            print(
+                f"Transaction {transaction.transaction_id} requests {lock_type} on {node}."
+            )
+        self.metrics.record_request(node, lock_type)
 
         # Check if transaction already has this type
         if transaction in node.locks[lock_type]:
+            self.metrics.record_grant(node, lock_type)
             return True
 
+        if lock_type == LockType.RL and self.waiting_upgrades:
+            upgrader = self._starving_upgrader(transaction, node)
+            if upgrader is not None:
+                if self.verbose:
+                    print(
+                        f"Transaction {transaction.transaction_id} yields to Transaction {upgrader.transaction_id} waiting to upgrade."
+                    )
+                return self.block_on(transaction, node, lock_type, upgrader)
+
+        blocking_transaction = self._get_blocking_transaction(node, lock_type)
+        if blocking_transaction is True and self.range_indexes:
+            blocking_transaction = self._range_blocker(transaction, node, lock_type) or True
+        if blocking_transaction is True:
+            self._grant_lock(transaction, node, lock_type)
+            return True
+
+        # blocking_transaction contains the transaction that is holding a conflicting lock
+        return self.block_on(transaction, node, lock_type, blocking_transaction)
+
+    def _get_blocking_transaction(self, node: GranularityGraphNode, lock_type):
+        """
+        Checks the requested lock against the locks on the node without changing anything.
+        Returns True if the lock can be granted, otherwise returns the transaction holding the conflicting lock.
+        """
+
+        current_locks = node.locks
+
         # Check if Certify Lock is already present
         if current_locks[LockType.CL]:
-            blocking_transaction = list(current_locks[LockType.CL])[
+            return list(current_locks[LockType.CL])[
                 0
             ]  # Certify lock held by another transaction
 
-            if not self.await_graph.add_edge(
-                transaction.transaction_id, blocking_transaction.transaction_id
-            ):
-                return False
-
-            transaction.block_transaction(node)
-            self._deal_with_deadlock(transaction, blocking_transaction)
-            return False
-
-        # If no locks are present, grant the lock
+        # If no locks are present, the lock can be granted
         if not any(current_locks.values()):
-            current_locks[lock_type].add(transaction)
-            transaction.locks_held[node] = lock_type
-            node.add_lock(transaction, lock_type)
             return True
 
         # Certify Lock (CL) can only be granted if no other locks exist
         if lock_type == LockType.CL:
-            if any(current_locks.values()):
-                blocking_transaction = self._get_first_blocking_transaction(
-                    current_locks
-                )
+            return self._get_first_blocking_transaction(current_locks)
 
-                if not self.await_graph.add_edge(
-                    transaction.transaction_id, blocking_transaction.transaction_id
-                ):
-                    return False
+        # Handle conflicting locks and intention locks
+        return self._can_grant_lock(lock_type, current_locks)
 
-                transaction.block_transaction(node)
-                self._deal_with_deadlock(transaction, blocking_transaction)
-                return False
+    def _grant_lock(self, transaction, node: GranularityGraphNode, lock_type):
+        """
+        Grants the lock to the transaction and propagates it through the hierarchy.
+        """
 
-            current_locks[LockType.CL].add(transaction)
-            transaction.locks_held[node] = LockType.CL
-            node.add_lock(transaction, lock_type)
+        node.locks[lock_type].add(transaction)
+        transaction.locks_held[node] = lock_type
+        self._propagate_lock(transaction, node, lock_type)
+        self.metrics.record_grant(node, lock_type)
+        if self.wal is not None:
+            self.wal.log_grant(transaction, node, lock_type)
+        if self.range_indexes:
+            self._index_lock(transaction, node, lock_type)
+
+    def _propagate_lock(
+        self, transaction, node: GranularityGraphNode, lock_type, previous_lock_type=None
+    ):
+        """
+        Puts the intention locks of a granted lock (or of one changed from
+        previous_lock_type) on the ancestors of the node and the lock itself on its descendants.
+        """
+
+        if previous_lock_type is not None:
+            node.remove_lock(transaction, previous_lock_type)
+        node.locks[lock_type].add(transaction)
+        self._add_intentions(transaction, node, lock_type)
+        self._add_to_descendants(transaction, node, lock_type)
+
+    def _add_intentions(self, transaction, node: GranularityGraphNode, lock_type):
+        """
+        Puts the intention locks of a lock on the node's ancestors.
+        """
+
+        node.backpropagate_intention_locks(transaction, node.parent, lock_type)
+
+    def _add_to_descendants(self, transaction, node: GranularityGraphNode, lock_type):
+        """
+        Copies a lock on the node to all of its descendants.
+        """
+
+        node.front_propagate_locks(transaction, node, lock_type)
+
+    def restore_lock(self, transaction, node: GranularityGraphNode, lock_type):
+        """
+        Grants a lock recovered from the write-ahead log without checking for conflicts.
+        """
+
+        self._grant_lock(transaction, node, lock_type)
+
+    def try_lock(self, transaction, node: GranularityGraphNode, lock_type):
+        """
+        Grants the lock, or promotes the lock already held on the node, if it is compatible
+        with the other locks. Never blocks or touches the wait-for graph.
+        Returns True on success, otherwise returns a transaction holding a conflicting lock.
+        """
+
+        self.metrics.record_request(node, lock_type)
+
+        if node in transaction.locks_held:
+            current_lock_type = transaction.locks_held[node]
+            if current_lock_type == lock_type:
+                self.metrics.record_grant(node, lock_type)
+                return True
+
+            if self.promote_lock(transaction, node, lock_type):
+                return True
+
+            range_blocker = self._range_blocker(transaction, node, lock_type)
+            if range_blocker is not None:
+                return range_blocker
+
+            # Same lock types Lock.check_conflicting_locks looks at
+            conflicting_lock_types = [
+                lock_type_held
+                for lock_type_held in [LockType.RL, LockType.UL, LockType.WL]
+                if lock_type_held != current_lock_type
+            ]
+            if lock_type == LockType.CL:
+                conflicting_lock_types += [LockType.IRL, LockType.IUL, LockType.ICL]
+
+            return self._find_other_holder(transaction, node, conflicting_lock_types)
+
+        if transaction in node.locks[lock_type]:
+            self.metrics.record_grant(node, lock_type)
             return True
 
-        # Handle conflicting locks and intention locks
-        blocking_transaction = self._can_grant_lock(lock_type, current_locks)
+        blocking_transaction = self._get_blocking_transaction(node, lock_type)
+        if blocking_transaction is True and self.range_indexes:
+            blocking_transaction = self._range_blocker(transaction, node, lock_type) or True
         if blocking_transaction is True:
-            current_locks[lock_type].add(transaction)
-            transaction.locks_held[node] = lock_type
-            node.add_lock(transaction, lock_type)
+            self._grant_lock(transaction, node, lock_type)
             return True
-        else:
-            # blocking_transaction contains the transaction that is holding a conflicting lock
-            if not self.await_graph.add_edge(
-                transaction.transaction_id, blocking_transaction.transaction_id
-            ):
+
+        if blocking_transaction is None or blocking_transaction is transaction:
+            return self._find_other_holder(transaction, node)
+
+        return blocking_transaction
+
+    def _find_other_holder(self, transaction, node: GranularityGraphNode, lock_types=None):
+        """
+        Returns a transaction other than the given one holding a lock on the node.
+        Raises ValueError if the transaction only conflicts with its own locks.
+        """
+
+        for lock_type in lock_types or LockType:
+            for holder in node.locks[lock_type]:
+                if holder is not transaction:
+                    return holder
+
+        raise ValueError(
+            f"Transaction {transaction.transaction_id} conflicts with its own locks on {node}."
+        )
+
+    def block_on(
+        self, transaction, node: GranularityGraphNode, lock_type, blocking_transaction
+    ):
+        """
+        Blocks the transaction behind the blocking transaction and checks for deadlocks.
+        Also used by callers that check conflicts on locks they keep themselves.
+        """
+
+        if not self.await_graph.add_edge(
+            transaction.transaction_id, blocking_transaction.transaction_id
+        ):
+            return False
+
+        self.metrics.record_block(node, lock_type)
+        self.metrics.observe_await_graph(self.await_graph)
+        transaction.block_transaction(node, lock_type)
+        self._start_wait_timer(transaction)
+        self._deal_with_deadlock(transaction, blocking_transaction)
+        return False
+
+    def wait_for_promotion(self, transaction, node: GranularityGraphNode, lock_type):
+        """
+        Blocks a transaction whose promotion (an upgrade or its certification) failed behind
+        a transaction holding a conflicting lock, and registers it as a waiting upgrader.
+        Returns False if only its own locks are in the way, in which case it does not wait.
+        """
+
+        current_lock_type = transaction.locks_held[node]
+        conflicting_lock_types = [
+            lock_type_held
+            for lock_type_held in [LockType.RL, LockType.UL, LockType.WL]
+            if lock_type_held != current_lock_type
+        ]
+        if lock_type == LockType.CL:
+            conflicting_lock_types += [LockType.IRL, LockType.IUL, LockType.ICL]
+
+        blocking_transaction = self._range_blocker(transaction, node, lock_type)
+        if blocking_transaction is None:
+            try:
+                blocking_transaction = self._find_other_holder(
+                    transaction, node, conflicting_lock_types
+                )
+            except ValueError:
+                self._forget_upgrade(transaction, node)  # May be left from an earlier wait
                 return False
 
-            transaction.block_transaction(node)
-            self._deal_with_deadlock(transaction, blocking_transaction)
+        self.waiting_upgrades.setdefault(node, {}).setdefault(transaction, self.clock())
+        self.block_on(transaction, node, lock_type, blocking_transaction)
+        return True
+
+    def _forget_upgrade(self, transaction, node: GranularityGraphNode):
+        waiting = self.waiting_upgrades.get(node)
+        if waiting is not None and waiting.pop(transaction, None) is not None and not waiting:
+            del self.waiting_upgrades[node]
+
+    def _starving_upgrader(self, transaction, node: GranularityGraphNode):
+        """
+        Returns a transaction that has waited past the priority threshold to upgrade a lock
+        on the node, one of its ancestors or one of its descendants, or None.
+        A requester holding locks in the upgrader's subtree (or above it) is not deferred:
+        the upgrader may be waiting for it, and making it wait back would be a deadlock.
+        """
+
+        if self.upgrade_priority_after is None:
+            return None
+
+        now = self.clock()
+        for upgrade_node, waiting in self.waiting_upgrades.items():
+            if not (
+                _is_ancestor_or_self(upgrade_node, node)
+                or _is_ancestor_or_self(node, upgrade_node)
+            ):
+                continue
+
+            if self._holds_locks_around(transaction, upgrade_node):
+                continue
+
+            for upgrader, since in waiting.items():
+                if upgrader is not transaction and now - since >= self.upgrade_priority_after:
+                    return upgrader
+
+        return None
+
+    @staticmethod
+    def _holds_locks_around(transaction, node: GranularityGraphNode):
+        """
+        Checks if the transaction holds a lock on the node, its ancestors or its descendants.
+        """
+
+        held_nodes = list(transaction.locks_held)
+        held_nodes += [range_lock.node for range_lock in transaction.range_locks]
+        return any(
+            _is_ancestor_or_self(node, held_node) or _is_ancestor_or_self(held_node, node)
+            for held_node in held_nodes
+        )
+
+    def _choose_victim(self, transaction, blocking_transaction):
+        """
+        Picks the deadlock victim among the two transactions of the edge that closed the cycle.
+        The one aborted more often survives (so the same transaction cannot lose forever);
+        on a tie the younger one is aborted. Returns the victim and the reason.
+        """
+
+        if transaction.abort_count != blocking_transaction.abort_count:
+            if transaction.abort_count < blocking_transaction.abort_count:
+                return transaction, "fewer_aborts"
+            return blocking_transaction, "fewer_aborts"
+
+        return (
+            Transaction.get_most_recent_transaction(transaction, blocking_transaction),
+            "most_recent",
+        )
+
+    def _lock_timeout_for(self, transaction, operation=None):
+        """
+        Returns the lock timeout of a request: the operation's, else the transaction's,
+        else the lock manager's default.
+        """
+
+        if operation is not None and operation.timeout is not None:
+            return operation.timeout
+        if transaction.lock_timeout is not None:
+            return transaction.lock_timeout
+        return self.lock_timeout
+
+    def _start_wait_timer(self, transaction):
+        """
+        Sets the deadline of a blocked transaction and schedules its timeout.
+        """
+
+        operation = (
+            transaction.pending_operations[0] if transaction.pending_operations else None
+        )
+        timeout = self._lock_timeout_for(transaction, operation)
+
+        transaction.wait_sequence += 1
+        if timeout is None:
+            transaction.wait_deadline = None
+            return
+
+        transaction.wait_deadline = self.clock() + timeout
+        heapq.heappush(
+            self.lock_timers,
+            (
+                transaction.wait_deadline,
+                next(self._timer_sequence),
+                transaction,
+                transaction.wait_sequence,
+            ),
+        )
+
+    def expire_lock_timeouts(self, now=None):
+        """
+        Aborts (or fails the request of) every transaction whose lock wait passed its deadline.
+        Timers of waits that already ended are discarded lazily. Returns the expired transactions.
+        """
+
+        if self.trace is not None:
+            self.trace.record_expire(now)
+
+        if not self.lock_timers:
+            return []
+
+        if now is None:
+            now = self.clock()
+
+        expired = []
+        while self.lock_timers and self.lock_timers[0][0] <= now:
+            _, _, transaction, wait_sequence = heapq.heappop(self.lock_timers)
+
+            if transaction.state != "blocked" or transaction.wait_sequence != wait_sequence:
+                continue  # The wait already ended
+
+            expired.append(transaction)
+            self._expire_wait(transaction)
+
+        return expired
+
+    def next_lock_deadline(self):
+        """
+        Returns the closest deadline of a pending lock wait (None if no wait can time out),
+        i.e. when `expire_lock_timeouts` has something to do next.
+        """
+
+        while self.lock_timers:
+            deadline, _, transaction, wait_sequence = self.lock_timers[0]
+            if transaction.state == "blocked" and transaction.wait_sequence == wait_sequence:
+                return deadline
+            heapq.heappop(self.lock_timers)  # The wait already ended
+
+        return None
+
+    def _expire_wait(self, transaction):
+        """
+        Ends a wait that timed out, following the configured timeout action.
+        """
+
+        node = transaction.waiting_for
+        self.metrics.record_timeout(node, transaction.waiting_lock_type)
+        if self.verbose:
+            print(f"Transaction {transaction.transaction_id} timed out waiting for {node}.")
+
+        pending_commit = (
+            transaction.pending_operations
+            and transaction.pending_operations[0].operation_type == OperationType.COMMIT
+        )
+        if self.timeout_action == "abort" or pending_commit:
+            # A commit that cannot certify is never dropped, its writes would be left half-certified
+            transaction.abort_transaction()
+            return
+
+        # Drop the waiting operation and let the transaction continue
+        self._forget_upgrade(transaction, node)
+        for blocking_id in list(self.await_graph.vertices[transaction.transaction_id]["edges"]):
+            self.await_graph.remove_edge(transaction.transaction_id, blocking_id)
+
+        if transaction.pending_operations:
+            transaction.failed_operations.append(transaction.pending_operations.pop(0))
+
+        transaction.unblock_transaction()
+        transaction.execute_operations()
+
+    def schedule_restart(self, transaction: Transaction):
+        """
+        Schedules the restart of an aborted transaction if the retry policy allows it.
+        Returns True if it will be restarted.
+        """
+
+        if self.retry_policy is None:
             return False
 
+        if not self.retry_policy.should_retry(transaction.abort_count):
+            self.metrics.record_retries_exhausted()
+            if self.verbose:
+                print(
+                    f"Transaction {transaction.transaction_id} reached the retry limit and stays aborted."
+                )
+            return False
+
+        delay = self.retry_policy.delay(transaction.abort_count)
+        heapq.heappush(
+            self.restart_timers,
+            (self.clock() + delay, next(self._timer_sequence), transaction),
+        )
+        if self.verbose:
+            print(
+                f"Transaction {transaction.transaction_id} will be restarted in {delay * 1000:.1f} ms."
+            )
+        return True
+
+    def run_restarts(self, now=None):
+        """
+        Restarts the aborted transactions whose backoff has elapsed (pass now=math.inf to
+        restart all of them). Returns the restarted transactions.
+        """
+
+        if self.trace is not None:
+            self.trace.record_restarts(now)
+
+        if not self.restart_timers:
+            return []
+
+        if now is None:
+            now = self.clock()
+
+        restarted = []
+        while self.restart_timers and self.restart_timers[0][0] <= now:
+            _, _, transaction = heapq.heappop(self.restart_timers)
+            restarted.append(transaction)
+            self.metrics.record_restart()
+            self.operations_order.append((transaction, "Restarted"))
+            transaction.restart_transaction()
+
+        return restarted
+
+    def run_restarts_after_release(self):
+        """
+        Called once a transaction freed its locks (commit or abort): restarts the transactions
+        whose backoff has elapsed, or all of them when no transaction is running any more,
+        since the backoff only keeps them from colliding again with the running ones.
+        """
+
+        if not self.restart_timers:
+            return []
+
+        return self.run_restarts(None if self.await_graph.vertices else math.inf)
+
+    def acquire_all(self, transaction: Transaction, lock_set):
+        """
+        Conservative 2PL: acquires the locks of every (node, operation type) in the lock set
+        at once, or none of them. A transaction that cannot get all of them holds nothing,
+        is not added to the wait-for graph and waits in FIFO order until a commit or abort
+        lets its whole set through.
+
+        A declared write lock is not granted next to the readers of another predeclared
+        transaction (nor a declared read lock next to its writers): certifying it would have
+        to wait for them, and two such transactions could each wait for the other's readers
+        at commit. So predeclared transactions never deadlock among themselves. A certify
+        that waits for readers that did not predeclare goes through the wait-for graph, like
+        any other certify, since those readers may in turn wait for the transaction.
+        Returns True if the locks were granted, False if the transaction is waiting.
+        """
+
+        if transaction.locks_held or transaction.declared_locks is not None:
+            raise ValueError(
+                "The lock set must be declared before the transaction acquires any lock."
+            )
+
+        transaction.declared_locks = self._canonical_lock_set(lock_set)
+
+        for node, lock_type in transaction.declared_locks:
+            self.metrics.record_request(node, lock_type)
+
+        blocking = self._try_acquire_all(transaction)
+        if blocking is True:
+            if self.verbose:
+                print(f"Transaction {transaction.transaction_id} acquired its declared lock set.")
+            return True
+
+        node, lock_type = blocking
+        self.metrics.record_block(node, lock_type)
+        transaction.block_transaction(node, lock_type)
+        if transaction not in self.lock_set_waiters:  # May be left from before a restart
+            self.lock_set_waiters.append(transaction)
+        return False
+
+    def call_with_running_transactions(self, action):
+        """
+        Calls action with the running transactions while their locks cannot change
+        (e.g. to checkpoint them) and returns its result.
+        """
+
+        return action([data["transaction"] for data in list(self.await_graph.vertices.values())])
+
+    def prepare_transaction(self, transaction):
+        """
+        Sets up the per-transaction state this manager needs on a transaction it did not
+        start itself (e.g. one restored from the write-ahead log).
+        """
+
+    def _canonical_lock_set(self, lock_set):
+        """
+        Keeps the strongest lock declared per node, drops the nodes already covered by a
+        declared ancestor and sorts the rest top-down (by depth, then name).
+        """
+
+        declared = {}
+        for node, operation_type in lock_set:
+            lock_type = Lock.get_lock_type_based_on_operation(operation_type)
+            if lock_type not in DECLARED_LOCK_STRENGTH:
+                raise ValueError(f"Cannot declare a {lock_type} lock.")
+
+            current_lock_type = declared.get(node)
+            if (
+                current_lock_type is None
+                or DECLARED_LOCK_STRENGTH[lock_type] > DECLARED_LOCK_STRENGTH[current_lock_type]
+            ):
+                declared[node] = lock_type
+
+        canonical = []
+        for node, lock_type in declared.items():
+            ancestor = node.parent
+            while ancestor is not None and not self._covers(
+                declared.get(ancestor), lock_type
+            ):
+                ancestor = ancestor.parent
+
+            if ancestor is None:
+                canonical.append((node, lock_type))
+
+        canonical.sort(key=lambda item: (_node_depth(item[0]), item[0].name))
+        return canonical
+
+    @staticmethod
+    def _covers(declared_lock_type, lock_type):
+        """
+        Checks if a declared lock type allows an operation needing lock_type.
+        """
+
+        return (
+            declared_lock_type is not None
+            and DECLARED_LOCK_STRENGTH[declared_lock_type] >= DECLARED_LOCK_STRENGTH[lock_type]
+        )
+
+    def check_declared_operation(self, transaction: Transaction, operation):
+        """
+        Raises ValueError if the operation is outside the transaction's declared lock set.
+        """
+
+        if operation.operation_type == OperationType.COMMIT:
+            return
+
+        lock_type = Lock.get_lock_type_based_on_operation(operation.operation_type)
+        declared = dict(transaction.declared_locks)
+
+        node = operation.node
+        while node is not None:
+            if self._covers(declared.get(node), lock_type):
+                return
+            node = node.parent
+
+        raise ValueError(
+            f"Transaction {transaction.transaction_id} did not declare {lock_type} on {operation.node}."
+        )
+
+    def _check_lock_set(self, transaction, lock_set):
+        """
+        Batched compatibility check of a whole lock set against the current locks, without
+        changing anything. Returns True if all of it can be granted, otherwise the first
+        conflicting (node, lock type).
+        """
+
+        for node, lock_type in lock_set:
+            if transaction in node.locks[lock_type]:
+                continue
+            if self._get_blocking_transaction(node, lock_type) is not True:
+                return node, lock_type
+            if self.range_indexes and self._range_blocker(transaction, node, lock_type):
+                return node, lock_type
+            if self._predeclared_conflict(transaction, node, lock_type):
+                return node, lock_type
+
+        return True
+
+    def _predeclared_conflict(self, transaction, node: GranularityGraphNode, lock_type):
+        """
+        Checks if another predeclared transaction reads what a declared write lock covers,
+        or writes what a declared read lock covers (locks on the node, on its ancestors
+        through front propagation, and on its descendants through intention locks).
+        """
+
+        conflicting_lock_types = CERTIFY_CONFLICTS.get(lock_type, ())
+        for conflicting_lock_type in conflicting_lock_types:
+            for holder in node.locks[conflicting_lock_type]:
+                if holder is not transaction and holder.declared_locks is not None:
+                    return True
+        return False
+
+    def _try_acquire_all(self, transaction):
+        """
+        Grants the transaction's declared lock set if it passes the batched check.
+        """
+
+        blocking = self._check_lock_set(transaction, transaction.declared_locks)
+        if blocking is not True:
+            return blocking
+
+        for node, lock_type in transaction.declared_locks:
+            self._grant_lock(transaction, node, lock_type)
+
+        return True
+
+    def retry_lock_set_waiters(self):
+        """
+        Retries the waiting lock sets in arrival order after locks were released.
+        Returns the transactions that got their locks (their operations are not run yet).
+        """
+
+        granted = []
+        still_waiting = []
+
+        for transaction in self.lock_set_waiters:
+            if transaction.state != "blocked":
+                continue  # Aborted while waiting
+
+            if self._try_acquire_all(transaction) is True:
+                if self.verbose:
+                    print(f"Transaction {transaction.transaction_id} acquired its declared lock set.")
+                transaction.unblock_transaction()
+                granted.append(transaction)
+            else:
+                still_waiting.append(transaction)
+
+        self.lock_set_waiters = still_waiting
+        return granted
+
+    def add_range_index(self, node: GranularityGraphNode):
+        """
+        Starts keeping key-range locks for the node (a table, a page...) and its descendants,
+        indexing the locks already held below it. Returns the RangeIndex.
+        """
+
+        if self.trace is not None:
+            self.trace.record_range_index(node)
+
+        index = self.range_indexes.get(node)
+        if index is not None:
+            return index
+
+        index = RangeIndex(node)
+        self.range_indexes[node] = index
+
+        for data in list(self.await_graph.vertices.values()):
+            transaction = data["transaction"]
+            for held_node, lock_type in transaction.locks_held.items():
+                if (
+                    lock_type in RANGE_CONFLICTS
+                    and held_node is not node
+                    and _is_ancestor_or_self(node, held_node)
+                ):
+                    entry = index.add(held_node, lock_type, transaction)
+                    transaction.indexed_locks.setdefault(held_node, []).append((index, entry))
+
+            for range_lock in transaction.range_locks:
+                if _is_ancestor_or_self(node, range_lock.node):
+                    key_range = (range_lock.low, range_lock.high)
+                    entry = index.add(range_lock.node, range_lock.lock_type, transaction, key_range)
+                    range_lock.entries.append((index, entry))
+
+        return index
+
+    def request_range_lock(
+        self, transaction: Transaction, node: GranularityGraphNode, key_range, operation
+    ):
+        """
+        Requests a lock on the keys low <= key < high below the node, with key_range =
+        (low, high). It conflicts only with the range and point locks on overlapping keys
+        (and, through an intention lock on the node, with locks on the node and above), and
+        blocks like request_lock.
+        """
+
+        if transaction.state == "blocked":
+            return False
+
+        low, high = key_range
+        if not low < high:
+            raise ValueError(f"Empty key range [{low}, {high}).")
+
+        lock_type = Lock.get_lock_type_based_on_operation(operation)
+        if self.verbose:
+            print(
+                f"Transaction {transaction.transaction_id} requests {lock_type} on {node} keys [{low}, {high})."
+        )
+        self.add_range_index(node)
+        self.metrics.record_request(node, lock_type)
+
+        blocking_transaction = self._range_request_blocker(transaction, node, low, high, lock_type)
+        if blocking_transaction is not None:
+            return self.block_on(transaction, node, lock_type, blocking_transaction)
+
+        range_lock = RangeLock(node, low, high, lock_type)
+        for index in self._range_indexes_for(node, include_node=True):
+            range_lock.entries.append((index, index.add(node, lock_type, transaction, key_range)))
+        transaction.range_locks.append(range_lock)
+
+        node.locks[INTENTION_LOCKS[lock_type]].add(transaction)
+        self._add_intentions(transaction, node, lock_type)
+        self.metrics.record_grant(node, lock_type)
+        return True
+
+    def certify_range_locks(self, transaction: Transaction):
+        """
+        Converts the transaction's WL ranges to CL, waiting for the readers of their keys.
+        Returns False if the transaction has to wait.
+        """
+
+        for range_lock in transaction.range_locks:
+            if range_lock.lock_type != LockType.WL:
+                continue
+
+            node = range_lock.node
+            blocking_transaction = self._range_request_blocker(
+                transaction, node, range_lock.low, range_lock.high, LockType.CL
+            )
+            if blocking_transaction is not None:
+                self.block_on(transaction, node, LockType.CL, blocking_transaction)
+                return False
+
+            range_lock.lock_type = LockType.CL
+            for _, entry in range_lock.entries:
+                entry.lock_type = LockType.CL
+            node.locks[LockType.ICL].add(transaction)
+            self._add_intentions(transaction, node, LockType.CL)
+
+        return True
+
+    def _range_request_blocker(self, transaction, node, low, high, lock_type):
+        """
+        Returns another transaction whose locks conflict with a range lock, or None.
+        """
+
+        for lock_type_held in INTENTION_CONFLICTS[INTENTION_LOCKS[lock_type]]:
+            for holder in node.locks[lock_type_held]:
+                if holder is not transaction:
+                    return holder
+
+        for index in self._range_indexes_for(node, include_node=True):
+            interval = index.interval(node, (low, high))
+            if interval is not None:
+                blocking_transaction = index.blocker(transaction, *interval, lock_type)
+                if blocking_transaction is not None:
+                    return blocking_transaction
+
+        return None
+
+    def _range_blocker(self, transaction, node: GranularityGraphNode, lock_type):
+        """
+        Returns another transaction holding a range (or point) lock on keys below the node
+        that conflicts with the requested lock, or None.
+        """
+
+        if not self.range_indexes or lock_type not in RANGE_CONFLICTS:
+            return None
+
+        for index in self._range_indexes_for(node):
+            span = index.spans.get(node)
+            if span is not None:
+                blocking_transaction = index.blocker(transaction, *span, True, lock_type)
+                if blocking_transaction is not None:
+                    return blocking_transaction
+
+        return None
+
+    def _index_lock(self, transaction, node: GranularityGraphNode, lock_type):
+        if lock_type not in RANGE_CONFLICTS:
+            return
+
+        for index in self._range_indexes_for(node):
+            entry = index.add(node, lock_type, transaction)
+            transaction.indexed_locks.setdefault(node, []).append((index, entry))
+
+    def _range_indexes_for(self, node: GranularityGraphNode, include_node=False):
+        """
+        Returns the range indexes of the node's ancestors (and of the node if asked).
+        """
+
+        indexes = []
+        ancestor = node if include_node else node.parent
+        while ancestor is not None:
+            index = self.range_indexes.get(ancestor)
+            if index is not None:
+                indexes.append(index)
+            ancestor = ancestor.parent
+        return indexes
+
     def _can_grant_lock(
         self,
         lock_type,
@@ -139,7 +971,7 @@ class LockManager:
             ):
                 return self._get_first_blocking_transaction(
                     current_locks,
-                    [LockType.WL, LockType.UL, LockType.IUL, LockType.IWL],
+                    [LockType.UL, LockType.IUL, LockType.ICL],
                 )
 
             return True  # Lock can be granted
@@ -198,6 +1030,7 @@ class LockManager:
                 LockType.IWL,
                 LockType.IUL,
                 LockType.IRL,
+                LockType.ICL,
             ]
 
         for lock_type in lock_types:
@@ -212,14 +1045,16 @@ class LockManager:
         self, transaction: Transaction, blocking_transaction: Transaction
     ):
         if self.await_graph.detect_deadlock():
-            print("Deadlock found:\n")
-            self.await_graph.display_graph()
-            print()
-            most_recent_transaction = Transaction.get_most_recent_transaction(
-                transaction, blocking_transaction
-            )
+            victim, reason = self._choose_victim(transaction, blocking_transaction)
+            self.metrics.record_deadlock(reason)
+            if self.trace is not None:
+                self.trace.record_victim(victim)
+            if self.verbose:
+                print("Deadlock found:\n")
+                self.await_graph.display_graph()
+                print()
 
-            most_recent_transaction.abort_transaction()
+            victim.abort_transaction()
 
     def release_lock(self, transaction, node: GranularityGraphNode, lock_type=None):
         """
@@ -241,14 +1076,26 @@ class LockManager:
                     node.remove_lock(transaction, lock_type)
                 del transaction.locks_held[node]
 
+            for index, entry in transaction.indexed_locks.pop(node, ()):
+                index.remove(node, entry)
+
     def release_all_locks(self, transaction):
         """
         Releases all locks held by a given transaction across all nodes.
         """
 
         for node in list(transaction.locks_held.keys()):
+            self._forget_upgrade(transaction, node)
             self.release_lock(transaction, node)
 
+        for range_lock in transaction.range_locks:
+            for index, entry in range_lock.entries:
+                index.remove(range_lock.node, entry)
+            for lock_type in (range_lock.lock_type, LockType.WL):
+                range_lock.node.locks[INTENTION_LOCKS[lock_type]].discard(transaction)
+                range_lock.node.remove_intention_locks(transaction, range_lock.node.parent, lock_type)
+        transaction.range_locks.clear()
+
     def promote_lock(
         self,
         transaction: Transaction,
@@ -268,9 +1115,8 @@ class LockManager:
 
         Lock.validate_promotion(current_lock_type, new_lock_type)
 
-        if not Lock.check_conflicting_locks(
-            current_locks, current_lock_type, new_lock_type
-        ):
+        if not self._can_promote(transaction, node, current_lock_type, new_lock_type):
+            self.metrics.record_promotion(node, new_lock_type, False)
             return False  # Cannot promote due to conflicting locks
 
         # Remove the current lock and grant the new promoted lock
@@ -278,10 +1124,29 @@ class LockManager:
         current_locks[new_lock_type].add(transaction)
         transaction.locks_held[node] = new_lock_type
 
-        node.change_lock(transaction, current_lock_type, new_lock_type)
+        self._propagate_lock(transaction, node, new_lock_type, current_lock_type)
+        self.metrics.record_promotion(node, new_lock_type, True)
+        if self.wal is not None:
+            self.wal.log_grant(transaction, node, new_lock_type)
+        for _, entry in transaction.indexed_locks.get(node, ()):
+            entry.lock_type = new_lock_type
+        if self.waiting_upgrades:
+            self._forget_upgrade(transaction, node)
 
         return True
 
+    def _can_promote(
+        self, transaction, node: GranularityGraphNode, current_lock_type, new_lock_type
+    ):
+        """
+        Checks a promotion against the other transactions' locks on the node and its keys.
+        """
+
+        return (
+            Lock.check_conflicting_locks(node.locks, current_lock_type, new_lock_type, transaction)
+            and self._range_blocker(transaction, node, new_lock_type) is None
+        )
+
     def print_schedule_order(self):
         for transaction, operation in self.operations_order:
             if isinstance(operation, str):
@@ -293,3 +1158,27 @@ class LockManager:
 
     def __repr__(self):
         return f"LockManager({self.locks})"
+
+
+def deadline_order(transaction):
+    """
+    Sort key that puts the waiters with the closest deadline first (no deadline goes last).
+    """
+
+    return (transaction.wait_deadline is None, transaction.wait_deadline or 0)
+
+
+def _is_ancestor_or_self(ancestor: GranularityGraphNode, node: GranularityGraphNode):
+    while node is not None:
+        if node is ancestor:
+            return True
+        node = node.parent
+    return False
+
+
+def _node_depth(node: GranularityGraphNode):
+    depth = 0
+    while node.parent is not None:
+        node = node.parent
+        depth += 1
+    return depth
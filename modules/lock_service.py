@@ -0,0 +1,501 @@
+import asyncio
+import itertools
+import logging
+import math
+import struct
+
+from modules.lock import Lock, LockType
+from modules.async_lock_manager import AsyncLockManager
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.await_graph import Graph
+from modules.operation import Operation, OperationType
+from modules.errors import DeadlockVictimError, LockTimeoutError
+
+
+# Every frame is a header followed by `length` bytes of payload. Requests carry an opcode,
+# responses echo the request id with a status instead.
+HEADER = struct.Struct("!IIB")  # payload length, request id, opcode / status
+TRANSACTION_ID = struct.Struct("!I")
+LOCK_REQUEST = struct.Struct("!IBd")  # transaction id, mode, timeout (NaN = server default)
+MAX_PAYLOAD = 64 * 1024
+
+BEGIN, LOCK, PROMOTE, COMMIT, ABORT = range(1, 6)
+OK, DEADLOCK, TIMEOUT, ERROR = range(4)
+
+OPERATION_CODES = [OperationType.READ, OperationType.UPDATE, OperationType.WRITE]
+PROMOTION_CODES = [LockType.UL, LockType.WL]
+PROMOTION_OPERATIONS = {LockType.UL: OperationType.UPDATE, LockType.WL: OperationType.WRITE}
+
+logger = logging.getLogger(__name__)
+
+
+def _frame(request_id, code, payload=b""):
+    return HEADER.pack(len(payload), request_id, code) + payload
+
+
+async def _read_frame(reader):
+    """
+    Reads one frame. Raises asyncio.IncompleteReadError when the peer closes the connection.
+    """
+
+    length, request_id, code = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise ConnectionError(f"Frame of {length} bytes is too large.")
+
+    payload = await reader.readexactly(length) if length else b""
+    return request_id, code, payload
+
+
+class _FrameWriter:
+    def __init__(self, writer):
+        """
+        Coalesces the frames written during one event loop iteration into a single write.
+        """
+
+        self.writer = writer
+        self.buffer = bytearray()
+        self.flush_scheduled = False
+
+    def send(self, request_id, code, payload=b""):
+        self.buffer += _frame(request_id, code, payload)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        self.flush_scheduled = False
+        if self.buffer and not self.writer.is_closing():
+            self.writer.write(bytes(self.buffer))
+        self.buffer.clear()
+
+
+class LockService:
+    def __init__(self, lock_manager: AsyncLockManager, host="127.0.0.1", port=0):
+        """
+        Serves an AsyncLockManager over TCP with a binary protocol (see HEADER).
+
+        Requests are pipelined: each one runs as its own task, so a lock request that waits
+        does not hold up the rest of the connection, while the requests of one transaction
+        still run in the order they were sent. Replies written in the same loop iteration go
+        out in one write. A transaction belongs to the connection that began it: requests for
+        it from any other connection are rejected, and it is aborted if its connection closes
+        while it is still running. Unexpected failures are logged and answered with ERROR.
+        Port 0 picks a free port, available as `port` once started.
+        """
+
+        self.lock_manager = lock_manager
+        self.host = host
+        self.port = port
+        self.server = None
+        self.transactions = {}  # transaction_id -> Transaction
+        self.nodes = {}  # node name -> GranularityGraphNode
+
+        stack = [lock_manager.granularity_graph.root]
+        while stack:
+            node = stack.pop()
+            if node.name in self.nodes:
+                raise ValueError(f"Duplicate node name {node.name}.")
+            self.nodes[node.name] = node
+            stack.extend(node.children)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _serve(self, reader, writer):
+        frames = _FrameWriter(writer)
+        owned = set()  # Transactions begun on this connection and not finished yet
+        tails = {}  # transaction_id -> task of its last request
+        tasks = set()
+
+        try:
+            while True:
+                request_id, opcode, payload = await _read_frame(reader)
+
+                if opcode == BEGIN:
+                    try:
+                        transaction = self.lock_manager.begin()
+                    except Exception as error:
+                        _internal_error(frames, request_id, opcode, error)
+                        continue
+                    self.transactions[transaction.transaction_id] = transaction
+                    owned.add(transaction)
+                    frames.send(request_id, OK, TRANSACTION_ID.pack(transaction.transaction_id))
+                    continue
+
+                try:
+                    transaction_id = TRANSACTION_ID.unpack_from(payload)[0]
+                    if opcode == ABORT:
+                        # Not queued behind the transaction's pending requests: it cancels them
+                        self._abort(transaction_id, owned)
+                        frames.send(request_id, OK)
+                        continue
+                    handler = self._handler(opcode, payload, owned)
+                except (ValueError, KeyError, struct.error) as error:
+                    frames.send(request_id, ERROR, str(error).encode())
+                    continue
+                except Exception as error:
+                    _internal_error(frames, request_id, opcode, error)
+                    continue
+
+                task = asyncio.create_task(
+                    self._run(handler, tails.get(transaction_id), frames, request_id, opcode)
+                )
+                tails[transaction_id] = task
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(
+                    lambda task, transaction_id=transaction_id: tails.get(transaction_id) is task
+                    and tails.pop(transaction_id)
+                )
+
+                if writer.transport.get_write_buffer_size() > MAX_PAYLOAD:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for transaction in list(owned):
+                if transaction.state not in ("committed", "aborted"):
+                    self.lock_manager.abort(transaction)
+                self.transactions.pop(transaction.transaction_id, None)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    def _handler(self, opcode, payload, owned):
+        """
+        Decodes a LOCK, PROMOTE or COMMIT request into a coroutine function running it.
+        """
+
+        if opcode == COMMIT:
+            transaction = self._transaction(TRANSACTION_ID.unpack_from(payload)[0], owned)
+            return lambda: self._commit(transaction, owned)
+
+        if opcode not in (LOCK, PROMOTE):
+            raise ValueError(f"Unknown opcode {opcode}.")
+
+        transaction_id, mode, timeout = LOCK_REQUEST.unpack_from(payload)
+        transaction = self._transaction(transaction_id, owned)
+        node_name = payload[LOCK_REQUEST.size:].decode()
+        node = self.nodes.get(node_name)
+        if node is None:
+            raise ValueError(f"Unknown node {node_name}.")
+        timeout = None if math.isnan(timeout) else timeout
+
+        codes = OPERATION_CODES if opcode == LOCK else PROMOTION_CODES
+        if mode >= len(codes):
+            raise ValueError(f"Unknown lock mode {mode}.")
+
+        if opcode == LOCK:
+            operation_type = OPERATION_CODES[mode]
+            return lambda: self.lock_manager.acquire(transaction, node, operation_type, timeout)
+
+        lock_type = PROMOTION_CODES[mode]
+        return lambda: self._promote(transaction, node, lock_type, timeout)
+
+    def _transaction(self, transaction_id, owned):
+        transaction = self.transactions.get(transaction_id)
+        if transaction is None:
+            raise ValueError(f"Unknown transaction {transaction_id}.")
+        if transaction not in owned:
+            raise ValueError(f"Transaction {transaction_id} belongs to another connection.")
+        return transaction
+
+    async def _run(self, handler, previous, frames, request_id, opcode):
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        try:
+            await handler()
+        except DeadlockVictimError:
+            frames.send(request_id, DEADLOCK)
+        except LockTimeoutError:
+            frames.send(request_id, TIMEOUT)
+        except ValueError as error:
+            frames.send(request_id, ERROR, str(error).encode())
+        except Exception as error:
+            _internal_error(frames, request_id, opcode, error)
+        else:
+            frames.send(request_id, OK)
+
+    async def _promote(self, transaction, node, lock_type, timeout):
+        if node not in transaction.locks_held:
+            raise ValueError("Transaction does not hold a lock on this resource.")
+        Lock.validate_promotion(transaction.locks_held[node], lock_type)
+
+        operation = Operation(PROMOTION_OPERATIONS[lock_type], node)
+        await self.lock_manager._acquire(transaction, node, lock_type, timeout, operation)
+
+    async def _commit(self, transaction, owned):
+        if transaction.state == "aborted":
+            raise DeadlockVictimError(transaction)
+        if transaction.state == "committed":
+            raise ValueError(f"Transaction {transaction.transaction_id} already committed.")
+
+        await self.lock_manager.commit(transaction)
+        self.transactions.pop(transaction.transaction_id, None)
+        owned.discard(transaction)
+
+    def _abort(self, transaction_id, owned):
+        transaction = self._transaction(transaction_id, owned)
+        self.lock_manager.abort(transaction)
+        self.transactions.pop(transaction_id, None)
+        owned.discard(transaction)
+
+
+def _internal_error(frames, request_id, opcode, error):
+    """
+    Answers a request that failed unexpectedly with ERROR, keeping the connection open.
+    """
+
+    logger.exception(
+        "Lock service request %d (opcode %d) failed.", request_id, opcode, exc_info=error
+    )
+    frames.send(request_id, ERROR, f"Internal error: {error}".encode())
+
+
+class RemoteTransaction:
+    def __init__(self, client, transaction_id, generation):
+        """
+        Client-side handle of a transaction running in a LockService.
+        """
+
+        self.client = client
+        self.transaction_id = transaction_id
+        self.generation = generation  # Connection it was begun on
+
+    async def lock(self, node_name, operation_type: OperationType, timeout=None):
+        return await self.client.lock(self, node_name, operation_type, timeout)
+
+    async def promote(self, node_name, lock_type: LockType, timeout=None):
+        return await self.client.promote(self, node_name, lock_type, timeout)
+
+    async def commit(self):
+        return await self.client.commit(self)
+
+    async def abort(self):
+        return await self.client.abort(self)
+
+    def __repr__(self):
+        return f"RemoteTransaction({self.transaction_id})"
+
+
+class LockClient:
+    def __init__(self, host, port, reconnect_attempts=3, reconnect_delay=0.05):
+        """
+        Connection to a LockService. Requests can be pipelined from many tasks at once; the
+        ones issued in the same event loop iteration are sent in one write.
+
+        A lost connection fails the requests in flight with ConnectionError and is reopened
+        by the next request (up to `reconnect_attempts` times, backing off from
+        `reconnect_delay` seconds). The server aborts the transactions of a lost connection,
+        so their handles keep raising ConnectionError.
+        """
+
+        self.host = host
+        self.port = port
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.frames = None
+        self.reader_task = None
+        self.generation = 0
+        self.request_ids = itertools.count(1)
+        self.pending = {}  # request id -> future of (status, payload)
+        self.connecting = None
+
+    async def connect(self):
+        if self.frames is not None and not self.frames.writer.is_closing():
+            return
+        if self.connecting is None:
+            self.connecting = asyncio.ensure_future(self._connect())
+        try:
+            await asyncio.shield(self.connecting)
+        finally:
+            self.connecting = None
+
+    async def _connect(self):
+        delay = self.reconnect_delay
+        for attempt in range(self.reconnect_attempts + 1):
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                break
+            except OSError:
+                if attempt == self.reconnect_attempts:
+                    raise
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        self.generation += 1
+        self.frames = _FrameWriter(writer)
+        self.reader_task = asyncio.create_task(self._read_responses(reader, self.frames))
+
+    async def _read_responses(self, reader, frames):
+        try:
+            while True:
+                request_id, status, payload = await _read_frame(reader)
+                future = self.pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result((status, payload))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            frames.writer.close()
+            if self.frames is frames:
+                self.frames = None
+            pending, self.pending = self.pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to the lock service lost."))
+
+    async def _request(self, opcode, payload=b"", transaction=None):
+        await self.connect()
+        if transaction is not None and transaction.generation != self.generation:
+            raise ConnectionError(
+                f"Transaction {transaction.transaction_id} was lost with its connection."
+            )
+
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.frames.send(request_id, opcode, payload)
+
+        status, payload = await future
+        if status == DEADLOCK:
+            raise DeadlockVictimError(transaction)
+        if status == TIMEOUT:
+            raise LockTimeoutError(transaction, None)
+        if status == ERROR:
+            raise ValueError(payload.decode())
+        return payload
+
+    async def begin(self):
+        payload = await self._request(BEGIN)
+        return RemoteTransaction(self, TRANSACTION_ID.unpack(payload)[0], self.generation)
+
+    async def lock(self, transaction, node_name, operation_type: OperationType, timeout=None):
+        """
+        Acquires (or promotes to) the lock needed by the operation on the named node.
+        """
+
+        mode = OPERATION_CODES.index(operation_type)
+        await self._lock_request(LOCK, transaction, node_name, mode, timeout)
+        return True
+
+    async def promote(self, transaction, node_name, lock_type: LockType, timeout=None):
+        """
+        Promotes the lock the transaction holds on the named node to UL or WL.
+        """
+
+        mode = PROMOTION_CODES.index(lock_type)
+        await self._lock_request(PROMOTE, transaction, node_name, mode, timeout)
+        return True
+
+    async def _lock_request(self, opcode, transaction, node_name, mode, timeout):
+        payload = LOCK_REQUEST.pack(
+            transaction.transaction_id, mode, math.nan if timeout is None else timeout
+        )
+        try:
+            await self._request(opcode, payload + node_name.encode(), transaction)
+        except LockTimeoutError:
+            raise LockTimeoutError(transaction, node_name) from None
+
+    async def commit(self, transaction):
+        await self._request(COMMIT, TRANSACTION_ID.pack(transaction.transaction_id), transaction)
+
+    async def abort(self, transaction):
+        await self._request(ABORT, TRANSACTION_ID.pack(transaction.transaction_id), transaction)
+
+    async def close(self):
+        if self.frames is not None:
+            self.frames.flush()
+            self.frames.writer.close()
+        if self.reader_task is not None:
+            await self.reader_task
+            self.reader_task = None
+
+
+class LockClientPool:
+    def __init__(self, host, port, size=4, **client_options):
+        """
+        Pool of LockClient connections. Each transaction stays on the connection it was
+        begun on; new transactions go to the connection with the fewest requests in flight.
+        """
+
+        if size < 1:
+            raise ValueError("The pool needs at least one connection.")
+
+        self.clients = [LockClient(host, port, **client_options) for _ in range(size)]
+
+    async def begin(self):
+        client = min(self.clients, key=lambda client: len(client.pending))
+        return await client.begin()
+
+    async def close(self):
+        for client in self.clients:
+            await client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+if __name__ == "__main__":
+    import io
+    from contextlib import redirect_stdout
+
+    granularity_graph = GranularityGraph()
+    table_node = GranularityGraphNode("Table1")
+    granularity_graph.add_node(granularity_graph.root, table_node)
+    for index in range(1, 5):
+        granularity_graph.add_node(table_node, GranularityGraphNode(f"Tuple{index}"))
+
+    lock_manager = AsyncLockManager(granularity_graph, Graph())
+
+    async def client(pool, first, second):
+        transaction = await pool.begin()
+        try:
+            await transaction.lock(first, OperationType.WRITE)
+            await asyncio.sleep(0.01)
+            await transaction.lock(second, OperationType.WRITE, timeout=1)
+            await transaction.commit()
+        except DeadlockVictimError as error:
+            print(error)
+
+    async def pipelined(pool):
+        # Four requests of one transaction sent in a single write, answered in order
+        transaction = await pool.begin()
+        await asyncio.gather(
+            transaction.lock("Tuple3", OperationType.READ),
+            transaction.lock("Tuple4", OperationType.READ),
+            transaction.promote("Tuple3", LockType.WL),
+            transaction.commit(),
+        )
+
+    async def main():
+        async with LockService(lock_manager) as service:
+            async with LockClientPool(service.host, service.port, size=2) as pool:
+                # Both clients write two tuples in opposite order: one becomes a deadlock victim
+                await asyncio.gather(
+                    client(pool, "Tuple1", "Tuple2"), client(pool, "Tuple2", "Tuple1")
+                )
+                await pipelined(pool)
+
+    with redirect_stdout(io.StringIO()):
+        asyncio.run(main())
+
+    lock_manager.print_schedule_order()
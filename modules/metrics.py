@@ -0,0 +1,216 @@
+from collections import defaultdict
+
+
+class LockMetrics:
+    def __init__(self):
+        """
+        Lock contention counters, keyed by (node, lock type).
+
+        Updates are plain dictionary increments so they can stay enabled on the hot path;
+        node names and lock type names are only resolved when a snapshot is taken.
+        """
+
+        self.requests = defaultdict(int)
+        self.grants = defaultdict(int)
+        self.blocks = defaultdict(int)
+        self.waits = defaultdict(int)
+        self.wait_time = defaultdict(float)
+        self.promotions = defaultdict(int)  # (node, lock type) -> successful promotions
+        self.failed_promotions = defaultdict(int)
+        self.timeouts = defaultdict(int)
+        self.deadlocks = 0
+        self.restarts = 0
+        self.retries_exhausted = 0
+        self.victim_reasons = defaultdict(int)
+        self.await_graph_vertices = 0
+        self.await_graph_edges = 0
+        self.peak_await_graph_vertices = 0
+        self.peak_await_graph_edges = 0
+
+    def record_request(self, node, lock_type):
+        self.requests[node, lock_type] += 1
+
+    def record_grant(self, node, lock_type):
+        self.grants[node, lock_type] += 1
+
+    def record_block(self, node, lock_type):
+        self.blocks[node, lock_type] += 1
+
+    def record_wait(self, node, lock_type, seconds):
+        self.waits[node, lock_type] += 1
+        self.wait_time[node, lock_type] += seconds
+
+    def record_timeout(self, node, lock_type):
+        self.timeouts[node, lock_type] += 1
+
+    def record_promotion(self, node, lock_type, success):
+        if success:
+            self.promotions[node, lock_type] += 1
+        else:
+            self.failed_promotions[node, lock_type] += 1
+
+    def record_deadlock(self, victim_reason):
+        self.deadlocks += 1
+        self.victim_reasons[victim_reason] += 1
+
+    def record_restart(self):
+        self.restarts += 1
+
+    def record_retries_exhausted(self):
+        self.retries_exhausted += 1
+
+    def observe_await_graph(self, await_graph):
+        """
+        Updates the current and peak size of the wait-for graph.
+        """
+
+        self.await_graph_vertices = len(await_graph.vertices)
+        self.await_graph_edges = await_graph.edge_count
+
+        if self.await_graph_vertices > self.peak_await_graph_vertices:
+            self.peak_await_graph_vertices = self.await_graph_vertices
+        if self.await_graph_edges > self.peak_await_graph_edges:
+            self.peak_await_graph_edges = self.await_graph_edges
+
+    def _per_node(self):
+        """
+        Groups the per (node, lock type) counters by node name and lock type name.
+        """
+
+        counters = {
+            "requests": self.requests,
+            "grants": self.grants,
+            "blocks": self.blocks,
+            "waits": self.waits,
+            "wait_time": self.wait_time,
+            "promotions": self.promotions,
+            "failed_promotions": self.failed_promotions,
+            "timeouts": self.timeouts,
+        }
+
+        nodes = {}
+        for counter_name, counter in counters.items():
+            for (node, lock_type), value in list(counter.items()):
+                modes = nodes.setdefault(node.name, {})
+                mode = modes.setdefault(lock_type.name, dict.fromkeys(counters, 0))
+                mode[counter_name] += value
+
+        return nodes
+
+    def snapshot(self):
+        """
+        Returns a plain dictionary copy of all the counters.
+        """
+
+        return {
+            "nodes": self._per_node(),
+            "deadlocks": self.deadlocks,
+            "restarts": self.restarts,
+            "retries_exhausted": self.retries_exhausted,
+            "victim_reasons": dict(self.victim_reasons),
+            "await_graph": {
+                "vertices": self.await_graph_vertices,
+                "edges": self.await_graph_edges,
+                "peak_vertices": self.peak_await_graph_vertices,
+                "peak_edges": self.peak_await_graph_edges,
+            },
+        }
+
+    def top_hot_nodes(self, n=10):
+        """
+        Returns the n nodes with the most blocked requests (ties broken by total wait time)
+        as (node name, totals) pairs.
+        """
+
+        totals = {}
+        for node_name, modes in self._per_node().items():
+            node_totals = totals.setdefault(node_name, {})
+            for mode in modes.values():
+                for counter_name, value in mode.items():
+                    node_totals[counter_name] = node_totals.get(counter_name, 0) + value
+
+        ranking = sorted(
+            totals.items(),
+            key=lambda item: (item[1]["blocks"], item[1]["wait_time"], item[1]["requests"]),
+            reverse=True,
+        )
+
+        return ranking[:n]
+
+    def print_hot_nodes(self, n=10):
+        """
+        Prints the top-N hot nodes report.
+        """
+
+        hot_nodes = self.top_hot_nodes(n)
+        if not hot_nodes:
+            print("No lock activity recorded.")
+            return
+
+        for node_name, totals in hot_nodes:
+            print(
+                f"{node_name}: {totals['requests']} requests, {totals['grants']} grants, "
+                f"{totals['blocks']} blocks, {totals['wait_time'] * 1000:.3f} ms waiting"
+            )
+
+    def to_prometheus(self, prefix="lock"):
+        """
+        Exports the counters in the Prometheus text exposition format.
+        """
+
+        lines = []
+        nodes = self._per_node()
+
+        per_mode = [
+            ("requests_total", "requests", "counter", "Lock requests per node and mode."),
+            ("grants_total", "grants", "counter", "Granted locks per node and mode."),
+            ("blocks_total", "blocks", "counter", "Blocked lock requests per node and mode."),
+            ("waits_total", "waits", "counter", "Finished waits per node and mode."),
+            ("wait_seconds_total", "wait_time", "counter", "Time spent blocked per node and mode."),
+            ("promotions_total", "promotions", "counter", "Successful promotions per node and target mode."),
+            ("promotion_failures_total", "failed_promotions", "counter", "Failed promotions per node and target mode."),
+            ("timeouts_total", "timeouts", "counter", "Lock waits that hit their deadline per node and mode."),
+        ]
+
+        for metric, counter_name, metric_type, description in per_mode:
+            lines.append(f"# HELP {prefix}_{metric} {description}")
+            lines.append(f"# TYPE {prefix}_{metric} {metric_type}")
+            for node_name, modes in nodes.items():
+                for mode_name, mode in modes.items():
+                    if mode[counter_name]:
+                        labels = f'node="{_escape_label(node_name)}",mode="{mode_name}"'
+                        lines.append(f"{prefix}_{metric}{{{labels}}} {mode[counter_name]}")
+
+        lines.append(f"# HELP {prefix}_deadlocks_total Detected deadlocks.")
+        lines.append(f"# TYPE {prefix}_deadlocks_total counter")
+        lines.append(f"{prefix}_deadlocks_total {self.deadlocks}")
+
+        lines.append(f"# HELP {prefix}_restarts_total Aborted transactions restarted automatically.")
+        lines.append(f"# TYPE {prefix}_restarts_total counter")
+        lines.append(f"{prefix}_restarts_total {self.restarts}")
+
+        lines.append(f"# HELP {prefix}_retries_exhausted_total Transactions left aborted after the retry cap.")
+        lines.append(f"# TYPE {prefix}_retries_exhausted_total counter")
+        lines.append(f"{prefix}_retries_exhausted_total {self.retries_exhausted}")
+
+        lines.append(f"# HELP {prefix}_deadlock_victims_total Aborted deadlock victims per reason.")
+        lines.append(f"# TYPE {prefix}_deadlock_victims_total counter")
+        for reason, value in self.victim_reasons.items():
+            lines.append(f'{prefix}_deadlock_victims_total{{reason="{_escape_label(reason)}"}} {value}')
+
+        gauges = [
+            ("await_graph_vertices", self.await_graph_vertices, "Current wait-for graph vertices."),
+            ("await_graph_edges", self.await_graph_edges, "Current wait-for graph edges."),
+            ("await_graph_peak_vertices", self.peak_await_graph_vertices, "Peak wait-for graph vertices."),
+            ("await_graph_peak_edges", self.peak_await_graph_edges, "Peak wait-for graph edges."),
+        ]
+        for metric, value, description in gauges:
+            lines.append(f"# HELP {prefix}_{metric} {description}")
+            lines.append(f"# TYPE {prefix}_{metric} gauge")
+            lines.append(f"{prefix}_{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
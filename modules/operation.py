@@ -9,9 +9,11 @@ class OperationType(Enum):
 
 
 class Operation:
-    def __init__(self, operation_type: OperationType, node):
+    def __init__(self, operation_type: OperationType, node, timeout=None, key_range=None):
         """
         Initializes an operation with a type and the node it operates on.
+        `timeout` optionally bounds how long (in seconds) its lock request may wait.
+        `key_range` = (low, high) restricts it to the keys low <= key < high below the node.
         """
 
         if not isinstance(operation_type, OperationType):
@@ -21,8 +23,12 @@ class Operation:
 
         self.operation_type = operation_type
         self.node = node
+        self.timeout = timeout
+        self.key_range = key_range
 
     def __repr__(self):
+        if self.key_range is not None:
+            return f"Operation({self.operation_type.value}, {self.node}, [{self.key_range[0]}, {self.key_range[1]}))"
         return f"Operation({self.operation_type.value}, {self.node})"
 
 
@@ -0,0 +1,212 @@
+from modules.lock_manager import LockManager
+from modules.transaction import Transaction
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.await_graph import Graph
+from modules.operation import OperationType
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+        self.rank = {}
+
+    def add(self, item):
+        """
+        Adds an item as its own set if it is not known yet.
+        """
+
+        if item not in self.parent:
+            self.parent[item] = item
+            self.rank[item] = 0
+
+    def find(self, item):
+        """
+        Returns the representative of the set containing the item (with path halving).
+        """
+
+        self.add(item)
+        parent = self.parent
+
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+
+        return item
+
+    def union(self, first, second):
+        """
+        Merges the sets containing both items (union by rank).
+        """
+
+        first_root = self.find(first)
+        second_root = self.find(second)
+
+        if first_root == second_root:
+            return first_root
+
+        if self.rank[first_root] < self.rank[second_root]:
+            first_root, second_root = second_root, first_root
+
+        self.parent[second_root] = first_root
+        if self.rank[first_root] == self.rank[second_root]:
+            self.rank[first_root] += 1
+
+        return first_root
+
+
+def partition_schedule(operations):
+    """
+    Splits a schedule into independent components.
+
+    `operations` is a list of (transaction_key, node, operation_type) tuples, where node is
+    None for COMMIT. Two transactions end up in the same component when they access the same
+    node or nodes in an ancestor/descendant relation, since only those can conflict.
+    Returns a list of components, each being the list of input indexes in schedule order.
+    """
+
+    union_find = UnionFind()
+    accessed_nodes = set()
+
+    for transaction_key, node, _ in operations:
+        union_find.add(("transaction", transaction_key))
+        if node is not None:
+            accessed_nodes.add(node)
+
+    for transaction_key, node, _ in operations:
+        if node is None:
+            continue
+
+        union_find.union(("transaction", transaction_key), ("node", node))
+
+        # Link the node with every accessed ancestor (descendants link themselves on their own walk)
+        ancestor = node.parent
+        while ancestor is not None:
+            if ancestor in accessed_nodes:
+                union_find.union(("node", node), ("node", ancestor))
+            ancestor = ancestor.parent
+
+    components = {}
+    for index, (transaction_key, _, _) in enumerate(operations):
+        root = union_find.find(("transaction", transaction_key))
+        components.setdefault(root, []).append(index)
+
+    return list(components.values())
+
+
+class PartitionedScheduleRunner:
+    def __init__(self, granularity_graph: GranularityGraph):
+        """
+        Runs the independent components of a schedule, each one with its own lock manager
+        and wait-for graph, and merges the results into one global schedule.
+
+        Components run one after the other. They still share the nodes' lock tables, which
+        is safe only because no two components touch related nodes: the intention locks they
+        leave on common ancestors are compatible with each other.
+        """
+
+        self.granularity_graph = granularity_graph
+        self.lock_managers = []
+        self.transactions = {}
+        self.operations_order = []
+
+    def run(self, operations):
+        """
+        Executes the schedule and returns the merged operations order.
+        """
+
+        components = partition_schedule(operations)
+
+        jobs = []
+        component_managers = {}
+        for component in components:
+            lock_manager = LockManager(self.granularity_graph, Graph())
+            self.lock_managers.append(lock_manager)
+
+            for index in component:
+                component_managers[operations[index][0]] = lock_manager
+
+            jobs.append((lock_manager, component))
+
+        # Transactions are created up front (single thread) so ids and timestamps follow input order
+        for transaction_key, _, _ in operations:
+            if transaction_key not in self.transactions:
+                lock_manager = component_managers[transaction_key]
+                self.transactions[transaction_key] = Transaction(
+                    lock_manager, lock_manager.await_graph
+                )
+
+        results = [self._run_component(operations, *job) for job in jobs]
+
+        self.operations_order = self._merge(results)
+        return self.operations_order
+
+    def _run_component(self, operations, lock_manager, component):
+        """
+        Runs one component and tags every produced entry with the input index that caused it.
+        """
+
+        tagged_entries = []
+
+        for index in component:
+            transaction_key, node, operation_type = operations[index]
+            transaction = self.transactions[transaction_key]
+
+            produced_before = len(lock_manager.operations_order)
+            transaction.create_operation(node, operation_type)
+
+            for entry in lock_manager.operations_order[produced_before:]:
+                tagged_entries.append((index, len(tagged_entries), entry))
+
+        return tagged_entries
+
+    def _merge(self, results):
+        """
+        Interleaves the component schedules by input position. Components share no conflicting
+        nodes, so any interleaving that keeps each component's own order is a valid schedule.
+        """
+
+        merged = [tagged for result in results for tagged in result]
+        merged.sort(key=lambda tagged: (tagged[0], tagged[1]))
+
+        return [entry for _, _, entry in merged]
+
+    def print_schedule_order(self):
+        for transaction, operation in self.operations_order:
+            if isinstance(operation, str):
+                print(f"Transaction {transaction.transaction_id} - {operation}")
+            else:
+                print(
+                    f"Transaction {transaction.transaction_id} - {operation.operation_type.value} - {operation.node.name}"
+                )
+
+
+if __name__ == "__main__":
+    granularity_graph = GranularityGraph()
+    area_node = GranularityGraphNode("Area1")
+    table_node1 = GranularityGraphNode("Table1")
+    table_node2 = GranularityGraphNode("Table2")
+    tuple_node1 = GranularityGraphNode("Tuple1")
+    tuple_node2 = GranularityGraphNode("Tuple2")
+
+    granularity_graph.add_node(granularity_graph.root, area_node)
+    granularity_graph.add_node(area_node, table_node1)
+    granularity_graph.add_node(area_node, table_node2)
+    granularity_graph.add_node(table_node1, tuple_node1)
+    granularity_graph.add_node(table_node2, tuple_node2)
+
+    schedule = [
+        ("t1", tuple_node1, OperationType.WRITE),
+        ("t2", tuple_node2, OperationType.WRITE),
+        ("t3", table_node1, OperationType.READ),
+        ("t1", None, OperationType.COMMIT),
+        ("t2", None, OperationType.COMMIT),
+        ("t3", None, OperationType.COMMIT),
+    ]
+
+    print(f"Components: {partition_schedule(schedule)}")
+
+    runner = PartitionedScheduleRunner(granularity_graph)
+    runner.run(schedule)
+
+    print("\nSchedule of operations:")
+    runner.print_schedule_order()
@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+from functools import wraps
+
+
+PHASES = [
+    "compatibility_check",
+    "intention_backpropagation",
+    "front_propagation",
+    "wait_graph_edge",
+    "deadlock_detection",
+    "release",
+]
+
+
+class PhaseHistogram:
+    def __init__(self):
+        """
+        Log2 histogram of durations in nanoseconds (bucket b holds durations below 2 ** b).
+        """
+
+        self.clear()
+
+    def clear(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = 0
+
+    def add(self, duration):
+        bucket = duration.bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += duration
+        if self.minimum is None or duration < self.minimum:
+            self.minimum = duration
+        if duration > self.maximum:
+            self.maximum = duration
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the given percentile.
+        """
+
+        if not self.count:
+            return 0
+
+        target = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(2**bucket, self.maximum)
+
+        return self.maximum
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ns": self.total,
+            "mean_ns": self.total / self.count if self.count else 0,
+            "min_ns": self.minimum or 0,
+            "max_ns": self.maximum,
+            "p50_ns": self.percentile(0.50),
+            "p99_ns": self.percentile(0.99),
+            "buckets": {str(2**bucket): count for bucket, count in sorted(self.buckets.items())},
+        }
+
+
+class PhaseProfiler:
+    def __init__(self):
+        """
+        Splits the time spent in lock requests into phases.
+
+        The profiler wraps the methods the lock manager lists for each phase in its
+        PROFILED_PHASES, on that manager instance only, while it is enabled and restores the
+        originals when disabled, so the lock manager runs its unmodified code (no checks,
+        no timers) when profiling is off and other managers are never measured. It can be
+        used from several threads at once.
+        """
+
+        self.histograms = {phase: PhaseHistogram() for phase in PHASES}
+        self._patches = []
+        self._depth = threading.local()  # Per thread: phase -> calls in progress
+        self._histograms_lock = threading.Lock()
+
+    def _timed(self, phase, function):
+        """
+        Wraps a function so its outermost call is recorded in the phase histogram.
+        """
+
+        histogram = self.histograms[phase]
+        depth = self._depth
+        histograms_lock = self._histograms_lock
+        clock = time.perf_counter_ns
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            # A phase can call itself (or another method of the phase), only the outermost
+            # call is timed
+            if getattr(depth, phase, 0):
+                return function(*args, **kwargs)
+
+            setattr(depth, phase, 1)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                setattr(depth, phase, 0)
+                with histograms_lock:
+                    histogram.add(elapsed)
+
+        return wrapper
+
+    def _patch(self, target, name, phase):
+        original = target.__dict__.get(name)
+        self._patches.append((target, name, original))
+        setattr(target, name, self._timed(phase, getattr(target, name)))
+
+    def enable(self, lock_manager):
+        """
+        Starts timing the phases of the given lock manager.
+        """
+
+        if self._patches:
+            raise ValueError("Profiler is already enabled.")
+
+        for phase, names in lock_manager.PROFILED_PHASES.items():
+            for name in names:
+                target = lock_manager
+                if name.startswith("await_graph."):
+                    target = lock_manager.await_graph
+                    name = name[len("await_graph."):]
+                self._patch(target, name, phase)
+
+        return self
+
+    def disable(self):
+        """
+        Restores the original methods.
+        """
+
+        for target, name, original in reversed(self._patches):
+            if original is None:
+                delattr(target, name)  # Instance patch, fall back to the class method
+            else:
+                setattr(target, name, original)
+
+        self._patches = []
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.clear()
+
+    def to_dict(self):
+        return {phase: histogram.to_dict() for phase, histogram in self.histograms.items()}
+
+    def dump(self, path):
+        """
+        Writes the phase histograms to a JSON file.
+        """
+
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def print_summary(self):
+        for phase, histogram in self.histograms.items():
+            print(
+                f"{phase}: {histogram.count} calls, {histogram.total / 1e6:.3f} ms total, "
+                f"p50 {histogram.percentile(0.50)} ns, p99 {histogram.percentile(0.99)} ns"
+            )
@@ -0,0 +1,423 @@
+import random
+
+from modules.lock import LockType
+from modules.granularity_graph import GranularityGraphNode
+
+
+# Held lock types of other transactions a range or point lock of each type conflicts with
+# (the same rules LockManager._can_grant_lock applies on a single node)
+RANGE_CONFLICTS = {
+    LockType.RL: {LockType.UL, LockType.CL},
+    LockType.UL: {LockType.UL, LockType.WL, LockType.CL},
+    LockType.WL: {LockType.UL, LockType.WL, LockType.CL},
+    LockType.CL: {LockType.RL, LockType.UL, LockType.WL, LockType.CL},
+}
+
+
+def _starts_before_end(low, high, closed):
+    """
+    Checks if a key is below the end of an interval ending at high (included if closed).
+    """
+
+    return low < high or (closed and low == high)
+
+
+class IntervalEntry:
+    __slots__ = (
+        "low",
+        "high",
+        "closed",
+        "lock_type",
+        "transaction",
+        "order",
+        "priority",
+        "left",
+        "right",
+        "max_end",
+    )
+
+    def __init__(self, low, high, closed, lock_type, transaction, order, priority):
+        """
+        A lock on the keys [low, high) ([low, high] if closed), stored as a treap node.
+        """
+
+        self.low = low
+        self.high = high
+        self.closed = closed
+        self.lock_type = lock_type
+        self.transaction = transaction
+        self.order = order  # Tie breaker between entries with the same low key
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.max_end = (high, closed)  # Furthest end in the subtree
+
+    def update(self):
+        self.max_end = (self.high, self.closed)
+        for child in (self.left, self.right):
+            if child is not None and child.max_end > self.max_end:
+                self.max_end = child.max_end
+
+    def __repr__(self):
+        end = "]" if self.closed else ")"
+        return f"IntervalEntry([{self.low}, {self.high}{end} {self.lock_type.name} by {self.transaction.transaction_id})"
+
+
+class IntervalTreap:
+    def __init__(self, seed=None):
+        """
+        Interval tree: a treap ordered by interval start where every node also keeps the
+        furthest end of its subtree, so the intervals overlapping a query are found in
+        O(log n + overlaps) expected time.
+        """
+
+        self.root = None
+        self.size = 0
+        self.orders = 0
+        self.rng = random.Random(seed)
+
+    def insert(self, low, high, closed, lock_type, transaction):
+        """
+        Adds an interval and returns its entry (needed to remove it).
+        """
+
+        entry = IntervalEntry(low, high, closed, lock_type, transaction, 0, 0.0)
+        self.add(entry)
+        return entry
+
+    def add(self, entry):
+        """
+        Adds an entry built by the caller (or removed before, with new bounds).
+        """
+
+        self.orders += 1
+        entry.order = self.orders
+        entry.priority = self.rng.random()
+        entry.left = entry.right = None
+        entry.update()
+        self.root = self._insert(self.root, entry)
+        self.size += 1
+
+    def _insert(self, node, entry):
+        if node is None:
+            return entry
+
+        if (entry.low, entry.order) < (node.low, node.order):
+            node.left = self._insert(node.left, entry)
+            if node.left.priority > node.priority:
+                node = _rotate_right(node)
+        else:
+            node.right = self._insert(node.right, entry)
+            if node.right.priority > node.priority:
+                node = _rotate_left(node)
+
+        node.update()
+        return node
+
+    def remove(self, entry):
+        self.root = self._remove(self.root, entry)
+        self.size -= 1
+
+    def _remove(self, node, entry):
+        if node is None:
+            raise ValueError(f"{entry} is not in the interval tree.")
+
+        if node is entry:
+            if node.left is None:
+                return node.right
+            if node.right is None:
+                return node.left
+
+            # Rotate the entry down below its higher priority child, then keep removing
+            if node.left.priority > node.right.priority:
+                node = _rotate_right(node)
+                node.right = self._remove(node.right, entry)
+            else:
+                node = _rotate_left(node)
+                node.left = self._remove(node.left, entry)
+        elif (entry.low, entry.order) < (node.low, node.order):
+            node.left = self._remove(node.left, entry)
+        else:
+            node.right = self._remove(node.right, entry)
+
+        node.update()
+        return node
+
+    def overlapping(self, low, high, closed=False):
+        """
+        Yields the entries overlapping [low, high) ([low, high] if closed).
+        """
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            # Nothing in this subtree ends after the query starts
+            if node is None or not _starts_before_end(low, *node.max_end):
+                continue
+
+            # Every start on the right is at least node.low
+            if _starts_before_end(node.low, high, closed):
+                stack.append(node.right)
+                if _starts_before_end(low, node.high, node.closed):
+                    yield node
+            stack.append(node.left)
+
+    def __len__(self):
+        return self.size
+
+
+def _rotate_right(node):
+    left = node.left
+    node.left = left.right
+    left.right = node
+    node.update()
+    left.update()
+    return left
+
+
+def _rotate_left(node):
+    right = node.right
+    node.right = right.left
+    right.left = node
+    node.update()
+    right.update()
+    return right
+
+
+class RangeIndex:
+    def __init__(self, node: GranularityGraphNode):
+        """
+        Key-range lock table of a node (e.g. a table or a page) whose descendants have keys.
+
+        It holds the range locks taken on the node and on the nodes below it, plus the point
+        locks granted on its descendants, each as the span of keys it covers (a tuple covers
+        its key, a page the keys of its tuples). Locks on the node itself and above stay in
+        the regular lock tables; a range lock takes an intention lock on the node for them.
+        Nodes added below the node later extend the spans (see GranularityGraph.add_node),
+        and the locks on the nodes whose span grows are re-indexed to cover the new keys.
+        """
+
+        self.node = node
+        self.tree = IntervalTreap(seed=0)  # Same shapes, so same blockers, on every run
+        self.spans = {}  # descendant -> (lowest key, highest key) below it, both included
+        self.locks = {}  # node -> {entry: key range, or None for all its keys} indexed for it
+
+        self._compute_span(node)
+        if not self.spans:
+            raise ValueError(f"{node} has no keyed nodes below it.")
+        node.range_indexes.append(self)
+
+    def _compute_span(self, node):
+        """
+        Fills the spans of the node's descendants and returns the span of the node.
+        """
+
+        span = None if node.key is None else (node.key, node.key)
+
+        stack = [(child, False) for child in node.children]
+        while stack:
+            child, visited = stack.pop()
+            if not visited:
+                stack.append((child, True))
+                stack.extend((grandchild, False) for grandchild in child.children)
+                continue
+
+            child_span = None if child.key is None else (child.key, child.key)
+            for grandchild in child.children:
+                grandchild_span = self.spans.get(grandchild)
+                if grandchild_span is not None:
+                    child_span = _merge_spans(child_span, grandchild_span)
+
+            if child_span is not None:
+                self.spans[child] = child_span
+
+        for child in node.children:
+            if child in self.spans:
+                span = _merge_spans(span, self.spans[child])
+        return span
+
+    def add_subtree(self, node):
+        """
+        Extends the spans with a node just added below the indexed node (and the nodes
+        already below it), re-indexing the locks of the ancestors whose span grows.
+        """
+
+        span = self._compute_span(node)
+        if span is None:
+            return
+        self.spans[node] = span
+
+        ancestor = node.parent
+        while ancestor is not self.node:
+            grown = _merge_spans(self.spans.get(ancestor), span)
+            if grown == self.spans.get(ancestor):
+                break
+            self.spans[ancestor] = grown
+
+            for entry, key_range in self.locks.get(ancestor, {}).items():
+                if entry.low is not None:
+                    self.tree.remove(entry)
+                self._place(ancestor, entry, key_range)
+            ancestor = ancestor.parent
+
+    def add(self, node, lock_type, transaction, key_range=None):
+        """
+        Indexes a lock on the node (the indexed node or one below it): on all its keys, or
+        with key_range = (low, high) on its keys low <= key < high.
+        Returns the entry, to be given back to `remove`.
+        """
+
+        entry = IntervalEntry(None, None, False, lock_type, transaction, 0, 0.0)
+        self.locks.setdefault(node, {})[entry] = key_range
+        self._place(node, entry, key_range)
+        return entry
+
+    def remove(self, node, entry):
+        entries = self.locks[node]
+        del entries[entry]
+        if not entries:
+            del self.locks[node]
+        if entry.low is not None:
+            self.tree.remove(entry)
+
+    def _place(self, node, entry, key_range):
+        """
+        Puts the entry in the tree over the keys it covers now; one covering no key yet
+        stays out of it (low None) until the node's span grows.
+        """
+
+        interval = self.interval(node, key_range)
+        if interval is None:
+            entry.low = None
+            return
+
+        entry.low, entry.high, entry.closed = interval
+        self.tree.add(entry)
+
+    def interval(self, node, key_range=None):
+        """
+        Returns the keys (low, high, closed) a lock on the node covers, or None if none.
+        A range on the indexed node itself is kept whole.
+        """
+
+        if key_range is not None and node is self.node:
+            return key_range[0], key_range[1], False
+
+        span = self.spans.get(node)
+        if span is None:
+            return None
+        if key_range is None:
+            return span[0], span[1], True
+        return _clip(key_range[0], key_range[1], span)
+
+    def blocker(self, transaction, low, high, closed, lock_type):
+        """
+        Returns another transaction holding a conflicting lock on overlapping keys, or None.
+        """
+
+        conflicts = RANGE_CONFLICTS[lock_type]
+        for entry in self.tree.overlapping(low, high, closed):
+            if entry.transaction is not transaction and entry.lock_type in conflicts:
+                return entry.transaction
+        return None
+
+    def __repr__(self):
+        return f"RangeIndex({self.node.name}, {len(self.tree)} locks)"
+
+
+def _clip(low, high, span):
+    """
+    Intersects the keys [low, high) with a node's span [lowest, highest].
+    Returns (low, high, closed) or None if nothing is left.
+    """
+
+    low = max(low, span[0])
+    if high > span[1]:
+        high, closed = span[1], True
+    else:
+        closed = False
+
+    if low > high or (low == high and not closed):
+        return None
+    return low, high, closed
+
+
+def _merge_spans(span, other):
+    if span is None:
+        return other
+    return (min(span[0], other[0]), max(span[1], other[1]))
+
+
+class RangeLock:
+    def __init__(self, node, low, high, lock_type):
+        """
+        A key-range lock held by a transaction, with its entries in every index covering it.
+        """
+
+        self.node = node
+        self.low = low
+        self.high = high
+        self.lock_type = lock_type
+        self.entries = []  # (RangeIndex, IntervalEntry)
+
+    def __repr__(self):
+        return f"RangeLock({self.node.name} [{self.low}, {self.high}) {self.lock_type.name})"
+
+
+def covered_nodes(node: GranularityGraphNode, key_range):
+    """
+    Returns the keyed descendants of the node whose key is in key_range = (low, high).
+    """
+
+    low, high = key_range
+    covered = []
+
+    stack = list(node.children)
+    while stack:
+        descendant = stack.pop()
+        if descendant.key is not None and low <= descendant.key < high:
+            covered.append(descendant)
+        stack.extend(descendant.children)
+
+    return covered
+
+
+if __name__ == "__main__":
+    from modules.lock_manager import LockManager
+    from modules.granularity_graph import GranularityGraph
+    from modules.transaction import Transaction
+    from modules.operation import OperationType
+    from modules.await_graph import Graph
+    from modules.serializability import verify_schedule
+
+    # A table of 2 pages with 4 keyed tuples each
+    granularity_graph = GranularityGraph()
+    await_graph = Graph()
+    lock_manager = LockManager(granularity_graph, await_graph)
+
+    table_node = GranularityGraphNode("Table1")
+    granularity_graph.add_node(granularity_graph.root, table_node)
+    tuples = {}
+    for page in range(2):
+        page_node = GranularityGraphNode(f"Page{page + 1}")
+        granularity_graph.add_node(table_node, page_node)
+        for key in range(page * 40, page * 40 + 40, 10):
+            tuples[key] = GranularityGraphNode(f"Tuple{key}", key=key)
+            granularity_graph.add_node(page_node, tuples[key])
+
+    t1 = Transaction(lock_manager, await_graph)
+    t2 = Transaction(lock_manager, await_graph)
+    t3 = Transaction(lock_manager, await_graph)
+
+    # t1 scans keys [0, 25), t2 updates a key outside of it and t3 one inside of it
+    t1.create_operation(table_node, OperationType.READ, key_range=(0, 25))
+    t2.create_operation(tuples[30], OperationType.WRITE)
+    t3.create_operation(tuples[10], OperationType.WRITE)
+    t2.create_operation(table_node, OperationType.COMMIT)
+    t3.create_operation(table_node, OperationType.COMMIT)  # Waits for t1's scan
+    print(f"t2: {t2.state}, t3: {t3.state}")
+
+    t1.create_operation(table_node, OperationType.COMMIT)
+    print(f"t3 after t1 commits: {t3.state}")
+    print(lock_manager.range_indexes[table_node])
+    print("Serializable:", verify_schedule(lock_manager.operations_order) is None)
@@ -0,0 +1,40 @@
+import random
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=3, base_delay=0.01, max_delay=1.0, jitter=0.5, seed=None):
+        """
+        How the lock manager restarts aborted transactions.
+
+        The n-th restart waits base_delay * 2 ** (n - 1) seconds, capped at max_delay, with
+        up to `jitter` of that delay randomly removed so that victims of the same deadlock do
+        not collide again. After `max_retries` restarts the transaction stays aborted.
+        """
+
+        if max_retries < 0:
+            raise ValueError("max_retries must be non-negative.")
+        if base_delay < 0 or max_delay < 0:
+            raise ValueError("Retry delays must be non-negative.")
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1.")
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+
+    def should_retry(self, abort_count):
+        """
+        Checks if a transaction aborted abort_count times can still be restarted.
+        """
+
+        return abort_count <= self.max_retries
+
+    def delay(self, abort_count):
+        """
+        Returns the backoff (in seconds) before restarting after the abort_count-th abort.
+        """
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (abort_count - 1))
+        return delay * (1 - self.jitter * self.rng.random())
@@ -0,0 +1,344 @@
+from modules.operation import OperationType
+from modules.range_locks import covered_nodes
+
+
+class SerializabilityVerifier:
+    def __init__(self):
+        """
+        Incrementally builds the precedence graph of a schedule.
+
+        Operations are fed in schedule order. For every node it keeps the last writer and the
+        readers since that write, plus the writers and readers of its descendants, so a conflict
+        is found by looking at the node, its ancestors and its own subtree summary instead of
+        scanning the history.
+
+        Two things keep that state from growing with the history. A write on a node supersedes
+        everything recorded in its subtree: those transactions now precede the writer, so any
+        later conflict with them on an ancestor is implied by the writer's own edge, and they
+        are dropped from the ancestors' summaries. And a committed transaction without
+        predecessors can never get one (all of its operations are already applied), so it can
+        never be on a cycle: it is forgotten, which may free its successors in turn.
+
+        Under 2V2PL a write creates a private version that only replaces the committed one when
+        the writer certifies, so reads take effect where they appear while writes take effect
+        at their transaction's commit. Updates are reads (the update lock only announces a
+        later write, which is its own WRITE operation).
+        """
+
+        self.last_writer = {}  # node -> (transaction_id, operation)
+        self.readers = {}  # node -> {transaction_id: operation}
+        self.subtree_writers = {}  # node -> {transaction_id: operation} below the node
+        self.subtree_readers = {}  # node -> {transaction_id: operation} below the node
+        self.edges = {}  # transaction_id -> {transaction_id: (operation, operation)}
+        self.pending_writes = {}  # transaction_id -> [(node, operation)] until commit
+        self.predecessors = {}  # transaction_id -> number of transactions with an edge to it
+        self.recorded = {}  # transaction_id -> nodes where its operations are recorded
+        self.committed = set()  # Committed transactions that still have predecessors
+        self.operations_count = 0
+
+    def feed(self, transaction_id, operation_type: OperationType, node, position=None):
+        """
+        Adds one operation to the precedence graph.
+        """
+
+        if position is None:
+            position = self.operations_count
+        self.operations_count += 1
+
+        operation = (position, transaction_id, operation_type.value, node.name)
+
+        if operation_type == OperationType.WRITE:
+            self.pending_writes.setdefault(transaction_id, []).append((node, operation))
+        else:
+            self._apply(transaction_id, node, operation, False)
+
+    def commit(self, transaction_id):
+        """
+        Applies the writes of a committing transaction.
+        """
+
+        for node, operation in self.pending_writes.pop(transaction_id, []):
+            self._apply(transaction_id, node, operation, True)
+
+        if self.predecessors.get(transaction_id):
+            self.committed.add(transaction_id)
+        else:
+            self._forget(transaction_id)
+
+    def abort(self, transaction_id):
+        """
+        Discards the writes of an aborted transaction.
+        """
+
+        self.pending_writes.pop(transaction_id, None)
+
+    def _apply(self, transaction_id, node, operation, is_write):
+        """
+        Adds the edges caused by a read or a (committed) write and records it.
+        """
+
+        # Conflicts with operations on the node itself
+        last_writer = self.last_writer.get(node)
+        if last_writer is not None:
+            self._add_edge(last_writer, operation)
+        if is_write:
+            for reader in self.readers.get(node, {}).items():
+                self._add_edge(reader, operation)
+
+        # Conflicts with operations on the node's descendants
+        for writer in self.subtree_writers.get(node, {}).items():
+            self._add_edge(writer, operation)
+        if is_write:
+            for reader in self.subtree_readers.get(node, {}).items():
+                self._add_edge(reader, operation)
+
+        # Conflicts with operations on the node's ancestors (they cover this node)
+        ancestor = node.parent
+        while ancestor is not None:
+            ancestor_writer = self.last_writer.get(ancestor)
+            if ancestor_writer is not None:
+                self._add_edge(ancestor_writer, operation)
+            if is_write:
+                for reader in self.readers.get(ancestor, {}).items():
+                    self._add_edge(reader, operation)
+            ancestor = ancestor.parent
+
+        # Record the operation
+        if is_write:
+            superseded = self._supersede(node)
+            self.last_writer[node] = (transaction_id, operation)
+            summary = self.subtree_writers
+        else:
+            self.readers.setdefault(node, {})[transaction_id] = operation
+            superseded = ()
+            summary = self.subtree_readers
+        self.recorded.setdefault(transaction_id, set()).add(node)
+
+        ancestor = node.parent
+        while ancestor is not None:
+            for summaries in (self.subtree_writers, self.subtree_readers):
+                ancestor_summary = summaries.get(ancestor)
+                if ancestor_summary:
+                    for superseded_id in superseded:
+                        ancestor_summary.pop(superseded_id, None)
+            summary.setdefault(ancestor, {})[transaction_id] = operation
+            ancestor = ancestor.parent
+
+    def _supersede(self, node):
+        """
+        Forgets what was recorded on a node and below it before a write on the node, and
+        returns the transactions involved (they all got an edge to the writer).
+        """
+
+        superseded = set()
+
+        last_writer = self.last_writer.pop(node, None)
+        if last_writer is not None:
+            superseded.add(last_writer[0])
+        superseded.update(self.readers.pop(node, ()))
+        superseded.update(self.subtree_writers.pop(node, ()))
+        superseded.update(self.subtree_readers.pop(node, ()))
+
+        return superseded
+
+    def _add_edge(self, earlier, operation):
+        """
+        Adds a precedence edge from the transaction of an earlier conflicting operation.
+        """
+
+        source, source_operation = earlier
+        destination = operation[1]
+
+        if source == destination:
+            return
+
+        destinations = self.edges.setdefault(source, {})
+        if destination not in destinations:
+            destinations[destination] = (source_operation, operation)
+            self.predecessors[destination] = self.predecessors.get(destination, 0) + 1
+
+    def _forget(self, transaction_id):
+        """
+        Drops a committed transaction without predecessors from the precedence graph and the
+        node state, then the committed successors left without predecessors.
+        """
+
+        forgotten = [transaction_id]
+        while forgotten:
+            transaction_id = forgotten.pop()
+            self.committed.discard(transaction_id)
+            self.predecessors.pop(transaction_id, None)
+
+            for node in self.recorded.pop(transaction_id, ()):
+                last_writer = self.last_writer.get(node)
+                if last_writer is not None and last_writer[0] == transaction_id:
+                    del self.last_writer[node]
+                readers = self.readers.get(node)
+                if readers:
+                    readers.pop(transaction_id, None)
+
+                ancestor = node.parent
+                while ancestor is not None:
+                    for summaries in (self.subtree_writers, self.subtree_readers):
+                        summary = summaries.get(ancestor)
+                        if summary:
+                            summary.pop(transaction_id, None)
+                    ancestor = ancestor.parent
+
+            for destination in self.edges.pop(transaction_id, {}):
+                self.predecessors[destination] -= 1
+                if not self.predecessors[destination] and destination in self.committed:
+                    forgotten.append(destination)
+
+    def find_cycle(self):
+        """
+        Returns a list of (source, destination, source_operation, destination_operation) edges
+        forming a cycle in the precedence graph, or None if the schedule is serializable.
+        """
+
+        WHITE, GRAY, BLACK = 0, 1, 2
+        color = {}
+        parent = {}
+
+        for start in self.edges:
+            if color.get(start, WHITE) != WHITE:
+                continue
+
+            color[start] = GRAY
+            stack = [(start, iter(self.edges.get(start, ())))]
+
+            # Iterative DFS, schedules can be far deeper than the recursion limit
+            while stack:
+                vertex, neighbors = stack[-1]
+                advanced = False
+
+                for neighbor in neighbors:
+                    state = color.get(neighbor, WHITE)
+                    if state == WHITE:
+                        color[neighbor] = GRAY
+                        parent[neighbor] = vertex
+                        stack.append((neighbor, iter(self.edges.get(neighbor, ()))))
+                        advanced = True
+                        break
+                    if state == GRAY:
+                        return self._build_cycle(parent, vertex, neighbor)
+
+                if not advanced:
+                    color[vertex] = BLACK
+                    stack.pop()
+
+        return None
+
+    def _build_cycle(self, parent, last, first):
+        """
+        Rebuilds the cycle closed by the back edge last -> first.
+        """
+
+        path = [last]
+        while path[-1] != first:
+            path.append(parent[path[-1]])
+        path.reverse()
+        path.append(first)
+
+        cycle = []
+        for source, destination in zip(path, path[1:]):
+            source_operation, destination_operation = self.edges[source][destination]
+            cycle.append((source, destination, source_operation, destination_operation))
+
+        return cycle
+
+
+def _committed_positions(operations_order):
+    """
+    Flags the entries that belong to committed transactions, scanning the schedule backwards
+    so that each operation knows how its transaction ended.
+    """
+
+    keep = bytearray(len(operations_order))
+    outcome = {}
+
+    for position in range(len(operations_order) - 1, -1, -1):
+        transaction, operation = operations_order[position]
+        transaction_id = transaction.transaction_id
+
+        if isinstance(operation, str):
+            outcome[transaction_id] = operation == "Commited"
+        elif outcome.get(transaction_id, False):
+            keep[position] = 1
+
+    return keep
+
+
+def verify_schedule(operations_order):
+    """
+    Checks that the committed projection of a schedule (the `operations_order` of a
+    LockManager) is conflict serializable. Returns None if it is, otherwise the cycle found.
+    """
+
+    if not isinstance(operations_order, list):
+        operations_order = list(operations_order)
+
+    keep = _committed_positions(operations_order)
+    verifier = SerializabilityVerifier()
+
+    for position, (transaction, operation) in enumerate(operations_order):
+        if keep[position]:
+            # A key-range operation accesses every keyed node in its range
+            nodes = (
+                [operation.node]
+                if operation.key_range is None
+                else covered_nodes(operation.node, operation.key_range)
+            )
+            for node in nodes:
+                verifier.feed(
+                    transaction.transaction_id,
+                    operation.operation_type,
+                    node,
+                    position,
+                )
+        elif operation == "Commited":
+            verifier.commit(transaction.transaction_id)
+
+    return verifier.find_cycle()
+
+
+def format_cycle(cycle):
+    """
+    Formats a cycle returned by `verify_schedule` for printing.
+    """
+
+    lines = []
+    for source, destination, source_operation, destination_operation in cycle:
+        lines.append(
+            f"Transaction {source} -> Transaction {destination}: "
+            f"#{source_operation[0]} {source_operation[2]} {source_operation[3]} "
+            f"conflicts with #{destination_operation[0]} {destination_operation[2]} {destination_operation[3]}"
+        )
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+
+    granularity_graph = GranularityGraph()
+    table_node = GranularityGraphNode("Table1")
+    tuple_node = GranularityGraphNode("Tuple1")
+    granularity_graph.add_node(granularity_graph.root, table_node)
+    granularity_graph.add_node(table_node, tuple_node)
+
+    # Table write by 1, tuple read by 2, tuple write by 2, table read by 1: not serializable
+    verifier = SerializabilityVerifier()
+    verifier.feed(1, OperationType.WRITE, table_node)
+    verifier.feed(2, OperationType.READ, tuple_node)
+    verifier.feed(2, OperationType.WRITE, tuple_node)
+    verifier.feed(1, OperationType.READ, table_node)
+    verifier.commit(1)
+    verifier.commit(2)
+
+    cycle = verifier.find_cycle()
+    if cycle:
+        print("Cycle detected:")
+        print(format_cycle(cycle))
+    else:
+        print("Schedule is serializable.")
@@ -0,0 +1,286 @@
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import redirect_stdout
+
+from modules.lock_manager import LockManager
+from modules.transaction import Transaction
+from modules.await_graph import Graph
+from modules.operation import OperationType
+from modules.workload import WorkloadGenerator
+
+ARRIVE, STEP, EXPIRE = range(3)
+
+
+class Simulator:
+    def __init__(
+        self,
+        generator: WorkloadGenerator,
+        arrival_rate=10.0,
+        arrival="poisson",
+        operation_time=0.01,
+        retry_policy=None,
+        lock_timeout=None,
+        seed=0,
+    ):
+        """
+        Discrete-event simulation of the generator's transactions on a LockManager.
+
+        Transactions arrive `arrival_rate` times per virtual second, either as a Poisson
+        process (`arrival="poisson"`) or evenly spaced (`arrival="uniform"`). Each operation
+        holds the transaction for a sampled duration once its lock is granted: exponential
+        with mean `operation_time` seconds, or `operation_time(rng, operation_type)` if it
+        is callable. COMMIT takes no time. A virtual clock jumps from event to event, so idle
+        time costs nothing; the lock manager runs on that clock (lock timeouts included).
+
+        With a `retry_policy` (a RetryPolicy) aborted transactions arrive again after its
+        backoff, keeping their timestamp and abort count; latencies count from the first
+        arrival.
+        """
+
+        if arrival not in ("poisson", "uniform"):
+            raise ValueError("Invalid arrival process. Must be 'poisson' or 'uniform'.")
+        if arrival_rate <= 0:
+            raise ValueError("The arrival rate must be positive.")
+
+        self.generator = generator
+        self.arrival_rate = arrival_rate
+        self.arrival = arrival
+        self.operation_time = operation_time
+        self.retry_policy = retry_policy
+        self.rng = random.Random(seed)
+
+        self.now = 0.0
+        self.events = []  # Heap of (time, sequence, kind, payload)
+        self._sequence = itertools.count()
+        self.lock_manager = LockManager(
+            generator.granularity_graph,
+            Graph(),
+            lock_timeout=lock_timeout,
+            clock=lambda: self.now,
+        )
+        self.live = set()  # Transactions that arrived and did not finish
+
+        self.latencies = []
+        self.wait_times = []
+        self.hold_times = {}  # lock type name -> seconds each lock was held
+        self.committed = 0
+        self.aborted = 0
+        self.restarts = 0
+        self.gave_up = 0
+        self.event_count = 0
+
+    def _schedule(self, at, kind, payload):
+        heapq.heappush(self.events, (at, next(self._sequence), kind, payload))
+
+    def _duration(self, operation_type):
+        if operation_type == OperationType.COMMIT:
+            return 0.0
+        if callable(self.operation_time):
+            return self.operation_time(self.rng, operation_type)
+        return self.rng.expovariate(1 / self.operation_time) if self.operation_time else 0.0
+
+    def _next_arrival_gap(self):
+        if self.arrival == "poisson":
+            return self.rng.expovariate(self.arrival_rate)
+        return 1 / self.arrival_rate
+
+    def run(self, until=None):
+        """
+        Runs until every transaction finished (or the virtual clock passes `until`).
+        Returns the report.
+        """
+
+        started = time.perf_counter()
+
+        at = 0.0
+        for _ in range(self.generator.transactions):
+            at += self._next_arrival_gap()
+            operations = self.generator._generate_transaction()
+            self._schedule(at, ARRIVE, (operations, at, None))
+
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            while self.events:
+                at, _, kind, payload = heapq.heappop(self.events)
+                if until is not None and at > until:
+                    break
+
+                self.now = at
+                self.event_count += 1
+
+                if kind == ARRIVE:
+                    self._arrive(*payload)
+                elif kind == STEP:
+                    if payload in self.live:
+                        self._issue(payload)
+                else:
+                    self.lock_manager.expire_lock_timeouts(self.now)
+
+                self._settle()
+
+        return self.report(time.perf_counter() - started)
+
+    def _arrive(self, operations, first_arrival, restarted_from):
+        transaction = Transaction(self.lock_manager, self.lock_manager.await_graph)
+        if restarted_from is not None:
+            # Keeps its age so that it eventually wins deadlocks
+            transaction.timestamp = restarted_from.timestamp
+            transaction.abort_count = restarted_from.abort_count
+
+        transaction.operations = operations
+        transaction.remaining = list(operations)
+        transaction.arrival = first_arrival
+        transaction.issued = False  # An operation was submitted and is not granted yet
+        transaction.blocked_since = None
+        transaction.virtual_wait = 0.0
+        transaction.grant_times = {}  # node -> [grant time, lock type]
+
+        self.live.add(transaction)
+        self._issue(transaction)
+
+    def _issue(self, transaction):
+        node, operation_type = transaction.remaining[0]
+        transaction.issued = True
+        transaction.create_operation(node, operation_type)
+
+    def _settle(self):
+        """
+        Looks at what the last event did to every running transaction: granted operations
+        start their duration, new waits start their clock, finished transactions are recorded.
+        """
+
+        for transaction in list(self.live):
+            if transaction.state in ("committed", "aborted"):
+                self._finish(transaction)
+            elif transaction.state == "blocked":
+                if transaction.blocked_since is None:
+                    transaction.blocked_since = self.now
+                    if transaction.wait_deadline is not None:
+                        self._schedule(transaction.wait_deadline, EXPIRE, None)
+            elif transaction.issued and not transaction.pending_operations:
+                self._granted(transaction)
+
+    def _granted(self, transaction):
+        if transaction.blocked_since is not None:
+            transaction.virtual_wait += self.now - transaction.blocked_since
+            transaction.blocked_since = None
+
+        for node, lock_type in transaction.locks_held.items():
+            grant = transaction.grant_times.setdefault(node, [self.now, lock_type])
+            grant[1] = lock_type  # Promotions keep the original grant time
+
+        _, operation_type = transaction.remaining.pop(0)
+        transaction.issued = False
+        self._schedule(self.now + self._duration(operation_type), STEP, transaction)
+
+    def _finish(self, transaction):
+        self.live.discard(transaction)
+        if transaction.blocked_since is not None:
+            transaction.virtual_wait += self.now - transaction.blocked_since
+
+        for grant_time, lock_type in transaction.grant_times.values():
+            self.hold_times.setdefault(lock_type.name, []).append(self.now - grant_time)
+
+        if transaction.state == "committed":
+            self.committed += 1
+            self.latencies.append(self.now - transaction.arrival)
+            self.wait_times.append(transaction.virtual_wait)
+            return
+
+        self.aborted += 1
+        if self.retry_policy is not None and self.retry_policy.should_retry(
+            transaction.abort_count
+        ):
+            self.restarts += 1
+            self._schedule(
+                self.now + self.retry_policy.delay(transaction.abort_count),
+                ARRIVE,
+                (transaction.operations, transaction.arrival, transaction),
+            )
+        else:
+            self.gave_up += 1
+
+    def report(self, real_time=None):
+        """
+        Returns the counters and the latency, wait and lock hold time distributions
+        (in virtual seconds).
+        """
+
+        return {
+            "transactions": self.generator.transactions,
+            "committed": self.committed,
+            "aborted": self.aborted,
+            "restarts": self.restarts,
+            "gave_up": self.gave_up,
+            "virtual_time": self.now,
+            "throughput": self.committed / self.now if self.now else 0.0,
+            "events": self.event_count,
+            "real_time": real_time,
+            "latency": _summary(self.latencies),
+            "wait_time": _summary(self.wait_times),
+            "hold_time": {
+                lock_type: _summary(values) for lock_type, values in sorted(self.hold_times.items())
+            },
+        }
+
+    @staticmethod
+    def print_report(report):
+        print(
+            f"{report['committed']} committed, {report['aborted']} aborted "
+            f"({report['restarts']} restarted) in {report['virtual_time']:.3f} virtual s: "
+            f"{report['throughput']:.2f} commits/s"
+        )
+        if report["real_time"] is not None:
+            print(f"{report['events']} events simulated in {report['real_time']:.3f} s")
+
+        rows = [("latency", report["latency"]), ("wait", report["wait_time"])]
+        rows += [(f"hold {lock_type}", summary) for lock_type, summary in report["hold_time"].items()]
+        for name, summary in rows:
+            print(
+                f"{name}: mean {summary['mean'] * 1000:.2f} ms, p50 {summary['p50'] * 1000:.2f} ms, "
+                f"p95 {summary['p95'] * 1000:.2f} ms, p99 {summary['p99'] * 1000:.2f} ms, "
+                f"max {summary['max'] * 1000:.2f} ms"
+            )
+
+
+def _summary(values):
+    """
+    Count, mean, nearest-rank percentiles and maximum of the values.
+    """
+
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+    ordered = sorted(values)
+
+    def rank(fraction):
+        return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "max": ordered[-1],
+    }
+
+
+if __name__ == "__main__":
+    from modules.retry import RetryPolicy
+
+    # The same workload at increasing load: waits and lock hold times grow with contention
+    for arrival_rate in (20, 80):
+        generator = WorkloadGenerator(
+            transactions=2000, zipf_skew=0.8, depth=3, fan_out=6, seed=1
+        )
+        simulator = Simulator(
+            generator,
+            arrival_rate=arrival_rate,
+            operation_time=0.005,
+            retry_policy=RetryPolicy(max_retries=5, base_delay=0.01, seed=1),
+        )
+        print(f"Arrival rate {arrival_rate}/s:")
+        Simulator.print_report(simulator.run())
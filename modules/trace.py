@@ -0,0 +1,775 @@
+import json
+import math
+import os
+import struct
+import sys
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from modules.await_graph import Graph
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.lock_manager import LockManager
+from modules.operation import OperationType
+from modules.transaction import Transaction
+
+
+# A trace is MAGIC followed by records: a record type byte, then the fields of its type.
+# Optional numbers are stored as NaN when missing.
+MAGIC = b"2V2PLTRACE\x01"
+
+NODE_RECORD = struct.Struct("!IIH")  # node id, parent id, name length (name and key follow)
+CONFIG_RECORD = struct.Struct("!dBdB")  # lock timeout, timeout action, upgrade priority, retries
+BEGIN_RECORD = struct.Struct("!Iq")  # transaction id, timestamp (microseconds)
+STATE_RECORD = struct.Struct("!IqId")  # transaction id, timestamp, abort count, lock timeout
+OPERATION_RECORD = struct.Struct("!IBId")  # transaction id, operation type, node id, timeout
+PREDECLARE_RECORD = struct.Struct("!IH")  # transaction id, number of entries
+PREDECLARE_ENTRY = struct.Struct("!IB")  # node id, operation type
+ID_RECORD = struct.Struct("!I")
+TIME_RECORD = struct.Struct("!d")
+FLAG_RECORD = struct.Struct("!B")
+KEY_KIND = struct.Struct("!B")
+INT_KEY = struct.Struct("!q")
+FLOAT_KEY = struct.Struct("!d")
+
+# Calls made on the lock manager (or its transactions)
+NODE, CONFIG, BEGIN, STATE, OPERATION, PREDECLARE, EXPIRE, RESTARTS, RANGE_INDEX = range(1, 10)
+# Decisions taken inside those calls
+CLOCK, SHOULD_RETRY, DELAY, VICTIM = range(10, 14)
+
+RECORD_NAMES = {
+    NODE: "NODE",
+    CONFIG: "CONFIG",
+    BEGIN: "BEGIN",
+    STATE: "STATE",
+    OPERATION: "OPERATION",
+    PREDECLARE: "PREDECLARE",
+    EXPIRE: "EXPIRE",
+    RESTARTS: "RESTARTS",
+    RANGE_INDEX: "RANGE_INDEX",
+    CLOCK: "CLOCK",
+    SHOULD_RETRY: "SHOULD_RETRY",
+    DELAY: "DELAY",
+    VICTIM: "VICTIM",
+}
+
+OPERATION_TYPES = list(OperationType)
+OPERATION_CODES = {operation_type: code for code, operation_type in enumerate(OPERATION_TYPES)}
+TIMEOUT_ACTIONS = ["abort", "fail"]
+NO_NODE = 0xFFFFFFFF
+EPOCH = datetime(1970, 1, 1)
+
+
+class TraceRecorder:
+    def __init__(self, path):
+        """
+        Records a LockManager run to a compact binary trace that `TraceReplayer` replays.
+
+        It records the calls that drive the run (transactions beginning, `create_operation`,
+        `predeclare`, external `expire_lock_timeouts` / `run_restarts` calls...) and the
+        decisions taken inside them: every clock reading, every retry policy answer and
+        every deadlock victim. Nodes are recorded the first time they are used, with their
+        subtree, so children added below a node that was already used are not replayed.
+
+        Pass it as the lock manager's `trace` (or call `attach`). Recording only makes
+        sense for a single-threaded LockManager.
+        """
+
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.buffer = bytearray()
+        self.lock_manager = None
+        self.node_ids = {}
+        self.states = {}  # transaction_id -> (timestamp, abort count, lock timeout) recorded
+        self.records = 0
+
+    def attach(self, lock_manager: LockManager):
+        if self.lock_manager is not None:
+            raise ValueError("The recorder is already attached to a lock manager.")
+
+        self.lock_manager = lock_manager
+        lock_manager.trace = self
+        self._clock = lock_manager.clock
+        lock_manager.clock = self.clock
+        if lock_manager.retry_policy is not None:
+            lock_manager.retry_policy = _RecordedRetryPolicy(lock_manager.retry_policy, self)
+
+        self._append(
+            CONFIG,
+            CONFIG_RECORD.pack(
+                _to_float(lock_manager.lock_timeout),
+                TIMEOUT_ACTIONS.index(lock_manager.timeout_action),
+                _to_float(lock_manager.upgrade_priority_after),
+                lock_manager.retry_policy is not None,
+            ),
+        )
+
+        self._node_id(lock_manager.granularity_graph.root)
+
+    def _append(self, record_type, payload):
+        self.buffer.append(record_type)
+        self.buffer += payload
+        self.records += 1
+        if len(self.buffer) >= 1 << 16:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+
+    def _node_id(self, node: GranularityGraphNode):
+        if node is None:
+            return NO_NODE  # e.g. a commit issued without a node
+
+        node_id = self.node_ids.get(node)
+        if node_id is not None:
+            return node_id
+
+        # A new node is recorded with its ancestors and its whole subtree (in children order),
+        # since a lock taken on it also goes to the nodes below
+        top = node
+        while top.parent is not None and top.parent not in self.node_ids:
+            top = top.parent
+
+        stack = [top]
+        while stack:
+            descendant = stack.pop()
+            if descendant not in self.node_ids:
+                self._record_node(descendant)
+            stack.extend(reversed(descendant.children))
+
+        return self.node_ids[node]
+
+    def _record_node(self, node: GranularityGraphNode):
+        node_id = len(self.node_ids)
+        self.node_ids[node] = node_id
+        parent_id = NO_NODE if node.parent is None else self.node_ids[node.parent]
+
+        name = node.name.encode()
+        self._append(
+            NODE, NODE_RECORD.pack(node_id, parent_id, len(name)) + name + _encode_key(node.key)
+        )
+
+    def _record_state(self, transaction: Transaction):
+        """
+        Records the attributes a driver may have changed since the transaction began.
+        """
+
+        state = (transaction.timestamp, transaction.abort_count, transaction.lock_timeout)
+        if self.states.get(transaction.transaction_id) != state:
+            self.states[transaction.transaction_id] = state
+            self._append(
+                STATE,
+                STATE_RECORD.pack(
+                    transaction.transaction_id,
+                    _encode_timestamp(transaction.timestamp),
+                    transaction.abort_count,
+                    _to_float(transaction.lock_timeout),
+                ),
+            )
+
+    def record_begin(self, transaction: Transaction):
+        self.states[transaction.transaction_id] = (
+            transaction.timestamp,
+            transaction.abort_count,
+            transaction.lock_timeout,
+        )
+        self._append(
+            BEGIN,
+            BEGIN_RECORD.pack(
+                transaction.transaction_id, _encode_timestamp(transaction.timestamp)
+            ),
+        )
+
+    def record_operation(self, transaction, node, operation_type, timeout, key_range):
+        self._record_state(transaction)
+        node_id = self._node_id(node)
+        self._append(
+            OPERATION,
+            OPERATION_RECORD.pack(
+                transaction.transaction_id,
+                OPERATION_CODES[operation_type],
+                node_id,
+                _to_float(timeout),
+            )
+            + _encode_key_range(key_range),
+        )
+
+    def record_predeclare(self, transaction, lock_set):
+        self._record_state(transaction)
+        entries = [(self._node_id(node), OPERATION_CODES[operation]) for node, operation in lock_set]
+        self._append(
+            PREDECLARE,
+            PREDECLARE_RECORD.pack(transaction.transaction_id, len(entries))
+            + b"".join(PREDECLARE_ENTRY.pack(*entry) for entry in entries),
+        )
+
+    def record_expire(self, now):
+        self._append(EXPIRE, TIME_RECORD.pack(_to_float(now)))
+
+    def record_restarts(self, now):
+        self._append(RESTARTS, TIME_RECORD.pack(_to_float(now)))
+
+    def record_range_index(self, node):
+        self._append(RANGE_INDEX, ID_RECORD.pack(self._node_id(node)))
+
+    def record_victim(self, victim):
+        self._append(VICTIM, ID_RECORD.pack(victim.transaction_id))
+
+    def clock(self):
+        now = self._clock()
+        self._append(CLOCK, TIME_RECORD.pack(now))
+        return now
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(self.buffer)
+        self.buffer.clear()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _RecordedRetryPolicy:
+    def __init__(self, retry_policy, recorder: TraceRecorder):
+        self.retry_policy = retry_policy
+        self.recorder = recorder
+
+    def should_retry(self, abort_count):
+        retry = self.retry_policy.should_retry(abort_count)
+        self.recorder._append(SHOULD_RETRY, FLAG_RECORD.pack(retry))
+        return retry
+
+    def delay(self, abort_count):
+        delay = self.retry_policy.delay(abort_count)
+        self.recorder._append(DELAY, TIME_RECORD.pack(delay))
+        return delay
+
+
+class TraceReplayer:
+    def __init__(self, path):
+        """
+        Replays a trace written by TraceRecorder on a fresh LockManager, at full speed and
+        without printing.
+
+        The lock manager calls the same hooks as when recording: here each one takes the
+        next record, checks it matches (the same call, the same victim...) and hands back
+        the recorded clock readings and retry policy answers. So the replay takes the same
+        decisions as the recorded run, and a change in the lock manager that makes it take
+        different ones is reported as the result's "divergence" at the record it happens.
+        From there the replay goes on with the recorded calls, without checking the hooks:
+        a decision missing from the trace gets a fallback (the latest recorded clock
+        reading, no retry, no victim check) so the schedule can still be compared.
+        """
+
+        self.path = path
+        self.records = read_trace(path)
+
+    def run(self, repeat=1):
+        """
+        Replays the trace `repeat` times and returns the schedule (`operations_order`) and
+        timing of the run, keeping the fastest time, the first "divergence" from the
+        trace (position, message and the expected and replayed records) or None, and the
+        "error" that stopped the replay (position, message and traceback) or None.
+        """
+
+        # Wake-ups re-enter execute_operations recursively, long waiting chains need a deeper stack
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                self._replay()
+            except Exception as error:
+                # Reported with the schedule so far (after a divergence the lock manager can
+                # also trip over the state it left behind)
+                self.error = {
+                    "position": self.position,
+                    "message": f"{type(error).__name__}: {error}",
+                    "traceback": traceback.format_exc(),
+                }
+            elapsed = time.perf_counter() - start
+
+            if result is None or elapsed < result["elapsed"]:
+                operations = sum(
+                    1
+                    for _, operation in self.lock_manager.operations_order
+                    if not isinstance(operation, str)
+                )
+                result = {
+                    "records": len(self.records),
+                    "transactions": len(self.transactions),
+                    "operations": operations,
+                    "elapsed": elapsed,
+                    "operations_per_second": operations / elapsed if elapsed else 0.0,
+                    "operations_order": encode_schedule(self.lock_manager.operations_order),
+                    "divergence": self.divergence,
+                    "error": self.error,
+                }
+
+        return result
+
+    def _replay(self):
+        self.position = 0
+        self.nodes = {NO_NODE: None}  # node id -> node of the replayed graph
+        self.node_ids = {None: NO_NODE}
+        self.transactions = {}
+        self.granularity_graph = GranularityGraph()
+        self.divergence = None
+        self.error = None
+        self.last_clock = next(
+            (values[0] for record_type, values in self.records if record_type == CLOCK), 0.0
+        )
+
+        lock_timeout, timeout_action, upgrade_priority_after, retries = self._next(CONFIG)
+        self.lock_manager = LockManager(
+            self.granularity_graph,
+            Graph(),
+            lock_timeout=lock_timeout,
+            timeout_action=timeout_action,
+            clock=self.clock,
+            retry_policy=_ReplayedRetryPolicy(self) if retries else None,
+            upgrade_priority_after=upgrade_priority_after,
+            trace=self,
+            verbose=False,
+        )
+
+        while self.position < len(self.records):
+            position = self.position
+            record_type, values = self.records[position]
+
+            if record_type == NODE:
+                self._add_node(values)
+                self.position += 1
+                continue
+            if record_type in (CLOCK, SHOULD_RETRY, DELAY, VICTIM) and self.divergence is not None:
+                # A decision the diverged replay did not ask for
+                if record_type == CLOCK:
+                    self.last_clock = values[0]
+                self.position += 1
+                continue
+            if record_type == STATE:
+                transaction_id, timestamp, abort_count, lock_timeout = values
+                transaction = self.transactions[transaction_id]
+                transaction.timestamp = timestamp
+                transaction.abort_count = abort_count
+                transaction.lock_timeout = lock_timeout
+                self.position += 1
+                continue
+
+            # Each call takes its own record through its hook
+            if record_type == BEGIN:
+                transaction_id, timestamp = values
+                Transaction(
+                    self.lock_manager,
+                    self.lock_manager.await_graph,
+                    transaction_id=transaction_id,
+                    timestamp=timestamp,
+                )
+            elif record_type == OPERATION:
+                transaction_id, operation_type, node_id, timeout, key_range = values
+                self.transactions[transaction_id].create_operation(
+                    self.nodes[node_id], operation_type, timeout, key_range
+                )
+            elif record_type == PREDECLARE:
+                transaction_id, entries = values
+                self.transactions[transaction_id].predeclare(
+                    [(self.nodes[node_id], operation_type) for node_id, operation_type in entries]
+                )
+            elif record_type == EXPIRE:
+                self.lock_manager.expire_lock_timeouts(values[0])
+            elif record_type == RESTARTS:
+                self.lock_manager.run_restarts(values[0])
+            elif record_type == RANGE_INDEX:
+                self.lock_manager.add_range_index(self.nodes[values[0]])
+            else:
+                self._diverged(f"{RECORD_NAMES[record_type]} outside of a call", found="no call")
+
+            if self.position == position:
+                self._diverged(f"{RECORD_NAMES[record_type]} was not replayed", found="no call")
+                self.position += 1
+
+    def _add_node(self, values):
+        node_id, parent_id, name, key = values
+        if parent_id == NO_NODE and len(self.nodes) == 1:
+            node = self.granularity_graph.root
+            node.name = name
+            node.key = key
+        else:
+            node = GranularityGraphNode(name, key=key)
+            if parent_id != NO_NODE:
+                self.granularity_graph.add_node(self.nodes[parent_id], node)
+
+        self.nodes[node_id] = node
+        self.node_ids[node] = node_id
+
+    def _next(self, record_type):
+        """
+        Returns the values of the next record, which has to be of the given type, or None
+        (leaving the record for a later call) if the replay diverged there.
+        """
+
+        while self.position < len(self.records) and self.records[self.position][0] == NODE:
+            self._add_node(self.records[self.position][1])
+            self.position += 1
+
+        if self.position >= len(self.records):
+            self._diverged(
+                f"expected {RECORD_NAMES[record_type]}, the trace ended",
+                "the end of the trace",
+                RECORD_NAMES[record_type],
+            )
+            return None
+
+        found_type, values = self.records[self.position]
+        if found_type != record_type:
+            self._diverged(
+                f"expected {RECORD_NAMES[record_type]}, found {RECORD_NAMES[found_type]}",
+                found=RECORD_NAMES[record_type],
+            )
+            return None
+
+        self.position += 1
+        return values
+
+    def _diverged(self, message, expected=None, found=None):
+        """
+        Records the first divergence: the position, what went wrong and the recorded
+        record against what the replay did there.
+        """
+
+        if self.divergence is not None:
+            return
+
+        if expected is None:
+            record_type, values = self.records[self.position]
+            expected = f"{RECORD_NAMES[record_type]} {list(values)}"
+        self.divergence = {
+            "position": self.position,
+            "message": message,
+            "expected": expected,
+            "found": found,
+        }
+
+    def _check(self, expected, found, what):
+        if expected != found:
+            self.position -= 1
+            self._diverged(f"recorded {what} {expected}, replayed {found}", found=f"{what} {found}")
+            self.position += 1
+
+    def attach(self, lock_manager):
+        lock_manager.trace = self
+
+    def record_begin(self, transaction):
+        values = self._next(BEGIN)
+        if values is not None:
+            self._check(values[0], transaction.transaction_id, "transaction")
+        self.transactions[transaction.transaction_id] = transaction
+
+    def record_operation(self, transaction, node, operation_type, timeout, key_range):
+        values = self._next(OPERATION)
+        if values is not None:
+            self._check(
+                tuple(values[:3]),
+                (transaction.transaction_id, operation_type, self.node_ids.get(node)),
+                "operation",
+            )
+
+    def record_predeclare(self, transaction, lock_set):
+        values = self._next(PREDECLARE)
+        if values is not None:
+            self._check(values[0], transaction.transaction_id, "transaction")
+
+    def record_expire(self, now):
+        self._next(EXPIRE)
+
+    def record_restarts(self, now):
+        self._next(RESTARTS)
+
+    def record_range_index(self, node):
+        values = self._next(RANGE_INDEX)
+        if values is not None:
+            self._check(values[0], self.node_ids.get(node), "range index")
+
+    def record_victim(self, victim):
+        values = self._next(VICTIM)
+        if values is not None:
+            self._check(values[0], victim.transaction_id, "deadlock victim")
+
+    def clock(self):
+        values = self._next(CLOCK)
+        if values is not None:
+            self.last_clock = values[0]
+        return self.last_clock
+
+
+class _ReplayedRetryPolicy:
+    def __init__(self, replayer: TraceReplayer):
+        self.replayer = replayer
+
+    def should_retry(self, abort_count):
+        values = self.replayer._next(SHOULD_RETRY)
+        return False if values is None else values[0]
+
+    def delay(self, abort_count):
+        values = self.replayer._next(DELAY)
+        return 0.0 if values is None else values[0]
+
+
+def read_trace(path):
+    """
+    Decodes a trace into a list of (record type, values).
+    """
+
+    with open(path, "rb") as file:
+        data = file.read()
+
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a lock manager trace.")
+
+    records = []
+    offset = len(MAGIC)
+    while offset < len(data):
+        record_type = data[offset]
+        offset += 1
+
+        if record_type == NODE:
+            node_id, parent_id, length = NODE_RECORD.unpack_from(data, offset)
+            offset += NODE_RECORD.size
+            name = data[offset : offset + length].decode()
+            key, offset = _decode_key(data, offset + length)
+            values = (node_id, parent_id, name, key)
+        elif record_type == CONFIG:
+            lock_timeout, action, upgrade_priority_after, retries = CONFIG_RECORD.unpack_from(
+                data, offset
+            )
+            offset += CONFIG_RECORD.size
+            values = (
+                _from_float(lock_timeout),
+                TIMEOUT_ACTIONS[action],
+                _from_float(upgrade_priority_after),
+                bool(retries),
+            )
+        elif record_type == BEGIN:
+            transaction_id, timestamp = BEGIN_RECORD.unpack_from(data, offset)
+            offset += BEGIN_RECORD.size
+            values = (transaction_id, _decode_timestamp(timestamp))
+        elif record_type == STATE:
+            transaction_id, timestamp, abort_count, lock_timeout = STATE_RECORD.unpack_from(
+                data, offset
+            )
+            offset += STATE_RECORD.size
+            values = (
+                transaction_id,
+                _decode_timestamp(timestamp),
+                abort_count,
+                _from_float(lock_timeout),
+            )
+        elif record_type == OPERATION:
+            transaction_id, code, node_id, timeout = OPERATION_RECORD.unpack_from(data, offset)
+            low, offset = _decode_key(data, offset + OPERATION_RECORD.size)
+            key_range = None
+            if low is not None:
+                high, offset = _decode_key(data, offset)
+                key_range = (low, high)
+            values = (transaction_id, OPERATION_TYPES[code], node_id, _from_float(timeout), key_range)
+        elif record_type == PREDECLARE:
+            transaction_id, count = PREDECLARE_RECORD.unpack_from(data, offset)
+            offset += PREDECLARE_RECORD.size
+            entries = []
+            for _ in range(count):
+                node_id, code = PREDECLARE_ENTRY.unpack_from(data, offset)
+                offset += PREDECLARE_ENTRY.size
+                entries.append((node_id, OPERATION_TYPES[code]))
+            values = (transaction_id, entries)
+        elif record_type in (EXPIRE, RESTARTS, CLOCK, DELAY):
+            (value,) = TIME_RECORD.unpack_from(data, offset)
+            offset += TIME_RECORD.size
+            values = (_from_float(value),)
+        elif record_type in (RANGE_INDEX, VICTIM):
+            values = ID_RECORD.unpack_from(data, offset)
+            offset += ID_RECORD.size
+        elif record_type == SHOULD_RETRY:
+            values = (bool(data[offset]),)
+            offset += FLAG_RECORD.size
+        else:
+            raise ValueError(f"Unknown record type {record_type} at offset {offset - 1} of {path}.")
+
+        records.append((record_type, values))
+
+    return records
+
+
+def encode_schedule(operations_order):
+    """
+    Turns an operations_order into JSON-friendly entries:
+    [transaction id, operation type, node name(, key range)] or [transaction id, label].
+    """
+
+    schedule = []
+    for transaction, operation in operations_order:
+        if isinstance(operation, str):
+            schedule.append([transaction.transaction_id, operation])
+        elif operation.key_range is None:
+            schedule.append(
+                [transaction.transaction_id, operation.operation_type.value, operation.node.name]
+            )
+        else:
+            schedule.append(
+                [
+                    transaction.transaction_id,
+                    operation.operation_type.value,
+                    operation.node.name,
+                    list(operation.key_range),
+                ]
+            )
+    return schedule
+
+
+def save_baseline(result, path):
+    with open(path, "w") as file:
+        json.dump(result, file)
+
+
+def compare_with_baseline(result, baseline, time_tolerance=0.2):
+    """
+    Compares a replay result with a baseline (a stored result). Returns the differences
+    found: a replay that diverged from its trace, a schedule that changed, or a replay
+    slower than the baseline by more than `time_tolerance` (a fraction). An empty list
+    means the replay passes.
+    """
+
+    differences = []
+
+    error = result.get("error")
+    if error is not None:
+        differences.append(f"Replay failed at record {error['position']}: {error['message']}")
+
+    divergence = result.get("divergence")
+    if divergence is not None:
+        differences.append(
+            f"Replay diverged from the trace at record {divergence['position']}: "
+            f"expected {divergence['expected']}, replayed {divergence['found']}."
+        )
+
+    schedule, baseline_schedule = result["operations_order"], baseline["operations_order"]
+    for position, (entry, baseline_entry) in enumerate(zip(schedule, baseline_schedule)):
+        if entry != baseline_entry:
+            differences.append(
+                f"Schedule differs at position {position}: {entry} instead of {baseline_entry}."
+            )
+            break
+    if len(schedule) != len(baseline_schedule):
+        differences.append(
+            f"Schedule has {len(schedule)} entries instead of {len(baseline_schedule)}."
+        )
+
+    if result["elapsed"] > baseline["elapsed"] * (1 + time_tolerance):
+        change = (result["elapsed"] - baseline["elapsed"]) / baseline["elapsed"] * 100
+        differences.append(
+            f"Replay took {result['elapsed'] * 1000:.1f} ms instead of "
+            f"{baseline['elapsed'] * 1000:.1f} ms ({change:+.1f}%)."
+        )
+
+    return differences
+
+
+def _to_float(value):
+    return math.nan if value is None else value
+
+
+def _from_float(value):
+    return None if math.isnan(value) else value
+
+
+def _encode_timestamp(timestamp):
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def _decode_timestamp(microseconds):
+    return EPOCH + timedelta(microseconds=microseconds)
+
+
+def _encode_key(key):
+    """
+    Encodes a node key (or a bound of a key range): None, an int or a float.
+    """
+
+    if key is None:
+        return KEY_KIND.pack(0)
+    if isinstance(key, int):
+        return KEY_KIND.pack(1) + INT_KEY.pack(key)
+    if isinstance(key, float):
+        return KEY_KIND.pack(2) + FLOAT_KEY.pack(key)
+    raise ValueError(f"Cannot record the key {key!r}, trace keys must be numbers.")
+
+
+def _encode_key_range(key_range):
+    if key_range is None:
+        return KEY_KIND.pack(0)
+    return _encode_key(key_range[0]) + _encode_key(key_range[1])
+
+
+def _decode_key(data, offset):
+    kind = data[offset]
+    offset += KEY_KIND.size
+    if kind == 0:
+        return None, offset
+    if kind == 1:
+        return INT_KEY.unpack_from(data, offset)[0], offset + INT_KEY.size
+    return FLOAT_KEY.unpack_from(data, offset)[0], offset + FLOAT_KEY.size
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from modules.retry import RetryPolicy
+    from modules.workload import WorkloadGenerator
+
+    # Record a contended run with restarts, then replay it and check it against itself
+    generator = WorkloadGenerator(transactions=300, zipf_skew=1.0, depth=3, fan_out=5, seed=7)
+    schedule = generator.generate()
+
+    directory = tempfile.mkdtemp()
+    trace_path = os.path.join(directory, "run.trace")
+    baseline_path = os.path.join(directory, "baseline.json")
+
+    recorder = TraceRecorder(trace_path)
+    await_graph = Graph()
+    lock_manager = LockManager(
+        generator.granularity_graph,
+        await_graph,
+        retry_policy=RetryPolicy(max_retries=3, base_delay=0, seed=0),
+        trace=recorder,
+        verbose=False,
+    )
+    transactions = {}
+    for transaction_index, node, operation_type in schedule:
+        if transaction_index not in transactions:
+            transactions[transaction_index] = Transaction(lock_manager, await_graph)
+        transactions[transaction_index].create_operation(node, operation_type)
+    while lock_manager.restart_timers:
+        lock_manager.run_restarts(math.inf)
+    recorder.close()
+
+    print(
+        f"Recorded {recorder.records} records in {os.path.getsize(trace_path)} bytes, "
+        f"{lock_manager.metrics.deadlocks} deadlocks"
+    )
+
+    replayer = TraceReplayer(trace_path)
+    baseline = replayer.run(repeat=3)
+    print(
+        f"Replayed {baseline['operations']} operations in {baseline['elapsed'] * 1000:.1f} ms "
+        f"({baseline['operations_per_second']:.0f} ops/s)"
+    )
+    print("Same schedule as recorded:", baseline["operations_order"] == encode_schedule(lock_manager.operations_order))
+
+    save_baseline(baseline, baseline_path)
+    with open(baseline_path) as file:
+        differences = compare_with_baseline(replayer.run(repeat=3), json.load(file), time_tolerance=1.0)
+    print("Regression check:", "passed" if not differences else "\n".join(differences))
@@ -1,41 +1,94 @@
 from modules.operation import Operation, OperationType
-from datetime import datetime
+from datetime import datetime, timedelta
 from modules.granularity_graph import GranularityGraphNode
+import threading
 import time
 from modules.lock import Lock, LockType
 
 
 class Transaction:
     transaction_counter = 1
+    last_timestamp = None
+    counter_lock = threading.Lock()  # Guards the counter and timestamps across threads
 
-    def __init__(self, lock_manager, await_graph):
+    def __init__(self, lock_manager, await_graph, transaction_id=None, timestamp=None):
         """
         Initializes a transaction with a unique transaction ID.
+        An id and timestamp can be given to mirror a transaction created elsewhere
+        (e.g. by the coordinator of a partitioned lock manager).
         """
-        self.transaction_id = Transaction.transaction_counter
-        Transaction.transaction_counter += 1
+        if transaction_id is None:
+            with Transaction.counter_lock:
+                self.transaction_id = Transaction.transaction_counter
+                Transaction.transaction_counter += 1
+                self.timestamp = Transaction._next_timestamp()
+        else:
+            self.transaction_id = transaction_id
+            self.timestamp = timestamp
 
         self.state = "active"  # Possible states: active, blocked, committed, aborted
         self.waiting_for = None
+        self.waiting_lock_type = None
         self.pending_operations = []  # Operations waiting to be retried
         self.lock_manager = lock_manager
         self.locks_held = {}
+        self.range_locks = []  # RangeLock held on key ranges below a node
+        self.indexed_locks = {}  # node -> (RangeIndex, IntervalEntry) of its lock in range indexes
         self.await_graph = await_graph
-        time.sleep(0.1)  # Simulate delay for unique timestamp
-        self.timestamp = datetime.now()
+        self.blocked_at = None
+        self.wait_times = []  # Seconds spent blocked, one entry per wait
+        self.lock_timeout = None  # Overrides the lock manager's default lock timeout
+        self.wait_deadline = None  # Deadline of the current wait, if any
+        self.wait_sequence = 0  # Identifies the current wait for the timeout timers
+        self.failed_operations = []  # Operations dropped after a lock timeout
+        self.declared_locks = None  # Canonical (node, lock type) list once predeclared
+        self.declared_lock_set = None  # Lock set as given to predeclare, kept for restarts
+        self.operation_log = []  # Every operation submitted, replayed on restart
+        self.abort_count = 0
 
         await_graph.add_vertex(self)
+        lock_manager.metrics.observe_await_graph(await_graph)
+        if lock_manager.trace is not None:
+            lock_manager.trace.record_begin(self)
 
     def create_operation(
-        self, node: GranularityGraphNode, operation_type: OperationType
+        self,
+        node: GranularityGraphNode,
+        operation_type: OperationType,
+        timeout=None,
+        key_range=None,
     ):
         """
         Adds an operation to the pending_operations and executes it if possible.
+        With key_range = (low, high) the operation covers the keys low <= key < high below
+        the node and takes a key-range lock instead of a lock on the whole node.
         """
-        operation = Operation(operation_type, node)
+        if self.lock_manager.trace is not None:
+            self.lock_manager.trace.record_operation(
+                self, node, operation_type, timeout, key_range
+            )
+        self.lock_manager.expire_lock_timeouts()
+        self.lock_manager.run_restarts()
+
+        operation = Operation(operation_type, node, timeout, key_range)
+        if self.declared_locks is not None:
+            self.lock_manager.check_declared_operation(self, operation)
+
+        self.operation_log.append(operation)
         self.pending_operations.append(operation)
         self.execute_operations()
 
+    def predeclare(self, lock_set):
+        """
+        Declares the full set of (node, operation type) the transaction will access and
+        acquires all of its locks at once (conservative 2PL). Later operations must stay
+        inside the declared set. Returns False if the transaction has to wait for the set.
+        """
+        self.declared_lock_set = list(lock_set)
+        if self.lock_manager.trace is not None:
+            self.lock_manager.trace.record_predeclare(self, self.declared_lock_set)
+        return self.lock_manager.acquire_all(self, self.declared_lock_set)
+
     def execute_operations(self):
         """
         Tries to execute pending operations.
@@ -45,10 +98,26 @@ class Transaction:
                 # Try to execute the first pending operation
                 operation = self.pending_operations[0]
                 if operation.operation_type == OperationType.COMMIT:
-                    self.convert_write_locks_to_cl()
+                    if not self.convert_write_locks_to_cl():
+                        break  # Waiting for readers to finish before certifying
                     self.commit_transaction()
                     continue
 
+                if self.declared_locks is not None:
+                    # Covered by the predeclared lock set, which is already held
+                    self.lock_manager.operations_order.append((self, operation))
+                    self.pending_operations.pop(0)
+                    continue
+
+                if operation.key_range is not None:
+                    if not self.lock_manager.request_range_lock(
+                        self, operation.node, operation.key_range, operation.operation_type
+                    ):
+                        break  # Waiting for a conflicting lock on the keys
+                    self.lock_manager.operations_order.append((self, operation))
+                    self.pending_operations.pop(0)
+                    continue
+
                 requested_lock_type = Lock.get_lock_type_based_on_operation(
                     operation.operation_type
                 )
@@ -59,31 +128,38 @@ class Transaction:
 
                     # If the current lock is not the requested one, promote it
                     if current_lock_type != requested_lock_type:
-                        print(
-                            f"Transaction {self.transaction_id} is promoting lock from {current_lock_type} to {requested_lock_type} on {operation.node}."
-                        )
+                        if self.lock_manager.verbose:
+                            print(
+                                f"Transaction {self.transaction_id} is promoting lock from {current_lock_type} to {requested_lock_type} on {operation.node}."
+                            )
                         success = self.lock_manager.promote_lock(
                             self, operation.node, requested_lock_type
                         )
 
                         if success:
-                            print(
-                                f"Transaction {self.transaction_id} successfully promoted lock on {operation.node} to {requested_lock_type}."
-                            )
+                            if self.lock_manager.verbose:
+                                print(
+                                    f"Transaction {self.transaction_id} successfully promoted lock on {operation.node} to {requested_lock_type}."
+                                )
                             self.lock_manager.operations_order.append((self, operation))
                             self.pending_operations.pop(
                                 0
                             )  # Remove the operation after success
                         else:
-                            print(
-                                f"Transaction {self.transaction_id} failed to promote lock on {operation.node}."
+                            if self.lock_manager.verbose:
+                                print(
+                                    f"Transaction {self.transaction_id} failed to promote lock on {operation.node}."
+                                )
+                            self.lock_manager.wait_for_promotion(
+                                self, operation.node, requested_lock_type
                             )
                             break  # Stop if promotion fails
                     else:
                         # If the lock is the same as requested, no need to promote
-                        print(
-                            f"Transaction {self.transaction_id} already holds the requested lock {current_lock_type} on {operation.node}."
-                        )
+                        if self.lock_manager.verbose:
+                            print(
+                                f"Transaction {self.transaction_id} already holds the requested lock {current_lock_type} on {operation.node}."
+                            )
                         self.lock_manager.operations_order.append((self, operation))
                         self.pending_operations.pop(0)  # Remove the operation
                 else:
@@ -92,9 +168,10 @@ class Transaction:
                         self, operation.node, operation.operation_type
                     )
                     if success:
-                        print(
-                            f"Transaction {self.transaction_id} acquired lock {requested_lock_type} on {operation.node}."
-                        )
+                        if self.lock_manager.verbose:
+                            print(
+                                f"Transaction {self.transaction_id} acquired lock {requested_lock_type} on {operation.node}."
+                            )
                         self.lock_manager.operations_order.append((self, operation))
                         self.pending_operations.pop(
                             0
@@ -107,75 +184,147 @@ class Transaction:
     def convert_write_locks_to_cl(self):
         """
         Converts all WRITE locks held by the transaction to Certify Locks (CL) before commit.
+        Returns False if the transaction has to wait for readers of one of the nodes.
         """
 
         # self.lock_manager.granularity_graph.print_graph()
 
         for node, lock_type in list(self.locks_held.items()):
             if lock_type == LockType.WL:  # Convert WRITE locks to CL
-                print(
-                    f"Transaction {self.transaction_id} is converting WRITE lock on {node.name} to CL."
-                )
-                self.lock_manager.promote_lock(self, node, LockType.CL)
+                if self.lock_manager.verbose:
+                    print(
+                        f"Transaction {self.transaction_id} is converting WRITE lock on {node.name} to CL."
+                    )
+                if not self.lock_manager.promote_lock(
+                    self, node, LockType.CL
+                ) and self.lock_manager.wait_for_promotion(self, node, LockType.CL):
+                    return False
+
+        if self.range_locks and not self.lock_manager.certify_range_locks(self):
+            return False
 
         # self.lock_manager.granularity_graph.print_graph()
+        if self.lock_manager.wal is not None:
+            self.lock_manager.wal.log_certify(self)
+        return True
 
-    def block_transaction(self, node):
+    def block_transaction(self, node, lock_type=None):
         """
         Blocks the transaction and prevents further operations.
         """
         self.state = "blocked"
         self.waiting_for = node
-        print(f"Transaction {self.transaction_id} is now blocked waiting for {node}.")
+        self.waiting_lock_type = lock_type
+        self.blocked_at = time.perf_counter()
+        if self.lock_manager.verbose:
+            print(f"Transaction {self.transaction_id} is now blocked waiting for {node}.")
 
     def unblock_transaction(self):
         """
         Unblocks the transaction and retries pending operations.
         """
+        if self.blocked_at is not None:
+            wait_time = time.perf_counter() - self.blocked_at
+            self.wait_times.append(wait_time)
+            self.lock_manager.metrics.record_wait(
+                self.waiting_for, self.waiting_lock_type, wait_time
+            )
+            self.blocked_at = None
+
         self.state = "active"
         self.waiting_for = None
-        print(f"Transaction {self.transaction_id} is now unblocked.")
+        self.waiting_lock_type = None
+        self.wait_deadline = None
+        if self.lock_manager.verbose:
+            print(f"Transaction {self.transaction_id} is now unblocked.")
 
     def commit_transaction(self):
         """
         Commits the transaction, releases all locks, and clears pending operations.
         """
+        if self.lock_manager.wal is not None:
+            self.lock_manager.wal.log_commit(self)  # Durable before the locks go
         self.state = "committed"
         self.lock_manager.release_all_locks(self)
         self.pending_operations.clear()
         waiting_transactions = self._unblock_waiting_transactions()
-        del self.await_graph.vertices[self.transaction_id]
+        self.await_graph.remove_vertex(self.transaction_id)
+        self.lock_manager.metrics.observe_await_graph(self.await_graph)
         self.lock_manager.operations_order.append((self, "Commited"))
 
-        print(f"Transaction {self.transaction_id} committed.")
+        if self.lock_manager.verbose:
+            print(f"Transaction {self.transaction_id} committed.")
+
+        granted_transactions = self.lock_manager.retry_lock_set_waiters()
 
         for _, data in waiting_transactions:
             data["transaction"].execute_operations()
+        for transaction in granted_transactions:
+            transaction.execute_operations()
+
+        self.lock_manager.run_restarts_after_release()
 
     def abort_transaction(self):
         """
         Aborts the transaction, clears all locks, and resets its state.
         """
+        if self.lock_manager.wal is not None:
+            self.lock_manager.wal.log_abort(self)
         self.state = "aborted"
         self.lock_manager.release_all_locks(self)
         self.pending_operations.clear()
 
         self.lock_manager.operations_order.append((self, "Aborted"))
-        print(f"Transaction {self.transaction_id} aborted.")
+        if self.lock_manager.verbose:
+            print(f"Transaction {self.transaction_id} aborted.")
 
         waiting_transactions = self._unblock_waiting_transactions()
-        del self.await_graph.vertices[self.transaction_id]
+        self.await_graph.remove_vertex(self.transaction_id)
+        self.lock_manager.metrics.observe_await_graph(self.await_graph)
+
+        granted_transactions = self.lock_manager.retry_lock_set_waiters()
 
         for _, data in waiting_transactions:
             data["transaction"].execute_operations()
+        for transaction in granted_transactions:
+            transaction.execute_operations()
+
+        self.abort_count += 1
+        self.lock_manager.schedule_restart(self)
+        self.lock_manager.run_restarts_after_release()
+
+    def restart_transaction(self):
+        """
+        Restarts an aborted transaction from its operation log, keeping its id and its
+        original timestamp (so it keeps getting older and eventually wins deadlocks).
+        """
+        self.state = "active"
+        self.await_graph.add_vertex(self)
+        self.lock_manager.metrics.observe_await_graph(self.await_graph)
+        if self.lock_manager.verbose:
+            print(f"Transaction {self.transaction_id} restarted.")
+
+        self.pending_operations = list(self.operation_log)
+        if self.declared_lock_set is not None:
+            self.declared_locks = None
+            self.lock_manager.acquire_all(self, self.declared_lock_set)
+
+        self.execute_operations()
 
     def _unblock_waiting_transactions(self):
         """
-        Unblock transactions waiting for current transaction
+        Unblock transactions waiting for current transaction.
+        They are returned (and so retried) in deadline order, closest deadline first.
         """
         waiting_transactions = self.await_graph.get_waiting_transactions(
             self.transaction_id
         )
+        waiting_transactions.sort(
+            key=lambda waiting: (
+                waiting[1]["transaction"].wait_deadline is None,
+                waiting[1]["transaction"].wait_deadline or 0,
+            )
+        )
 
         for vertex, data in waiting_transactions:
             waiting_transaction = data["transaction"]
@@ -187,6 +336,26 @@ class Transaction:
 
         return waiting_transactions
 
+    @staticmethod
+    def _next_timestamp():
+        """
+        Returns the current time, nudged forward so that timestamps are unique and increasing.
+        """
+        timestamp = datetime.now()
+        if (
+            Transaction.last_timestamp is not None
+            and timestamp <= Transaction.last_timestamp
+        ):
+            timestamp = Transaction.last_timestamp + timedelta(microseconds=1)
+
+        Transaction.last_timestamp = timestamp
+        return timestamp
+
+    def __hash__(self):
+        # By id rather than by address, so that iterating over sets of transactions (the
+        # holders of a lock) goes in the same order on every run of the same schedule
+        return hash(self.transaction_id)
+
     @staticmethod
     def get_most_recent_transaction(transaction, blocking_transaction):
         """
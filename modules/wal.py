@@ -0,0 +1,431 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from modules.lock import LockType
+from modules.transaction import Transaction
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+
+
+# Record: header followed by `length` bytes of payload. The CRC covers everything after it,
+# so a record torn by a crash is detected and the log is cut there.
+RECORD_HEADER = struct.Struct("!IBII")  # crc32, record type, transaction id, payload length
+LOCK_ENTRY = struct.Struct("!BH")  # lock type, node name length (followed by the name)
+CHECKPOINT_ENTRY = struct.Struct("!IBI")  # transaction id, certified, number of locks
+CHECKPOINT_OFFSET = struct.Struct("!Q")
+
+GRANT, CERTIFY, COMMIT, ABORT, CHECKPOINT = range(1, 6)
+
+LOCK_TYPES = list(LockType)
+LOCK_CODES = {lock_type: code for code, lock_type in enumerate(LOCK_TYPES)}
+
+
+class WriteAheadLog:
+    def __init__(self, path, sync=True, log_grants=False, group_commit_delay=0.0):
+        """
+        Append-only binary log of the lock manager's certify, commit and abort decisions
+        (and of every granted lock with `log_grants`).
+
+        Commit records are forced to disk before the locks are released. Transactions
+        committing at the same time share one fsync: the first one to flush becomes the
+        leader and writes everything appended so far, the others wait for it (the leader can
+        wait `group_commit_delay` seconds first to gather more of them). Certify and abort
+        records are not forced on their own; the next forced record covers them.
+
+        `checkpoint` snapshots the locks of the running transactions, and `recover` starts
+        from the last checkpoint (its offset is kept in `path + ".checkpoint"`), reading the
+        log through mmap, so recovery only costs the tail written since.
+        """
+
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+        self.sync = sync
+        self.log_grants = log_grants
+        self.group_commit_delay = group_commit_delay
+
+        self.file = open(path, "a+b")
+        self.buffer = bytearray()
+        self.next_lsn = self.file.seek(0, os.SEEK_END)  # Log offset after the last record
+        self.durable_lsn = self.next_lsn
+        self.flushing = False
+        self.condition = threading.Condition()
+        self.certified = {}  # transaction_id -> certified lock set, until it commits or aborts
+        # transaction_id -> abort count when its commit or abort was logged (it may still hold
+        # locks; a restart gets a higher abort count)
+        self.decided = {}
+
+        self.records = 0
+        self.flushes = 0
+
+    def _append(self, record_type, transaction_id, payload=b""):
+        """
+        Buffers a record and returns its end offset (LSN).
+        """
+
+        body = struct.pack("!BII", record_type, transaction_id, len(payload)) + payload
+        record = struct.pack("!I", zlib.crc32(body)) + body
+
+        with self.condition:
+            self.buffer += record
+            self.next_lsn += len(record)
+            self.records += 1
+            return self.next_lsn
+
+    def flush(self, lsn=None):
+        """
+        Makes the log durable up to lsn (everything appended so far by default).
+        """
+
+        with self.condition:
+            if lsn is None:
+                lsn = self.next_lsn
+
+            while self.flushing and self.durable_lsn < lsn:
+                self.condition.wait()  # Follower: the running flush may cover us
+            if self.durable_lsn >= lsn:
+                return
+
+            self.flushing = True
+
+        end = None
+        try:
+            if self.group_commit_delay:
+                time.sleep(self.group_commit_delay)
+
+            with self.condition:
+                data = bytes(self.buffer)
+                self.buffer.clear()
+                end = self.next_lsn
+
+            self.file.write(data)
+            self.file.flush()
+            if self.sync:
+                os.fsync(self.file.fileno())
+        finally:
+            with self.condition:
+                self.flushing = False
+                if end is not None:
+                    self.durable_lsn = end
+                    self.flushes += 1
+                self.condition.notify_all()
+
+    def log_grant(self, transaction, node: GranularityGraphNode, lock_type):
+        if self.log_grants:
+            self._append(GRANT, transaction.transaction_id, _encode_lock(node, lock_type))
+
+    def log_certify(self, transaction):
+        """
+        Logs that the transaction certified, with the locks it holds.
+        """
+
+        lock_set = [(node.name, lock_type) for node, lock_type in transaction.locks_held.items()]
+        with self.condition:
+            self.certified[transaction.transaction_id] = lock_set
+
+        payload = b"".join(_encode_lock_name(name, lock_type) for name, lock_type in lock_set)
+        self._append(CERTIFY, transaction.transaction_id, payload)
+
+    def log_commit(self, transaction):
+        """
+        Logs the commit and waits until it is on disk.
+        """
+
+        self.flush(self.append_commit(transaction))
+
+    def append_commit(self, transaction):
+        """
+        Logs the commit without waiting for the disk. Returns the LSN to flush up to.
+        """
+
+        with self.condition:
+            self.certified.pop(transaction.transaction_id, None)
+            self.decided[transaction.transaction_id] = transaction.abort_count
+            return self._append(COMMIT, transaction.transaction_id)
+
+    def log_abort(self, transaction):
+        with self.condition:
+            self.certified.pop(transaction.transaction_id, None)
+            self.decided[transaction.transaction_id] = transaction.abort_count
+            self._append(ABORT, transaction.transaction_id)
+
+    def checkpoint(self, lock_manager):
+        """
+        Logs the locks of every running transaction, forces the log and records the
+        checkpoint's offset. Returns that offset.
+
+        The lock manager keeps its lock tables still while the record is built, and the
+        record is appended under the same latch as commits and aborts, so a transaction is
+        either decided before the checkpoint or live in it.
+        """
+
+        offset, lsn = lock_manager.call_with_running_transactions(self._append_checkpoint)
+        self.flush(lsn)
+
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, "wb") as checkpoint_file:
+            checkpoint_file.write(CHECKPOINT_OFFSET.pack(offset))
+            checkpoint_file.flush()
+            if self.sync:
+                os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_path, self.checkpoint_path)
+
+        return offset
+
+    def _append_checkpoint(self, transactions):
+        """
+        Appends the CHECKPOINT record of the running transactions. Returns its start and end.
+        """
+
+        with self.condition:
+            # Decided transactions are before the checkpoint even if they still hold locks
+            decided = self.decided
+            self.decided = {}
+            entries = []
+            for transaction in transactions:
+                transaction_id = transaction.transaction_id
+                if transaction_id in decided:
+                    self.decided[transaction_id] = decided[transaction_id]
+                    if decided[transaction_id] == transaction.abort_count:
+                        continue
+                if transaction.state in ("committed", "aborted"):
+                    continue
+
+                lock_set = self.certified.get(transaction_id)
+                certified = lock_set is not None
+                if lock_set is None:
+                    lock_set = [
+                        (node.name, lock_type) for node, lock_type in transaction.locks_held.items()
+                    ]
+
+                entries.append(
+                    CHECKPOINT_ENTRY.pack(transaction_id, certified, len(lock_set))
+                    + b"".join(_encode_lock_name(name, lock_type) for name, lock_type in lock_set)
+                )
+
+            offset = self.next_lsn
+            return offset, self._append(CHECKPOINT, 0, b"".join(entries))
+
+    def recover(self, lock_manager=None):
+        """
+        Replays the log from the last checkpoint and cuts off a torn tail.
+
+        Transactions that committed or aborted since the checkpoint are done. Certified
+        transactions without a decision are in doubt: they keep their locks and, with a
+        lock_manager, are rebuilt in it (with their original ids) to be committed or aborted.
+        Every other running transaction is lost, i.e. aborted by the crash.
+        Returns a dict of "committed", "aborted" and "lost" id sets and "in_doubt"
+        (transaction_id -> list of (node name, lock type), or -> Transaction with a lock_manager).
+        """
+
+        self.flush()
+
+        offset = 0
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "rb") as checkpoint_file:
+                offset = CHECKPOINT_OFFSET.unpack(checkpoint_file.read())[0]
+
+        live = {}  # transaction_id -> [certified, {node name: lock type}]
+        committed = set()
+        aborted = set()
+        size = os.path.getsize(self.path)
+        end = offset
+
+        if size > offset:
+            with open(self.path, "rb") as log_file, mmap.mmap(
+                log_file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as log:
+                for record_type, transaction_id, payload, end in _records(log, offset):
+                    if record_type == CHECKPOINT:
+                        live = _decode_checkpoint(payload)
+                    elif record_type == GRANT:
+                        locks = live.setdefault(transaction_id, [False, {}])[1]
+                        locks.update(_decode_locks(payload)[0])
+                        aborted.discard(transaction_id)
+                    elif record_type == CERTIFY:
+                        live[transaction_id] = [True, dict(_decode_locks(payload)[0])]
+                        aborted.discard(transaction_id)
+                    elif record_type == COMMIT:
+                        live.pop(transaction_id, None)
+                        committed.add(transaction_id)
+                    elif record_type == ABORT:
+                        live.pop(transaction_id, None)
+                        aborted.add(transaction_id)
+
+        if end < size:
+            # Torn or corrupt tail: drop it so new records follow the last valid one
+            self.file.truncate(end)
+        self.file.seek(0, os.SEEK_END)
+        with self.condition:
+            self.next_lsn = self.durable_lsn = max(end, offset)
+
+        in_doubt = {
+            transaction_id: list(locks.items())
+            for transaction_id, (certified, locks) in live.items()
+            if certified
+        }
+        lost = {transaction_id for transaction_id, (certified, _) in live.items() if not certified}
+
+        with self.condition:
+            self.certified.update(in_doubt)
+
+        # New transactions must not reuse the ids found in the log
+        seen = committed | aborted | lost | set(in_doubt)
+        with Transaction.counter_lock:
+            Transaction.transaction_counter = max(
+                Transaction.transaction_counter, max(seen, default=0) + 1
+            )
+
+        if lock_manager is not None:
+            in_doubt = _restore(lock_manager, in_doubt)
+
+        return {"committed": committed, "aborted": aborted, "lost": lost, "in_doubt": in_doubt}
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _encode_lock(node, lock_type):
+    return _encode_lock_name(node.name, lock_type)
+
+
+def _encode_lock_name(name, lock_type):
+    encoded = name.encode()
+    return LOCK_ENTRY.pack(LOCK_CODES[lock_type], len(encoded)) + encoded
+
+
+def _decode_locks(payload, offset=0, count=None):
+    """
+    Decodes `count` (node name, lock type) pairs, or up to the end of the payload.
+    Returns them and the offset after the last one.
+    """
+
+    locks = []
+    while (offset < len(payload)) if count is None else (len(locks) < count):
+        code, length = LOCK_ENTRY.unpack_from(payload, offset)
+        offset += LOCK_ENTRY.size
+        locks.append((payload[offset:offset + length].decode(), LOCK_TYPES[code]))
+        offset += length
+
+    return locks, offset
+
+
+def _decode_checkpoint(payload):
+    live = {}
+    offset = 0
+
+    while offset < len(payload):
+        transaction_id, certified, count = CHECKPOINT_ENTRY.unpack_from(payload, offset)
+        locks, offset = _decode_locks(payload, offset + CHECKPOINT_ENTRY.size, count)
+        live[transaction_id] = [bool(certified), dict(locks)]
+
+    return live
+
+
+def _records(log, offset):
+    """
+    Yields (record type, transaction id, payload, end offset) for every valid record from
+    offset on. Stops at the first torn or corrupt one.
+    """
+
+    view = memoryview(log)
+    try:
+        while offset + RECORD_HEADER.size <= len(log):
+            crc, record_type, transaction_id, length = RECORD_HEADER.unpack_from(log, offset)
+            end = offset + RECORD_HEADER.size + length
+            if end > len(log) or zlib.crc32(view[offset + 4:end]) != crc:
+                return
+
+            yield record_type, transaction_id, bytes(view[offset + RECORD_HEADER.size:end]), end
+            offset = end
+    finally:
+        view.release()
+
+
+def _restore(lock_manager, in_doubt):
+    """
+    Rebuilds the in-doubt transactions in the lock manager, holding their logged locks.
+    """
+
+    nodes = {}
+    stack = [lock_manager.granularity_graph.root]
+    while stack:
+        node = stack.pop()
+        nodes[node.name] = node
+        stack.extend(node.children)
+
+    transactions = {}
+    for transaction_id, locks in sorted(in_doubt.items()):
+        transaction = Transaction(
+            lock_manager,
+            lock_manager.await_graph,
+            transaction_id=transaction_id,
+            timestamp=Transaction._next_timestamp(),
+        )
+        lock_manager.prepare_transaction(transaction)
+        for name, lock_type in locks:
+            if name not in nodes:
+                raise ValueError(f"Node {name} of transaction {transaction_id} is unknown.")
+            lock_manager.restore_lock(transaction, nodes[name], lock_type)
+        transactions[transaction_id] = transaction
+
+    return transactions
+
+
+if __name__ == "__main__":
+    import io
+    import tempfile
+    from contextlib import redirect_stdout
+
+    from modules.lock_manager import LockManager
+    from modules.await_graph import Graph
+    from modules.operation import OperationType
+
+    def build_graph():
+        granularity_graph = GranularityGraph()
+        table_node = GranularityGraphNode("Table1")
+        granularity_graph.add_node(granularity_graph.root, table_node)
+        for index in range(1, 4):
+            granularity_graph.add_node(table_node, GranularityGraphNode(f"Tuple{index}"))
+        return granularity_graph, table_node.children
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "locks.wal")
+
+    granularity_graph, tuples = build_graph()
+    wal = WriteAheadLog(path, log_grants=True)
+    lock_manager = LockManager(granularity_graph, Graph(), wal=wal)
+
+    with redirect_stdout(io.StringIO()):
+        transaction1 = Transaction(lock_manager, lock_manager.await_graph)
+        transaction1.create_operation(tuples[0], OperationType.WRITE)
+        transaction1.create_operation(None, OperationType.COMMIT)
+
+        transaction2 = Transaction(lock_manager, lock_manager.await_graph)
+        transaction2.create_operation(tuples[1], OperationType.WRITE)
+        wal.checkpoint(lock_manager)
+
+        # Transaction 2 certifies, then the process "crashes" before it commits
+        transaction2.convert_write_locks_to_cl()
+        transaction3 = Transaction(lock_manager, lock_manager.await_graph)
+        transaction3.create_operation(tuples[2], OperationType.READ)
+    wal.close()
+
+    granularity_graph, tuples = build_graph()
+    lock_manager = LockManager(granularity_graph, Graph())
+    with WriteAheadLog(path) as wal:
+        state = wal.recover(lock_manager)
+
+    print(f"Committed: {sorted(state['committed'])}, lost: {sorted(state['lost'])}")
+    for transaction_id, transaction in state["in_doubt"].items():
+        locks = {node.name: lock_type.name for node, lock_type in transaction.locks_held.items()}
+        print(f"In doubt: transaction {transaction_id} holding {locks}")
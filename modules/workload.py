@@ -0,0 +1,202 @@
+import random
+from bisect import bisect_left
+from itertools import accumulate
+
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.operation import OperationType
+
+
+LEVEL_NAMES = ["Area", "Table", "Page", "Tuple"]
+
+
+def build_hierarchy(depth=4, fan_out=4):
+    """
+    Builds a granularity graph with `depth` levels below the database root, each node
+    having `fan_out` children. Returns the graph and the list of nodes per level.
+    """
+
+    granularity_graph = GranularityGraph()
+    levels = [[granularity_graph.root]]
+
+    for level in range(1, depth + 1):
+        level_name = LEVEL_NAMES[level - 1] if level <= len(LEVEL_NAMES) else f"Level{level}_"
+        nodes = []
+
+        for parent in levels[-1]:
+            for _ in range(fan_out):
+                node = GranularityGraphNode(f"{level_name}{len(nodes) + 1}")
+                granularity_graph.add_node(parent, node)
+                nodes.append(node)
+
+        levels.append(nodes)
+
+    return granularity_graph, levels
+
+
+class ZipfSampler:
+    def __init__(self, size, skew, rng: random.Random):
+        """
+        Samples indexes in [0, size) where index i has weight 1 / (i + 1) ** skew.
+        A skew of 0 is uniform.
+        """
+
+        self.rng = rng
+        self.cumulative_weights = list(
+            accumulate(1.0 / (rank**skew) for rank in range(1, size + 1))
+        )
+        self.total_weight = self.cumulative_weights[-1]
+
+    def sample(self):
+        return bisect_left(
+            self.cumulative_weights, self.rng.random() * self.total_weight
+        )
+
+
+class WorkloadGenerator:
+    def __init__(
+        self,
+        transactions=100,
+        operations_per_transaction=4,
+        operation_mix=None,
+        zipf_skew=0.0,
+        depth=4,
+        fan_out=4,
+        level_mix=None,
+        concurrency=8,
+        seed=0,
+    ):
+        """
+        Generates synthetic schedules for the lock manager.
+
+        `operation_mix` weights READ/UPDATE/WRITE operations, `zipf_skew` controls how hot the
+        most popular leaf nodes are and `level_mix` weights the level (1 = just below the root,
+        `depth` = leaves) at which each lock is taken. `concurrency` is how many transactions
+        are interleaved at any time.
+        """
+
+        if operation_mix is None:
+            operation_mix = {
+                OperationType.READ: 0.6,
+                OperationType.UPDATE: 0.1,
+                OperationType.WRITE: 0.3,
+            }
+        if level_mix is None:
+            level_mix = {depth: 1.0}
+
+        self.transactions = transactions
+        self.operations_per_transaction = operations_per_transaction
+        self.operation_types = list(operation_mix)
+        self.operation_weights = list(operation_mix.values())
+        self.levels = list(level_mix)
+        self.level_weights = list(level_mix.values())
+        self.depth = depth
+        self.fan_out = fan_out
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+
+        self.granularity_graph, self.nodes_by_level = build_hierarchy(depth, fan_out)
+
+        # Shuffle so the hot keys are spread across pages and tables
+        self.leaves = list(self.nodes_by_level[depth])
+        self.rng.shuffle(self.leaves)
+        self.leaf_sampler = ZipfSampler(len(self.leaves), zipf_skew, self.rng)
+
+    def _pick_node(self):
+        """
+        Picks a leaf following the Zipfian distribution and climbs to the sampled level.
+        """
+
+        node = self.leaves[self.leaf_sampler.sample()]
+        level = self.rng.choices(self.levels, self.level_weights)[0]
+
+        for _ in range(self.depth - level):
+            node = node.parent
+
+        return node
+
+    def _overlaps(self, node, accessed_nodes):
+        """
+        Checks if the node is, or is an ancestor or descendant of, an already accessed node.
+        """
+
+        ancestor = node
+        while ancestor is not None:
+            if ancestor in accessed_nodes:
+                return True
+            ancestor = ancestor.parent
+
+        return any(
+            self._is_ancestor(node, accessed_node) for accessed_node in accessed_nodes
+        )
+
+    @staticmethod
+    def _is_ancestor(node, descendant):
+        ancestor = descendant.parent
+        while ancestor is not None:
+            if ancestor is node:
+                return True
+            ancestor = ancestor.parent
+        return False
+
+    def _generate_transaction(self):
+        """
+        Generates the operations of one transaction. A transaction never locks overlapping
+        subtrees twice: the lock manager blocks a transaction on its own intention locks.
+        """
+
+        operations = []
+        accessed_nodes = set()
+
+        for _ in range(self.operations_per_transaction):
+            for _ in range(10):
+                node = self._pick_node()
+                if not self._overlaps(node, accessed_nodes):
+                    break
+            else:
+                continue
+
+            accessed_nodes.add(node)
+            operation_type = self.rng.choices(
+                self.operation_types, self.operation_weights
+            )[0]
+            operations.append((node, operation_type))
+
+        operations.append((None, OperationType.COMMIT))
+        return operations
+
+    def generate(self):
+        """
+        Returns the schedule as a list of (transaction_index, node, operation_type) tuples,
+        interleaving up to `concurrency` transactions at a time.
+        """
+
+        schedule = []
+        open_transactions = []
+        next_transaction = 0
+
+        while next_transaction < self.transactions or open_transactions:
+            while (
+                len(open_transactions) < self.concurrency
+                and next_transaction < self.transactions
+            ):
+                open_transactions.append(
+                    [next_transaction, self._generate_transaction()]
+                )
+                next_transaction += 1
+
+            position = self.rng.randrange(len(open_transactions))
+            transaction_index, operations = open_transactions[position]
+            node, operation_type = operations.pop(0)
+            schedule.append((transaction_index, node, operation_type))
+
+            if not operations:
+                open_transactions.pop(position)
+
+        return schedule
+
+
+if __name__ == "__main__":
+    generator = WorkloadGenerator(transactions=3, operations_per_transaction=2, depth=2, fan_out=2)
+
+    for transaction_index, node, operation_type in generator.generate():
+        print(f"Transaction {transaction_index}: {operation_type.name} on {node}")
@@ -4,6 +4,7 @@ from modules.granularity_graph import GranularityGraph, GranularityGraphNode
 from modules.transaction import Transaction
 from modules.operation import OperationType
 from modules.await_graph import Graph
+from modules.serializability import verify_schedule, format_cycle
 
 
 def main():
@@ -60,6 +61,13 @@ def main():
     print("\nSchedule of operations:")
     lock_manager.print_schedule_order()
 
+    cycle = verify_schedule(lock_manager.operations_order)
+    if cycle:
+        print("\nSchedule is not serializable:")
+        print(format_cycle(cycle))
+    else:
+        print("\nSchedule is conflict serializable.")
+
     # Print the final state of the graph and locks
     print("\nFinal state of the wait-for graph:")
     await_graph.display_graph()
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from modules.async_lock_manager import AsyncLockManager
+from modules.await_graph import Graph
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.operation import OperationType
+from modules.wal import WriteAheadLog
+
+
+def test_commit_cancelled_during_flush_still_releases_locks(tmp_path, capsys):
+    granularity_graph = GranularityGraph()
+    tuple_node = GranularityGraphNode("Tuple1")
+    granularity_graph.add_node(granularity_graph.root, tuple_node)
+
+    async def scenario(wal):
+        lock_manager = AsyncLockManager(granularity_graph, Graph(), wal=wal)
+        writer = lock_manager.begin()
+        reader = lock_manager.begin()
+        await lock_manager.acquire(writer, tuple_node, OperationType.WRITE)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(lock_manager.commit(writer), 0.05)
+        assert writer.committing
+        lock_manager.abort(writer)  # A logged commit cannot be aborted
+
+        await asyncio.wait_for(
+            lock_manager.acquire(reader, tuple_node, OperationType.WRITE), 2
+        )
+        assert writer.state == "committed"
+        assert not writer.locks_held
+
+    with WriteAheadLog(str(tmp_path / "wal.log"), group_commit_delay=0.3) as wal:
+        asyncio.run(scenario(wal))
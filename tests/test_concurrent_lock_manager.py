@@ -0,0 +1,85 @@
+import threading
+
+from modules.await_graph import Graph
+from modules.concurrent_lock_manager import ThreadSafeLockManager
+from modules.errors import DeadlockVictimError
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.operation import OperationType
+from modules.serializability import verify_schedule
+
+
+def build_table(tuples=2):
+    granularity_graph = GranularityGraph()
+    table = GranularityGraphNode("Table")
+    granularity_graph.add_node(granularity_graph.root, table)
+    nodes = [GranularityGraphNode(f"Tuple{number}") for number in range(tuples)]
+    for node in nodes:
+        granularity_graph.add_node(table, node)
+    return ThreadSafeLockManager(granularity_graph, Graph()), table, nodes
+
+
+def test_pending_victim_cycle_does_not_abort_other_waiters():
+    lock_manager, _, _ = build_table()
+    first, second, third, fourth = (lock_manager.begin() for _ in range(4))
+
+    assert lock_manager._add_wait_edge(first, second) is None
+    victim = lock_manager._add_wait_edge(second, first)
+    assert victim in (first, second)
+
+    # The victim's thread has not aborted it yet: its cycle is still in the graph
+    assert lock_manager._add_wait_edge(third, fourth) is None
+    assert not third.abort_requested and not fourth.abort_requested
+    assert lock_manager.metrics.deadlocks == 1
+
+
+def test_locks_already_held_are_recorded_in_the_schedule(capsys):
+    lock_manager, table, nodes = build_table()
+    transaction = lock_manager.begin()
+
+    lock_manager.acquire(transaction, table, OperationType.WRITE)
+    lock_manager.acquire(transaction, nodes[0], OperationType.WRITE)  # Covered by the table
+    lock_manager.acquire(transaction, table, OperationType.WRITE)  # Already held
+    lock_manager.commit(transaction)
+
+    operations = [
+        (operation.operation_type, operation.node)
+        for _, operation in lock_manager.operations_order
+        if not isinstance(operation, str)
+    ]
+    assert operations == [
+        (OperationType.WRITE, table),
+        (OperationType.WRITE, nodes[0]),
+        (OperationType.WRITE, table),
+    ]
+
+
+def test_crossed_writers_deadlock_once_and_leave_no_locks(capsys):
+    lock_manager, table, nodes = build_table()
+    barrier = threading.Barrier(2)
+    outcomes = []
+
+    def client(first, second):
+        transaction = lock_manager.begin()
+        try:
+            lock_manager.acquire(transaction, first, OperationType.WRITE)
+            barrier.wait()
+            lock_manager.acquire(transaction, second, OperationType.WRITE, timeout=5)
+            lock_manager.commit(transaction)
+            outcomes.append("committed")
+        except DeadlockVictimError:
+            outcomes.append("victim")
+
+    threads = [
+        threading.Thread(target=client, args=(nodes[0], nodes[1])),
+        threading.Thread(target=client, args=(nodes[1], nodes[0])),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes) == ["committed", "victim"]
+    assert lock_manager.metrics.deadlocks == 1
+    assert verify_schedule(lock_manager.operations_order) is None
+    for node in [table] + nodes:
+        assert not any(node.locks.values())
@@ -0,0 +1,55 @@
+from modules.distributed import DistributedLockManager
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.operation import OperationType
+from modules.serializability import verify_schedule
+
+
+def build_graph():
+    granularity_graph = GranularityGraph()
+    tuples = []
+    for number in (1, 2):
+        area = GranularityGraphNode(f"Area{number}")
+        granularity_graph.add_node(granularity_graph.root, area)
+        tuples.append(GranularityGraphNode(f"Tuple{number}"))
+        granularity_graph.add_node(area, tuples[-1])
+    return granularity_graph, tuples
+
+
+def test_quiet_coordinator_breaks_a_deadlock_across_workers(capsys):
+    granularity_graph, (tuple_node1, tuple_node2) = build_graph()
+    schedule = [
+        (1, tuple_node1, OperationType.WRITE),
+        (2, tuple_node2, OperationType.WRITE),
+        (1, tuple_node2, OperationType.WRITE),
+        (2, tuple_node1, OperationType.WRITE),
+        (1, None, OperationType.COMMIT),
+        (2, None, OperationType.COMMIT),
+    ]
+
+    with DistributedLockManager(granularity_graph, workers=2) as lock_manager:
+        operations_order = lock_manager.run(schedule)
+
+    assert lock_manager.metrics.deadlocks == 1
+    outcomes = {
+        transaction.transaction_id: operation
+        for transaction, operation in operations_order
+        if isinstance(operation, str)
+    }
+    assert sorted(outcomes.values()) == ["Aborted", "Commited"]
+    assert verify_schedule(operations_order) is None
+    assert capsys.readouterr().out == ""
+
+
+def test_coordinator_locks_upper_nodes_through_the_public_hook(capsys):
+    granularity_graph, (tuple_node1, _) = build_graph()
+    area_node1 = tuple_node1.parent
+
+    with DistributedLockManager(granularity_graph, workers=2) as lock_manager:
+        reader = lock_manager.begin()
+        writer = lock_manager.begin()
+        assert lock_manager.request(reader, area_node1, OperationType.READ) == "active"
+        assert lock_manager.request(writer, tuple_node1, OperationType.WRITE) == "active"
+        assert lock_manager.commit(writer) == "blocked"  # Its ICL conflicts with the RL
+        assert lock_manager.commit(reader) == "committed"
+        assert lock_manager._state_of(writer) == "committed"
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,108 @@
+from modules.await_graph import Graph
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.lock_manager import LockManager
+from modules.operation import OperationType
+from modules.retry import RetryPolicy
+from modules.transaction import Transaction
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def build_graph():
+    granularity_graph = GranularityGraph()
+    table = GranularityGraphNode("Table1")
+    granularity_graph.add_node(granularity_graph.root, table)
+    tuples = []
+    for number in (1, 2):
+        tuples.append(GranularityGraphNode(f"Tuple{number}"))
+        granularity_graph.add_node(table, tuples[-1])
+    return granularity_graph, table, tuples
+
+
+def test_idle_blocked_transaction_times_out_from_the_driver_loop(capsys):
+    granularity_graph, _, (tuple_node, _) = build_graph()
+    clock = FakeClock()
+    lock_manager = LockManager(granularity_graph, Graph(), lock_timeout=1.0, clock=clock)
+    holder = Transaction(lock_manager, lock_manager.await_graph)
+    waiter = Transaction(lock_manager, lock_manager.await_graph)
+
+    holder.create_operation(tuple_node, OperationType.WRITE)
+    waiter.create_operation(tuple_node, OperationType.WRITE)
+    assert waiter.state == "blocked"
+    assert lock_manager.next_lock_deadline() == 1.0
+
+    clock.now = 0.5
+    assert lock_manager.expire_lock_timeouts() == []
+    assert waiter.state == "blocked"
+
+    clock.now = lock_manager.next_lock_deadline()
+    assert lock_manager.expire_lock_timeouts() == [waiter]
+    assert waiter.state == "aborted"
+    assert not waiter.locks_held
+    assert lock_manager.next_lock_deadline() is None
+
+    holder.create_operation(None, OperationType.COMMIT)
+    assert holder.state == "committed"
+
+
+def test_timeout_fail_action_drops_only_the_waiting_operation(capsys):
+    granularity_graph, _, (tuple_node, other_node) = build_graph()
+    clock = FakeClock()
+    lock_manager = LockManager(
+        granularity_graph, Graph(), lock_timeout=1.0, timeout_action="fail", clock=clock
+    )
+    holder = Transaction(lock_manager, lock_manager.await_graph)
+    waiter = Transaction(lock_manager, lock_manager.await_graph)
+
+    holder.create_operation(tuple_node, OperationType.WRITE)
+    waiter.create_operation(other_node, OperationType.WRITE)
+    waiter.create_operation(tuple_node, OperationType.WRITE)
+    assert waiter.state == "blocked"
+
+    clock.now = 2.0
+    assert lock_manager.expire_lock_timeouts() == [waiter]
+    assert waiter.state == "active"
+    assert [operation.node for operation in waiter.failed_operations] == [tuple_node]
+    assert other_node in waiter.locks_held
+
+    waiter.create_operation(None, OperationType.COMMIT)
+    assert waiter.state == "committed"
+
+
+def test_deadlock_victim_restarts_when_the_last_running_transaction_commits(capsys):
+    granularity_graph, _, (first_node, second_node) = build_graph()
+    clock = FakeClock()
+    lock_manager = LockManager(
+        granularity_graph,
+        Graph(),
+        clock=clock,
+        retry_policy=RetryPolicy(base_delay=1.0, jitter=0, seed=0),
+    )
+    older = Transaction(lock_manager, lock_manager.await_graph)
+    younger = Transaction(lock_manager, lock_manager.await_graph)
+
+    older.create_operation(first_node, OperationType.WRITE)
+    younger.create_operation(second_node, OperationType.WRITE)
+    older.create_operation(second_node, OperationType.WRITE)
+    younger.create_operation(first_node, OperationType.WRITE)
+    assert younger.state == "aborted"
+    assert older.state == "active"
+
+    # Its backoff has not elapsed, and the older transaction is still running
+    assert lock_manager.run_restarts_after_release() == []
+    assert younger.state == "aborted"
+
+    older.create_operation(None, OperationType.COMMIT)
+    assert older.state == "committed"
+    assert younger.state == "active"
+    assert set(younger.locks_held) >= {first_node, second_node}
+    assert lock_manager.metrics.restarts == 1
+
+    younger.create_operation(None, OperationType.COMMIT)
+    assert younger.state == "committed"
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+import pytest
+
+from modules.async_lock_manager import AsyncLockManager
+from modules.await_graph import Graph
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.lock_service import LockClient, LockService, RemoteTransaction
+from modules.operation import OperationType
+
+
+def build_lock_manager():
+    granularity_graph = GranularityGraph()
+    table_node = GranularityGraphNode("Table1")
+    granularity_graph.add_node(granularity_graph.root, table_node)
+    for index in (1, 2):
+        granularity_graph.add_node(table_node, GranularityGraphNode(f"Tuple{index}"))
+    return AsyncLockManager(granularity_graph, Graph())
+
+
+def test_connection_cannot_use_another_connections_transaction(capsys):
+    async def scenario():
+        async with LockService(build_lock_manager()) as service:
+            owner = LockClient(service.host, service.port)
+            intruder = LockClient(service.host, service.port)
+            try:
+                transaction = await owner.begin()
+                await transaction.lock("Tuple1", OperationType.WRITE)
+
+                await intruder.connect()
+                stolen = RemoteTransaction(
+                    intruder, transaction.transaction_id, intruder.generation
+                )
+                for request in (
+                    stolen.lock("Tuple2", OperationType.WRITE),
+                    stolen.commit(),
+                    stolen.abort(),
+                ):
+                    with pytest.raises(ValueError, match="another connection"):
+                        await request
+
+                assert service.transactions[transaction.transaction_id].state == "active"
+                await transaction.commit()
+            finally:
+                await owner.close()
+                await intruder.close()
+
+    asyncio.run(scenario())
+
+
+def test_unexpected_failure_is_logged_and_answered_with_error(caplog, capsys):
+    lock_manager = build_lock_manager()
+
+    async def failing_acquire(*args, **kwargs):
+        raise RuntimeError("disk on fire")
+
+    async def scenario():
+        async with LockService(lock_manager) as service:
+            client = LockClient(service.host, service.port)
+            try:
+                transaction = await client.begin()
+                lock_manager.acquire = failing_acquire
+                with pytest.raises(ValueError, match="Internal error: disk on fire"):
+                    await transaction.lock("Tuple1", OperationType.READ)
+
+                # The connection and the transaction are still usable
+                del lock_manager.acquire
+                await transaction.lock("Tuple1", OperationType.READ)
+                await transaction.commit()
+            finally:
+                await client.close()
+
+    with caplog.at_level(logging.ERROR, logger="modules.lock_service"):
+        asyncio.run(scenario())
+
+    assert any(record.exc_info for record in caplog.records)
@@ -0,0 +1,85 @@
+from modules.await_graph import Graph
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.lock_manager import LockManager
+from modules.operation import OperationType
+from modules.partitioning import PartitionedScheduleRunner, partition_schedule
+from modules.transaction import Transaction
+
+
+def build_schedule():
+    granularity_graph = GranularityGraph()
+    nodes = {}
+    for table in ("Table1", "Table2", "Table3"):
+        nodes[table] = GranularityGraphNode(table)
+        granularity_graph.add_node(granularity_graph.root, nodes[table])
+        for row in (1, 2):
+            name = f"{table}Row{row}"
+            nodes[name] = GranularityGraphNode(name)
+            granularity_graph.add_node(nodes[table], nodes[name])
+
+    schedule = [
+        ("t1", nodes["Table1Row1"], OperationType.WRITE),
+        ("t2", nodes["Table2Row1"], OperationType.WRITE),
+        ("t3", nodes["Table1"], OperationType.READ),
+        ("t4", nodes["Table3Row2"], OperationType.READ),
+        ("t2", nodes["Table2Row2"], OperationType.READ),
+        ("t5", nodes["Table2Row1"], OperationType.UPDATE),
+        ("t1", None, OperationType.COMMIT),
+        ("t4", nodes["Table3Row2"], OperationType.WRITE),
+        ("t3", None, OperationType.COMMIT),
+        ("t2", None, OperationType.COMMIT),
+        ("t4", None, OperationType.COMMIT),
+        ("t5", None, OperationType.COMMIT),
+    ]
+    return granularity_graph, schedule
+
+
+def describe(operations_order, keys):
+    described = []
+    for transaction, operation in operations_order:
+        if isinstance(operation, str):
+            described.append((keys[transaction], operation))
+        else:
+            described.append(
+                (keys[transaction], operation.operation_type, operation.node.name)
+            )
+    return described
+
+
+def run_unpartitioned(granularity_graph, schedule):
+    lock_manager = LockManager(granularity_graph, Graph())
+    transactions = {}
+    for transaction_key, node, operation_type in schedule:
+        if transaction_key not in transactions:
+            transactions[transaction_key] = Transaction(
+                lock_manager, lock_manager.await_graph
+            )
+        transactions[transaction_key].create_operation(node, operation_type)
+
+    keys = {transaction: key for key, transaction in transactions.items()}
+    return describe(lock_manager.operations_order, keys), transactions
+
+
+def test_schedule_splits_into_independent_components():
+    _, schedule = build_schedule()
+    components = partition_schedule(schedule)
+
+    transaction_sets = sorted(
+        sorted({schedule[index][0] for index in component}) for component in components
+    )
+    assert transaction_sets == [["t1", "t3"], ["t2", "t5"], ["t4"]]
+
+
+def test_merged_schedule_equals_unpartitioned_run(capsys):
+    granularity_graph, schedule = build_schedule()
+    expected, expected_transactions = run_unpartitioned(granularity_graph, schedule)
+
+    granularity_graph, schedule = build_schedule()
+    runner = PartitionedScheduleRunner(granularity_graph)
+    merged = runner.run(schedule)
+    keys = {transaction: key for key, transaction in runner.transactions.items()}
+
+    assert describe(merged, keys) == expected
+    assert len(runner.lock_managers) == 3
+    for key, transaction in runner.transactions.items():
+        assert transaction.state == expected_transactions[key].state == "committed"
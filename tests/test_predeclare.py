@@ -0,0 +1,72 @@
+import pytest
+
+from modules.await_graph import Graph
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.lock import LockType
+from modules.lock_manager import LockManager
+from modules.operation import OperationType
+from modules.transaction import Transaction
+
+
+def build_graph():
+    granularity_graph = GranularityGraph()
+    tables, tuples = [], []
+    for table_number in (1, 2):
+        tables.append(GranularityGraphNode(f"Table{table_number}"))
+        granularity_graph.add_node(granularity_graph.root, tables[-1])
+        for number in (1, 2):
+            tuples.append(GranularityGraphNode(f"Tuple{table_number}{number}"))
+            granularity_graph.add_node(tables[-1], tuples[-1])
+    lock_manager = LockManager(granularity_graph, Graph(), verbose=False)
+    return lock_manager, tables, tuples
+
+
+def test_lock_set_is_acquired_top_down_with_the_strongest_lock_per_node():
+    lock_manager, tables, tuples = build_graph()
+    transaction = Transaction(lock_manager, lock_manager.await_graph)
+
+    assert transaction.predeclare(
+        [
+            (tuples[3], OperationType.READ),
+            (tuples[0], OperationType.READ),  # Covered by the write on Table1
+            (tables[0], OperationType.READ),
+            (tables[0], OperationType.WRITE),
+            (tuples[2], OperationType.READ),
+        ]
+    )
+    assert transaction.declared_locks == [
+        (tables[0], LockType.WL),
+        (tuples[2], LockType.RL),
+        (tuples[3], LockType.RL),
+    ]
+
+    transaction.create_operation(tuples[1], OperationType.WRITE)
+    with pytest.raises(ValueError, match="did not declare"):
+        transaction.create_operation(tuples[2], OperationType.WRITE)
+
+
+def test_waiting_lock_sets_are_granted_in_arrival_order():
+    lock_manager, tables, tuples = build_graph()
+    holder = Transaction(lock_manager, lock_manager.await_graph)
+    first = Transaction(lock_manager, lock_manager.await_graph)
+    second = Transaction(lock_manager, lock_manager.await_graph)
+
+    assert holder.predeclare([(tuples[0], OperationType.WRITE)])
+    # Opposite orders, so locking one node at a time could deadlock
+    assert not first.predeclare(
+        [(tuples[0], OperationType.WRITE), (tuples[2], OperationType.WRITE)]
+    )
+    assert not second.predeclare(
+        [(tuples[2], OperationType.WRITE), (tuples[0], OperationType.WRITE)]
+    )
+    assert not first.locks_held and not second.locks_held  # All or nothing
+    assert lock_manager.lock_set_waiters == [first, second]
+    assert not lock_manager.await_graph.vertices[first.transaction_id]["edges"]
+
+    holder.create_operation(None, OperationType.COMMIT)
+    assert first.state == "active" and second.state == "blocked"
+
+    first.create_operation(None, OperationType.COMMIT)
+    assert second.state == "active"
+    second.create_operation(None, OperationType.COMMIT)
+    assert lock_manager.metrics.deadlocks == 0
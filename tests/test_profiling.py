@@ -0,0 +1,87 @@
+import threading
+
+from modules.await_graph import Graph
+from modules.concurrent_lock_manager import ThreadSafeLockManager
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.lock import LockType
+from modules.lock_manager import LockManager
+from modules.operation import OperationType
+from modules.profiling import PhaseProfiler
+from modules.transaction import Transaction
+
+
+def build_graph(tuples=2):
+    granularity_graph = GranularityGraph()
+    table = GranularityGraphNode("Table1")
+    granularity_graph.add_node(granularity_graph.root, table)
+    nodes = []
+    for number in range(tuples):
+        nodes.append(GranularityGraphNode(f"Tuple{number}"))
+        granularity_graph.add_node(table, nodes[-1])
+    return granularity_graph, table, nodes
+
+
+def test_only_the_profiled_manager_is_measured(capsys):
+    granularity_graph, table, (tuple_node, _) = build_graph()
+    profiled = LockManager(granularity_graph, Graph())
+    other = LockManager(granularity_graph, Graph())
+    profiler = PhaseProfiler().enable(profiled)
+
+    transaction = Transaction(other, other.await_graph)
+    transaction.create_operation(table, OperationType.READ)
+    transaction.create_operation(None, OperationType.COMMIT)
+    assert all(histogram.count == 0 for histogram in profiler.histograms.values())
+
+    transaction = Transaction(profiled, profiled.await_graph)
+    transaction.create_operation(table, OperationType.READ)
+    transaction.create_operation(None, OperationType.COMMIT)
+    profiler.disable()
+
+    histograms = profiler.histograms
+    assert histograms["compatibility_check"].count == 1
+    assert histograms["intention_backpropagation"].count == 1
+    assert histograms["front_propagation"].count == 1
+    assert histograms["release"].count >= 1
+    assert "_get_blocking_transaction" not in vars(profiled)
+
+
+def test_promotion_compatibility_checks_are_timed(capsys):
+    granularity_graph, _, (tuple_node, _) = build_graph()
+    lock_manager = LockManager(granularity_graph, Graph())
+    holder = Transaction(lock_manager, lock_manager.await_graph)
+    reader = Transaction(lock_manager, lock_manager.await_graph)
+    holder.create_operation(tuple_node, OperationType.READ)
+    reader.create_operation(tuple_node, OperationType.READ)
+
+    profiler = PhaseProfiler().enable(lock_manager)
+    assert lock_manager.promote_lock(holder, tuple_node, LockType.UL)
+    assert not lock_manager.promote_lock(reader, tuple_node, LockType.UL)
+    profiler.disable()
+
+    assert profiler.histograms["compatibility_check"].count == 2
+    assert profiler.histograms["intention_backpropagation"].count >= 1
+
+
+def test_threaded_manager_phases_from_several_threads(capsys):
+    granularity_graph, _, nodes = build_graph(tuples=4)
+    lock_manager = ThreadSafeLockManager(granularity_graph, Graph())
+    profiler = PhaseProfiler().enable(lock_manager)
+
+    def worker(node):
+        for _ in range(50):
+            transaction = lock_manager.begin()
+            lock_manager.acquire(transaction, node, OperationType.WRITE)
+            lock_manager.commit(transaction)
+
+    threads = [threading.Thread(target=worker, args=(node,)) for node in nodes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profiler.disable()
+
+    histograms = profiler.histograms
+    assert histograms["release"].count == 200
+    assert histograms["compatibility_check"].count == 400  # The write, then its certification
+    assert histograms["intention_backpropagation"].count >= 400
+    assert histograms["front_propagation"].count == 0  # Descendants get no copy
@@ -0,0 +1,94 @@
+from modules.await_graph import Graph
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.lock_manager import LockManager
+from modules.operation import OperationType
+from modules.transaction import Transaction
+
+
+def build_table(keys_per_page=((0, 10, 20, 30), (40, 50, 60, 70))):
+    granularity_graph = GranularityGraph()
+    table = GranularityGraphNode("Table")
+    granularity_graph.add_node(granularity_graph.root, table)
+    pages, tuples = [], {}
+    for number, keys in enumerate(keys_per_page):
+        page = GranularityGraphNode(f"Page{number}")
+        granularity_graph.add_node(table, page)
+        pages.append(page)
+        for key in keys:
+            tuples[key] = GranularityGraphNode(f"K{key}", key=key)
+            granularity_graph.add_node(page, tuples[key])
+
+    lock_manager = LockManager(granularity_graph, Graph())
+    return granularity_graph, lock_manager, table, pages, tuples
+
+
+def test_write_inside_scanned_range_waits_for_the_scan(capsys):
+    _, lock_manager, table, _, tuples = build_table()
+    reader = Transaction(lock_manager, lock_manager.await_graph)
+    writer = Transaction(lock_manager, lock_manager.await_graph)
+
+    reader.create_operation(table, OperationType.READ, key_range=(0, 25))
+    writer.create_operation(tuples[10], OperationType.WRITE)
+    writer.create_operation(table, OperationType.COMMIT)
+    assert writer.state == "blocked"
+
+    reader.create_operation(table, OperationType.COMMIT)
+    assert reader.state == "committed"
+    assert writer.state == "committed"
+
+
+def test_write_outside_scanned_range_does_not_wait(capsys):
+    _, lock_manager, table, _, tuples = build_table()
+    reader = Transaction(lock_manager, lock_manager.await_graph)
+    writer = Transaction(lock_manager, lock_manager.await_graph)
+
+    reader.create_operation(table, OperationType.READ, key_range=(0, 25))
+    writer.create_operation(tuples[30], OperationType.WRITE)
+    writer.create_operation(table, OperationType.COMMIT)
+    assert writer.state == "committed"
+
+
+def test_overlapping_write_ranges_conflict(capsys):
+    _, lock_manager, table, pages, _ = build_table()
+    first = Transaction(lock_manager, lock_manager.await_graph)
+    second = Transaction(lock_manager, lock_manager.await_graph)
+    third = Transaction(lock_manager, lock_manager.await_graph)
+
+    first.create_operation(table, OperationType.WRITE, key_range=(0, 25))
+    second.create_operation(table, OperationType.WRITE, key_range=(20, 45))
+    third.create_operation(pages[1], OperationType.WRITE, key_range=(45, 80))
+    assert second.state == "blocked"
+    assert third.state == "active"
+
+
+def test_insert_into_scanned_range_waits_for_the_scan(capsys):
+    granularity_graph, lock_manager, table, pages, _ = build_table()
+    reader = Transaction(lock_manager, lock_manager.await_graph)
+    writer = Transaction(lock_manager, lock_manager.await_graph)
+
+    reader.create_operation(table, OperationType.READ, key_range=(0, 25))
+
+    # A phantom: a tuple inserted into the scanned range after the scan started
+    phantom = GranularityGraphNode("K15", key=15)
+    granularity_graph.add_node(pages[0], phantom)
+    writer.create_operation(phantom, OperationType.WRITE)
+    writer.create_operation(table, OperationType.COMMIT)
+    assert writer.state == "blocked"
+
+    reader.create_operation(table, OperationType.COMMIT)
+    assert writer.state == "committed"
+
+
+def test_page_lock_covers_keys_added_to_the_page(capsys):
+    granularity_graph, lock_manager, table, pages, _ = build_table()
+    lock_manager.add_range_index(table)
+    updater = Transaction(lock_manager, lock_manager.await_graph)
+    reader = Transaction(lock_manager, lock_manager.await_graph)
+
+    # The page lock is indexed with the page's keys, [0, 30] here
+    updater.create_operation(pages[0], OperationType.UPDATE)
+    granularity_graph.add_node(pages[0], GranularityGraphNode("K35", key=35))
+    assert lock_manager.range_indexes[table].spans[pages[0]] == (0, 35)
+
+    reader.create_operation(table, OperationType.READ, key_range=(32, 38))
+    assert reader.state == "blocked"
@@ -0,0 +1,114 @@
+from modules.await_graph import Graph
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.lock_manager import LockManager
+from modules.operation import OperationType
+from modules.serializability import SerializabilityVerifier, verify_schedule
+from modules.transaction import Transaction
+
+
+def build_table(rows):
+    granularity_graph = GranularityGraph()
+    table = GranularityGraphNode("Table1")
+    granularity_graph.add_node(granularity_graph.root, table)
+    tuples = []
+    for number in range(rows):
+        tuples.append(GranularityGraphNode(f"Tuple{number}"))
+        granularity_graph.add_node(table, tuples[-1])
+    return granularity_graph, table, tuples
+
+
+class CountingVerifier(SerializabilityVerifier):
+    def __init__(self):
+        super().__init__()
+        self.candidates = 0
+
+    def _add_edge(self, earlier, operation):
+        self.candidates += 1
+        super()._add_edge(earlier, operation)
+
+
+def test_accepts_the_schedule_of_the_lock_manager(capsys):
+    granularity_graph, table, tuples = build_table(2)
+    lock_manager = LockManager(granularity_graph, Graph())
+    writer = Transaction(lock_manager, lock_manager.await_graph)
+    reader = Transaction(lock_manager, lock_manager.await_graph)
+
+    writer.create_operation(tuples[0], OperationType.WRITE)
+    reader.create_operation(table, OperationType.READ)
+    writer.create_operation(tuples[1], OperationType.WRITE)
+    reader.create_operation(None, OperationType.COMMIT)
+    writer.create_operation(None, OperationType.COMMIT)
+
+    assert writer.state == reader.state == "committed"
+    assert verify_schedule(lock_manager.operations_order) is None
+
+
+def test_rejects_a_write_skew_through_the_hierarchy():
+    _, table, tuples = build_table(1)
+    verifier = SerializabilityVerifier()
+    verifier.feed(1, OperationType.READ, table)
+    verifier.feed(2, OperationType.READ, tuples[0])
+    verifier.feed(2, OperationType.WRITE, tuples[0])
+    verifier.feed(1, OperationType.WRITE, table)
+    verifier.commit(2)
+    verifier.commit(1)
+
+    cycle = verifier.find_cycle()
+    assert cycle is not None
+    assert {(source, destination) for source, destination, _, _ in cycle} == {(1, 2), (2, 1)}
+
+
+def run_row_writers(transactions, rows=10, rows_per_writer=3, in_flight=5, pinned=False):
+    """
+    Every transaction writes a few rows of one table and commits once `in_flight` later
+    transactions have started. Every tenth one is preceded by a read-only transaction
+    scanning the whole table; with `pinned` a transaction that never commits scans it
+    first instead, so all the writers keep a running predecessor.
+    """
+
+    _, table, tuples = build_table(rows)
+    verifier = CountingVerifier()
+    if pinned:
+        verifier.feed(-1, OperationType.READ, table)
+
+    for transaction_id in range(transactions):
+        if transaction_id % 10 == 0 and not pinned:
+            scanner_id = transactions + transaction_id
+            verifier.feed(scanner_id, OperationType.READ, table)
+            verifier.commit(scanner_id)
+        for offset in range(rows_per_writer):
+            row = tuples[(transaction_id + offset) % rows]
+            verifier.feed(transaction_id, OperationType.WRITE, row)
+        if transaction_id >= in_flight:
+            verifier.commit(transaction_id - in_flight)
+    for transaction_id in range(max(0, transactions - in_flight), transactions):
+        verifier.commit(transaction_id)
+
+    assert verifier.find_cycle() is None
+    return verifier, table
+
+
+def test_superseded_writers_leave_the_subtree_summaries():
+    verifier, table = run_row_writers(2000, pinned=True)
+
+    assert len(verifier.edges[-1]) == 2000  # Nothing can be forgotten behind the scan
+    assert len(verifier.subtree_writers[table]) <= 10
+    assert len(verifier.subtree_writers[table.parent]) <= 10
+
+
+def test_committed_transactions_without_predecessors_are_forgotten():
+    verifier, table = run_row_writers(2000)
+
+    assert not verifier.edges
+    assert not verifier.readers.get(table)
+    assert not verifier.subtree_writers.get(table)
+
+
+def test_verification_work_grows_linearly():
+    small, _ = run_row_writers(1000)
+    large, _ = run_row_writers(4000)
+    assert large.candidates <= 4.5 * small.candidates
+
+    small, _ = run_row_writers(1000, pinned=True)
+    large, _ = run_row_writers(4000, pinned=True)
+    assert large.candidates <= 4.5 * small.candidates
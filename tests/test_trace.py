@@ -0,0 +1,60 @@
+from modules.await_graph import Graph
+from modules.lock_manager import LockManager
+from modules.retry import RetryPolicy
+from modules.trace import (
+    TraceRecorder,
+    TraceReplayer,
+    compare_with_baseline,
+    encode_schedule,
+)
+from modules.transaction import Transaction
+from modules.workload import WorkloadGenerator
+
+
+def record(path):
+    generator = WorkloadGenerator(transactions=60, zipf_skew=1.0, depth=3, fan_out=3, seed=3)
+    with TraceRecorder(str(path)) as recorder:
+        lock_manager = LockManager(
+            generator.granularity_graph,
+            Graph(),
+            retry_policy=RetryPolicy(max_retries=2, base_delay=0, seed=0),
+            trace=recorder,
+            verbose=False,
+        )
+        transactions = {}
+        for transaction_index, node, operation_type in generator.generate():
+            if transaction_index not in transactions:
+                transactions[transaction_index] = Transaction(
+                    lock_manager, lock_manager.await_graph
+                )
+            transactions[transaction_index].create_operation(node, operation_type)
+    return lock_manager
+
+
+def test_replay_reproduces_the_recorded_schedule_silently(tmp_path, capsys):
+    lock_manager = record(tmp_path / "run.trace")
+    assert lock_manager.metrics.deadlocks > 0
+    assert capsys.readouterr().out == ""
+
+    result = TraceReplayer(str(tmp_path / "run.trace")).run()
+
+    assert result["divergence"] is None
+    assert result["error"] is None
+    assert result["operations_order"] == encode_schedule(lock_manager.operations_order)
+    assert compare_with_baseline(result, dict(result, elapsed=float("inf"))) == []
+    assert capsys.readouterr().out == ""
+
+
+def test_replay_crash_is_reported_in_the_result(tmp_path, monkeypatch):
+    record(tmp_path / "run.trace")
+
+    def broken_release(self, transaction):
+        raise RuntimeError("release failed")
+
+    monkeypatch.setattr(LockManager, "release_all_locks", broken_release)
+    result = TraceReplayer(str(tmp_path / "run.trace")).run()
+
+    assert result["error"]["message"] == "RuntimeError: release failed"
+    assert "broken_release" in result["error"]["traceback"]
+    differences = compare_with_baseline(result, dict(result, elapsed=float("inf")))
+    assert differences[0].startswith(f"Replay failed at record {result['error']['position']}")
@@ -0,0 +1,83 @@
+import os
+
+from modules.await_graph import Graph
+from modules.granularity_graph import GranularityGraph, GranularityGraphNode
+from modules.lock import LockType
+from modules.lock_manager import LockManager
+from modules.operation import OperationType
+from modules.transaction import Transaction
+from modules.wal import WriteAheadLog
+
+
+def build_graph():
+    granularity_graph = GranularityGraph()
+    table = GranularityGraphNode("Table1")
+    granularity_graph.add_node(granularity_graph.root, table)
+    tuples = []
+    for number in range(1, 4):
+        tuples.append(GranularityGraphNode(f"Tuple{number}"))
+        granularity_graph.add_node(table, tuples[-1])
+    return granularity_graph, tuples
+
+
+def crash(path):
+    """
+    Commits one transaction before a checkpoint and one after it, then certifies one and
+    leaves one running when the process "crashes" in the middle of a record.
+    """
+
+    granularity_graph, tuples = build_graph()
+    wal = WriteAheadLog(path, log_grants=True)
+    lock_manager = LockManager(granularity_graph, Graph(), wal=wal, verbose=False)
+    transactions = [Transaction(lock_manager, lock_manager.await_graph) for _ in range(4)]
+
+    transactions[0].create_operation(tuples[0], OperationType.WRITE)
+    transactions[0].create_operation(None, OperationType.COMMIT)
+    transactions[1].create_operation(tuples[1], OperationType.WRITE)
+    transactions[2].create_operation(tuples[2], OperationType.READ)
+    wal.checkpoint(lock_manager)
+
+    transactions[3].create_operation(tuples[0], OperationType.WRITE)
+    transactions[3].create_operation(None, OperationType.COMMIT)
+    transactions[1].convert_write_locks_to_cl()
+    wal.close()
+
+    size = os.path.getsize(path)
+    with open(path, "ab") as log_file:
+        log_file.write(b"\x00\x01torn")
+    return [transaction.transaction_id for transaction in transactions], size
+
+
+def test_recovery_sorts_transactions_and_cuts_the_torn_tail(tmp_path):
+    path = str(tmp_path / "locks.wal")
+    (first, certified, running, last), size = crash(path)
+
+    with WriteAheadLog(path) as wal:
+        state = wal.recover()
+        assert os.path.getsize(path) == size
+
+    assert state["committed"] == {last}  # The first one committed before the checkpoint
+    assert state["lost"] == {running}
+    assert state["in_doubt"] == {certified: [("Tuple2", LockType.CL)]}
+    assert Transaction.transaction_counter > last  # Ids in the log are not reused
+
+
+def test_in_doubt_transaction_keeps_its_locks_until_it_is_decided(tmp_path):
+    path = str(tmp_path / "locks.wal")
+    (_, certified, _, _), _ = crash(path)
+
+    granularity_graph, tuples = build_graph()
+    lock_manager = LockManager(granularity_graph, Graph(), verbose=False)
+    with WriteAheadLog(path) as wal:
+        in_doubt = wal.recover(lock_manager)["in_doubt"]
+
+    restored = in_doubt[certified]
+    assert restored.locks_held == {tuples[1]: LockType.CL}
+    reader = Transaction(lock_manager, lock_manager.await_graph)
+    reader.create_operation(tuples[1], OperationType.READ)
+    assert reader.state == "blocked"
+
+    restored.create_operation(None, OperationType.COMMIT)
+    assert restored.state == "committed"
+    assert reader.state == "active"
+    assert tuples[1] in reader.locks_held